@@ -0,0 +1,137 @@
+import argparse
+import collections
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+import engine
+import quote_export
+import tax_rates
+
+# Quote definitions use the same keys as the wizard's session state: `lines`,
+# the step 3 account options and the step 5 inputs (biz_name, rep_name,
+# tax_rate, dev_retail, su_smart, ..., act_cnt, bill_cred). A quote with a zip
+# and no tax_rate takes the rate from the local tax table (tax_rates.py).
+#
+# JSON Lines: one quote object per line.
+# CSV: one row per line; rows of a quote are contiguous and share a quote_id,
+# quote-level columns are read from the first row, list columns use ";".
+# A quote or line that can't be parsed is reported in the manifest like a
+# failed render; the rest of the file is still rendered.
+LIST_COLS = {"features", "sp_features"}
+BOOL_COLS = {"autopay", "military", "joint_offer", "whole_office", "intro_disc", "byod", "port_in"}
+FLOAT_COLS = {"dev_pay", "custom_promo_val", "tax_rate", "dev_retail", "bill_cred"}
+INT_COLS = set(engine.SETUP_PRICES) | set(engine.BUNDLE_PRICES) | set(engine.ACCESSORY_PRICES) | {"act_cnt"}
+LINE_COLS = set(engine.new_line()) | {"custom_promo_val"}
+Unreadable = collections.namedtuple("Unreadable", "quote_id error") # stands in for a quote that failed to parse
+
+
+def _csv_value(col, raw):
+    if col in LIST_COLS: return [v.strip() for v in raw.split(";") if v.strip()]
+    if col in BOOL_COLS: return raw.strip().lower() in ("1", "true", "yes", "y")
+    try:
+        if col in FLOAT_COLS: return float(raw)
+        if col in INT_COLS: return int(raw)
+    except ValueError: raise ValueError(f"{col}: expected a number, got {raw!r}") from None
+    return raw
+
+
+def read_csv(path):
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        for quote_id, rows in groupby(reader, key=lambda r: r["quote_id"]):
+            quote = {"quote_id": quote_id, "lines": []}
+            try:
+                for i, row in enumerate(rows):
+                    vals = {c: _csv_value(c, v) for c, v in row.items() if c != "quote_id" and v not in (None, "")}
+                    line = engine.new_line()
+                    line.update({c: v for c, v in vals.items() if c in LINE_COLS})
+                    quote["lines"].append(line)
+                    if i == 0: quote.update({c: v for c, v in vals.items() if c not in LINE_COLS})
+            except ValueError as e:
+                yield Unreadable(quote_id, f"line {reader.line_num}: {e}") # groupby skips the quote's remaining rows
+                continue
+            yield quote
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        for n, raw in enumerate(f, 1):
+            if not raw.strip(): continue
+            try: quote = json.loads(raw)
+            except json.JSONDecodeError as e:
+                yield Unreadable(None, f"line {n}: invalid JSON: {e}")
+                continue
+            yield quote if isinstance(quote, dict) else Unreadable(None, f"line {n}: expected a JSON object")
+
+
+def read_quotes(path):
+    return read_csv(path) if path.lower().endswith(".csv") else read_jsonl(path)
+
+
+def render_quote(job):
+    seq, quote, out_dir, fmt = job
+    if isinstance(quote, Unreadable): return {"quote_id": seq if quote.quote_id in (None, "") else quote.quote_id, "error": quote.error}
+    name = re.sub(r"[^\w.-]+", "_", str(quote.get("quote_id", seq))) + "." + fmt
+    entry = {"quote_id": quote.get("quote_id", seq), "file": name}
+    start = time.perf_counter()
+    try:
+        quote["lines"] = [{**engine.new_line(), **l} for l in quote.get("lines", [])]
+        tax_rates.fill_tax_rate(quote)
+        model = quote_export.from_quote(quote)
+        with open(os.path.join(out_dir, name), "wb") as f:
+            if fmt == "pdf":
+                from pdf_quote import write_pro_pdf
+                pages, size = write_pro_pdf(f, model)
+                entry["pages"] = pages
+            else:
+                size = f.write(quote_export.export(model, fmt))
+        entry["bytes"] = size
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["render_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return entry
+
+
+def _bounded_map(pool, fn, items, window):
+    # Keeps at most `window` quotes in flight so input is streamed, not loaded.
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window: yield pending.popleft().result()
+    while pending: yield pending.popleft().result()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Render one quote file (PDF, CSV, HTML or XLSX) per quote definition.")
+    ap.add_argument("input", help="quote definitions (.jsonl or .csv)")
+    ap.add_argument("-o", "--out-dir", default="quotes_out")
+    ap.add_argument("-f", "--format", choices=list(quote_export.FORMATS), default="pdf")
+    ap.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    args = ap.parse_args(argv)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    jobs = ((i, q, args.out_dir, args.format) for i, q in enumerate(read_quotes(args.input), 1))
+    done = failed = total_bytes = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, open(os.path.join(args.out_dir, "manifest.jsonl"), "w") as manifest:
+        for entry in _bounded_map(pool, render_quote, jobs, args.workers * 4):
+            manifest.write(json.dumps(entry) + "\n")
+            if "error" in entry:
+                failed += 1
+                print(f"{entry.get('file', entry['quote_id'])}: {entry['error']}", file=sys.stderr)
+            else:
+                done += 1
+                total_bytes += entry["bytes"]
+    elapsed = time.perf_counter() - start
+    print(f"{done} rendered, {failed} failed, {total_bytes:,} bytes in {elapsed:.2f}s ({done / elapsed if elapsed else 0:.1f} quotes/s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
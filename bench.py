@@ -0,0 +1,359 @@
+import argparse
+import datetime
+import fnmatch
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import catalogs
+import engine
+import line_model
+from catalogs import get_catalog
+import pdf_quote
+import quote_export
+import tax_rates
+from pdf_quote import create_pro_pdf
+
+# Reproducible benchmarks for the pricing engine and the PDF renderer.
+#
+#   python bench.py                          # run everything, write bench_results.json
+#   python bench.py --quick -k 'totals/*'    # subset, fewer line counts
+#   python bench.py --save-baseline          # also store the results as the baseline
+#   python bench.py --baseline bench_baseline.json --threshold 0.15
+#   python bench.py --memory                 # what one session holds for a 1,000-line quote
+#   python bench.py --startup                # cold import, first render and first PDF times
+#   python bench.py --pdf-size               # PDF file size and render memory at 10/100/1,000 lines
+#
+# With a baseline, any case whose p50 latency grew by more than the threshold
+# is reported and the exit status is 1.
+LINE_COUNTS = (1, 10, 100, 1000)
+QUICK_LINE_COUNTS = (1, 10, 100)
+DENSITIES = ("bare", "loaded")
+PROMO_MIXES = ("none", "catalog", "custom")
+DEFAULT_BASELINE = "bench_baseline.json"
+HISTORY_YEARS = 5
+TAX_ROWS = 40000
+
+
+# --- SYNTHETIC QUOTES ---
+def synthetic_line(rng, cat, density, promo_mix):
+    dtype = rng.choices(["Smartphone", "Internet", "Tablet", "Watch", "Other"], weights=[70, 10, 10, 5, 5])[0]
+    plan = rng.choice(cat.plans_by_type[dtype])
+    line = engine.new_line()
+    line.update(type=dtype, plan=plan, byod=rng.random() < 0.3, port_in=rng.random() < 0.4)
+    if density == "loaded":
+        if plan == "My Biz": line['features'] = rng.sample(list(cat.addons), rng.randint(1, 4))
+        if dtype == "Smartphone": line['sp_features'] = rng.sample([f for f in cat.smartphone_features if plan != "My Biz" or f != "VBMIS (Paid)"], rng.randint(1, 3))
+        if dtype == "Internet": line['vbis'] = rng.choice(list(cat.vbis_prot))
+        else: line['protection'] = rng.choice(list(cat.single_prot))
+        line['dev_pay'] = round(rng.uniform(10, 45), 2)
+        line['intro_disc'] = plan == "My Biz" and rng.random() < 0.3
+    if promo_mix == "catalog":
+        tier = engine.price_line(line, 0, engine.ACCOUNT_DEFAULTS, cat)['tier']
+        eligible = cat.eligible_promos(tier, line['byod'], line['port_in'])
+        if eligible: line['promo_selection'] = rng.choice(eligible)['name']
+    elif promo_mix == "custom":
+        line.update(promo_selection="Custom", custom_promo_val=float(rng.choice([240, 360, 540, 800])),
+                    custom_promo_term=rng.choice(["36 Months", "24 Months", "12 Months", "One-Time"]))
+    return line
+
+
+def synthetic_quote(n_lines, density="loaded", promo_mix="catalog", seed=0, cat=None):
+    cat = cat or get_catalog()
+    rng = random.Random(f"{seed}-{n_lines}-{density}-{promo_mix}")
+    quote = dict(engine.ACCOUNT_DEFAULTS, lines=[synthetic_line(rng, cat, density, promo_mix) for _ in range(n_lines)])
+    quote.update(autopay=True, military=rng.random() < 0.2, whole_office=rng.random() < 0.5,
+                 biz_name="Benchmark Co", rep_name="Bench Rep", dev_retail=999.0 * n_lines, su_smart=n_lines, act_cnt=n_lines)
+    return quote
+
+
+def synthetic_history(years=HISTORY_YEARS, seed=0):
+    # The catalog file with `years` of promo history: every promo re-issued
+    # back to back in runs of 2-8 weeks at varying values, plus a My Biz price
+    # change each quarter.
+    rng = random.Random(seed)
+    with open(catalogs.CATALOG_PATH, "rb") as f: data = json.load(f)
+    first = datetime.date.today() - datetime.timedelta(days=365 * years)
+    for tier, promos in data["promos"].items():
+        history = []
+        for p in promos:
+            day = first + datetime.timedelta(days=rng.randint(0, 30))
+            while day < first + datetime.timedelta(days=365 * years):
+                end = day + datetime.timedelta(days=rng.randint(14, 56))
+                history.append(dict(p, value=round(p["value"] * rng.uniform(0.8, 1.2), 2), start=day.isoformat(), end=end.isoformat()))
+                day = end + datetime.timedelta(days=1)
+        data["promos"][tier] = history
+    prices = data["smartphone_tiers"]["My Biz"]["prices"]
+    data["price_changes"] = [{"table": "smartphone_tiers", "name": "My Biz", "prices": [p + q % 3 for p in prices],
+                              "start": (first + datetime.timedelta(days=91 * q)).isoformat(), "end": (first + datetime.timedelta(days=91 * q + 90)).isoformat()}
+                             for q in range(4 * years)]
+    return catalogs.compile_catalog(json.dumps(data).encode())
+
+
+# --- CASES ---
+def _render(quote):
+    return create_pro_pdf(quote_export.from_quote(quote))
+
+
+def build_cases(line_counts):
+    cases = {}
+    for n in line_counts:
+        for density in DENSITIES:
+            for mix in PROMO_MIXES:
+                q = synthetic_quote(n, density, mix)
+                cases[f"totals/{n}/{density}/{mix}"] = lambda q=q: engine.get_totals(q)
+        batch = [synthetic_quote(n, "loaded", "catalog", seed=s) for s in range(max(1, 1000 // n))]
+        cases[f"price_batch/{n}x{len(batch)}"] = lambda b=batch: engine.price_batch(b)
+        for density in DENSITIES:
+            q = synthetic_quote(n, density, "catalog")
+            cases[f"pdf/{n}/{density}"] = lambda q=q: _render(q)
+        q = synthetic_quote(n, "loaded", "catalog")
+        model = quote_export.from_quote(q)
+        cases[f"export/{n}/model"] = lambda q=q: quote_export.from_quote(q)
+        for fmt in quote_export.FORMATS:
+            cases[f"export/{n}/{fmt}"] = lambda m=model, fmt=fmt: quote_export.export(m, fmt)
+
+    # Promo lookups by date: within the compiled-interval cache, and spread
+    # over the whole history so most lookups compile their interval.
+    history = synthetic_history()
+    span = (datetime.date.today() - datetime.timedelta(days=365 * HISTORY_YEARS)).toordinal(), datetime.date.today().toordinal()
+    recent = [datetime.date.fromordinal(span[1] - d) for d in range(0, 60, 2)]
+    spread = [datetime.date.fromordinal(d) for d in range(span[0], span[1], 7)]
+    lookup = lambda dates: [history.as_of(d).promo_choices("Pro", False, True) for d in dates]
+    cases[f"catalog/as_of/{HISTORY_YEARS}y/recent"] = lambda: lookup(recent)
+    cases[f"catalog/as_of/{HISTORY_YEARS}y/spread"] = lambda: lookup(spread)
+
+    # ZIP lookups against a memory-mapped table of synthetic (not real) rates.
+    rng = random.Random(0)
+    tax_path = os.path.join(tempfile.mkdtemp(prefix="bench_tax"), "tax_rates.bin")
+    tax_rates.build(((z, round(rng.uniform(0, 10.5), 3), "") for z in rng.sample(range(100000), TAX_ROWS)), tax_path)
+    table = tax_rates.TaxTable(tax_path)
+    zips = [f"{rng.randrange(100000):05d}" for _ in range(1000)]
+    cases["tax/rate/1000"] = lambda: [table.rate(z) for z in zips]
+    return cases
+
+
+# --- MEASUREMENT ---
+def _percentile(sorted_vals, pct):
+    return sorted_vals[min(len(sorted_vals) - 1, int(round(pct / 100 * (len(sorted_vals) - 1))))]
+
+
+def measure(fn, min_time=0.5, min_reps=5, max_reps=10000):
+    fn() # warm-up
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < min_reps or (time.perf_counter() - start < min_time and len(samples) < max_reps):
+        t = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - t)
+    samples.sort()
+    # Peak memory is taken from a separate traced call so tracing doesn't skew timings.
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    total = sum(samples) / 1e9
+    return {
+        "reps": len(samples), "ops_per_sec": len(samples) / total if total else 0.0,
+        "p50_ms": _percentile(samples, 50) / 1e6, "p99_ms": _percentile(samples, 99) / 1e6,
+        "peak_kb": peak / 1024,
+    }
+
+
+def _retained(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+
+def _primed_cache(lines, cat):
+    cache = engine.TotalsCache()
+    cache.get_totals({"lines": lines}, cat)
+    return cache
+
+
+def session_memory(n_lines=1000):
+    # Bytes a session keeps alive for an n-line quote: its lines, stored as the
+    # old plain dicts and as Line records, plus the totals cache priced from them.
+    cat = get_catalog()
+    blob = json.dumps([dict(l) for l in synthetic_quote(n_lines, "loaded", "catalog", seed=1)['lines']])
+    line_model.compact(json.loads(blob)) # registers feature names outside the measurement
+    out = {}
+    for kind, load in (("dict", lambda: json.loads(blob)), ("line", lambda: line_model.compact(json.loads(blob)))):
+        lines, lines_bytes = _retained(load)
+        cache, cache_bytes = _retained(lambda: _primed_cache(lines, cat))
+        out[kind] = {"lines_kb": lines_bytes / 1024, "totals_cache_kb": cache_bytes / 1024, "total_kb": (lines_bytes + cache_bytes) / 1024}
+        del lines, cache
+    return out
+
+
+# --- STARTUP PROFILE ---
+# Runs in a fresh interpreter (so nothing is imported yet) from this directory.
+# It must not import bench, which loads the engine and the PDF renderer itself.
+HEAVY_MODULES = ("numpy", "pandas", "pyarrow", "fpdf")
+_STARTUP_PROBE = """
+import ast, json, sys, time
+def ms(t): return round((time.perf_counter() - t) * 1000, 1)
+def heavy(): return [m for m in HEAVY if m in sys.modules]
+HEAVY = %r
+out, t = {"imports": {}}, time.perf_counter()
+import streamlit
+out["streamlit"] = ms(t)
+for node in ast.parse(open("app.py").read()).body:
+    for alias in node.names if isinstance(node, ast.Import) else ():
+        t = time.perf_counter(); __import__(alias.name); out["imports"][alias.name] = ms(t)
+out["app_imports"] = round(sum(out["imports"].values()), 1)
+out["heavy_after_import"] = heavy()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+t = time.perf_counter(); at.run(); out["first_render"] = ms(t)
+t = time.perf_counter(); at.run(); out["rerun"] = ms(t)
+out["heavy_after_render"] = heavy()
+import engine
+quote = dict(engine.ACCOUNT_DEFAULTS, lines=[engine.new_line()], dev_retail=999.0, act_cnt=1)
+t = time.perf_counter()
+import quote_export
+from pdf_quote import create_pro_pdf
+create_pro_pdf(quote_export.from_quote(quote))
+out["first_pdf"] = ms(t)
+print(json.dumps(out))
+""" % (HEAVY_MODULES,)
+
+
+def startup_profile(runs=3):
+    # Median over `runs` fresh interpreters of: importing streamlit, importing
+    # each module app.py imports, the first (step 1) script run and a rerun, and
+    # the first PDF including the renderer's own imports. Also which of the
+    # heavy optional modules were loaded by the time step 1 had rendered.
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, QUOTE_DB=os.path.join(tmp, "startup.db"), QUOTE_METRICS="0")
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, "-c", _STARTUP_PROBE], cwd=here, env=env, capture_output=True, text=True)
+            if proc.returncode: raise RuntimeError(f"startup probe failed:\n{proc.stderr}")
+            samples.append(json.loads(proc.stdout.splitlines()[-1]))
+    med = lambda get: statistics.median(get(s) for s in samples)
+    out = {k: med(lambda s: s[k]) for k in ("streamlit", "app_imports", "first_render", "rerun", "first_pdf")}
+    out["imports"] = {m: med(lambda s: s["imports"][m]) for m in samples[0]["imports"]}
+    out["heavy_after_import"], out["heavy_after_render"] = samples[-1]["heavy_after_import"], samples[-1]["heavy_after_render"]
+    return out
+
+
+# --- PDF SIZE ---
+PDF_SIZE_LINE_COUNTS = (10, 100, 1000)
+
+
+def _peak(fn):
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def pdf_size(line_counts=PDF_SIZE_LINE_COUNTS):
+    # Per line count: pages, file size, the same document without stream
+    # compression, and peak memory rendering to a file vs. to bytes.
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "quote.pdf")
+        for n in line_counts:
+            model = quote_export.from_quote(synthetic_quote(n, "loaded", "catalog", seed=1))
+            pages, size = pdf_quote.write_pro_pdf(path, model) # also warms fpdf's caches
+            plain = pdf_quote.build_pro_pdf(model)
+            plain.set_compression(False)
+            out[n] = {"pages": pages, "bytes": size, "uncompressed_bytes": len(plain.output()),
+                      "file_peak_kb": _peak(lambda: pdf_quote.write_pro_pdf(path, model)) / 1024,
+                      "bytes_peak_kb": _peak(lambda: create_pro_pdf(model)) / 1024}
+    return out
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b and b["p50_ms"] > 0 and r["p50_ms"] > b["p50_ms"] * (1 + threshold):
+            regressions.append((name, b["p50_ms"], r["p50_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark get_totals(), price_batch(), create_pro_pdf() and the quote exports.")
+    ap.add_argument("-k", "--filter", default="*", help="glob on case names, e.g. 'pdf/*'")
+    ap.add_argument("--quick", action="store_true", help=f"line counts {QUICK_LINE_COUNTS} instead of {LINE_COUNTS}")
+    ap.add_argument("--min-time", type=float, default=0.5, help="seconds to sample each case")
+    ap.add_argument("-o", "--out", default="bench_results.json")
+    ap.add_argument("--baseline", help="results file to compare against")
+    ap.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="also write results as the baseline")
+    ap.add_argument("--threshold", type=float, default=0.15, help="allowed p50 slowdown vs baseline (0.15 = 15%%)")
+    ap.add_argument("--memory", action="store_true", help="report per-session memory for a 1,000-line quote and exit")
+    ap.add_argument("--startup", action="store_true", help="report cold import, first render and first PDF times and exit")
+    ap.add_argument("--startup-runs", type=int, default=3, help="fresh interpreters to take the --startup median over")
+    ap.add_argument("--pdf-size", action="store_true", help=f"report PDF size and render memory at {PDF_SIZE_LINE_COUNTS} lines and exit")
+    args = ap.parse_args(argv)
+
+    if args.pdf_size:
+        for n, r in pdf_size().items():
+            print(f"{n:5d} lines  {r['pages']:3d} pages  {r['bytes'] / 1024:8.1f} KB ({r['uncompressed_bytes'] / 1024:8.1f} KB uncompressed)"
+                  f"  peak to file {r['file_peak_kb']:7.0f} KB  to bytes {r['bytes_peak_kb']:7.0f} KB")
+        return 0
+
+    if args.startup:
+        r = startup_profile(args.startup_runs)
+        print(f"startup, median of {args.startup_runs} fresh interpreters")
+        print(f"  import streamlit          {r['streamlit']:8.1f} ms")
+        print(f"  import app modules        {r['app_imports']:8.1f} ms")
+        for m, t in sorted(r['imports'].items(), key=lambda kv: -kv[1])[:5]: print(f"    {m:22s}  {t:8.1f} ms")
+        print(f"  first render (step 1)     {r['first_render']:8.1f} ms")
+        print(f"  rerun (step 1)            {r['rerun']:8.1f} ms")
+        print(f"  first PDF, incl. imports  {r['first_pdf']:8.1f} ms")
+        print(f"  loaded after imports: {', '.join(r['heavy_after_import']) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+        print(f"  loaded after step 1:  {', '.join(r['heavy_after_render']) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+        return 0
+
+    if args.memory:
+        for kind, r in session_memory().items():
+            print(f"1000 lines as {kind:4s}  lines {r['lines_kb']:8.0f} KB  totals cache {r['totals_cache_kb']:8.0f} KB  total {r['total_kb']:8.0f} KB")
+        return 0
+
+    cases = build_cases(QUICK_LINE_COUNTS if args.quick else LINE_COUNTS)
+    results = {}
+    for name, fn in cases.items():
+        if not fnmatch.fnmatch(name, args.filter): continue
+        r = results[name] = measure(fn, args.min_time)
+        print(f"{name:32s} {r['ops_per_sec']:10.1f} ops/s  p50 {r['p50_ms']:9.3f} ms  p99 {r['p99_ms']:9.3f} ms  peak {r['peak_kb']:9.1f} KB")
+
+    doc = {
+        "meta": {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "machine": platform.machine(), "catalog": get_catalog().version},
+        "results": results,
+    }
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w") as f: json.dump(doc, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: p50 {before:.3f} ms -> {after:.3f} ms (+{(after / before - 1) * 100:.0f}%)")
+        if regressions: return 1
+        print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+import bisect
+import collections
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+import metrics
+
+# Catalog data lives in a versioned JSON file (catalog.json next to this module,
+# or $QUOTE_CATALOG). It is validated and compiled once into a Catalog shared by
+# every session in the process, and reloaded when the file changes on disk.
+#
+# Promos, and entries of the optional `price_changes` section, may carry
+# inclusive ISO `start` / `end` dates; undated records are always in effect.
+# get_catalog(on) returns the Catalog in effect on a date (today by default).
+CATALOG_PATH = os.environ.get("QUOTE_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.json"))
+CHECK_INTERVAL = 2.0 # seconds between mtime checks
+TIER_NAMES = ["Base", "Start", "Plus", "Pro"]
+PROMO_TYPES = ("DPP", "BYOD")
+PRICE_TABLES = ("internet", "tablets", "watches", "other", "addons", "single_prot")
+PLAN_TABLES = ("smartphone_tiers", "smartphone_static", "internet", "tablets", "watches", "other")
+VIEW_LIMIT = 64 # dated catalogs kept compiled per catalog file
+SECTIONS = ("promos", "smartphone_tiers", "smartphone_static", "standard_internet", "smartphone_features", "vbis_prot", "multi_prot") + PRICE_TABLES
+LIST_SECTIONS = ("standard_internet", "multi_prot", "price_changes") # the rest are objects
+
+
+class CatalogError(ValueError):
+    def __init__(self, problems):
+        super().__init__("invalid catalog: " + "; ".join(problems))
+        self.problems = problems
+
+
+# --- VALIDATION ---
+def _is_price(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0
+
+def _is_date(v):
+    try: return isinstance(v, str) and datetime.date.fromisoformat(v).isoformat() == v
+    except ValueError: return False
+
+def _check_span(where, rec):
+    problems = [f"{where}: {k} must be a YYYY-MM-DD date" for k in ("start", "end") if k in rec and not _is_date(rec[k])]
+    if not problems and rec.get("start") and rec.get("end") and rec["start"] > rec["end"]: problems.append(f"{where}: ends before it starts")
+    return problems
+
+def validate(data):
+    problems = []
+    if not isinstance(data, dict): raise CatalogError(["top level must be an object"])
+    missing = [k for k in SECTIONS if k not in data]
+    if missing: raise CatalogError([f"{k}: missing" for k in missing])
+    shapes = [f"{k}: must be a list" if k in LIST_SECTIONS else f"{k}: must be an object" for k in SECTIONS + ("price_changes",)
+              if k in data and not isinstance(data[k], list if k in LIST_SECTIONS else dict)]
+    if shapes: raise CatalogError(shapes)
+    if not isinstance(data.get("version"), str): problems.append("version: missing or not a string")
+    for t, d in data["smartphone_tiers"].items():
+        if not isinstance(d, dict): problems.append(f"smartphone_tiers.{t}: must be an object"); continue
+        if not (isinstance(d.get("prices"), list) and len(d["prices"]) == 5 and all(map(_is_price, d["prices"]))):
+            problems.append(f"smartphone_tiers.{t}: prices must be 5 non-negative numbers")
+        if d.get("tier", "Base") not in TIER_NAMES: problems.append(f"smartphone_tiers.{t}: unknown tier {d.get('tier')!r}")
+    for t, d in data["smartphone_static"].items():
+        if not isinstance(d, dict): problems.append(f"smartphone_static.{t}: must be an object"); continue
+        if not _is_price(d.get("price")): problems.append(f"smartphone_static.{t}: bad price")
+        if d.get("tier", "Base") not in TIER_NAMES: problems.append(f"smartphone_static.{t}: unknown tier {d.get('tier')!r}")
+    for table in PRICE_TABLES:
+        problems += [f"{table}.{k}: bad price" for k, v in data[table].items() if not _is_price(v)]
+    for table in ("smartphone_features", "vbis_prot"):
+        problems += [f"{table}.{k}: bad price" for k, v in data[table].items() if not (isinstance(v, dict) and _is_price(v.get("price")))]
+    if "None" not in data["vbis_prot"]: problems.append("vbis_prot: needs a 'None' entry")
+    problems += [f"standard_internet: {p!r} not in internet" for p in data["standard_internet"] if not isinstance(p, str) or p not in data["internet"]]
+    for i, m in enumerate(data["multi_prot"]):
+        if not (isinstance(m, dict) and isinstance(m.get("name"), str) and isinstance(m.get("min"), int) and _is_price(m.get("price"))):
+            problems.append(f"multi_prot[{i}]: needs name, integer min and price")
+    for tier, promos in data["promos"].items():
+        if tier not in TIER_NAMES: problems.append(f"promos.{tier}: unknown tier")
+        if not isinstance(promos, list): problems.append(f"promos.{tier}: must be a list"); continue
+        for i, p in enumerate(promos):
+            where = f"promos.{tier}[{i}]"
+            if not isinstance(p, dict): problems.append(f"{where}: must be an object"); continue
+            if not isinstance(p.get("name"), str) or p["name"] in ("None", "Custom"): problems.append(f"{where}: bad name")
+            if not _is_price(p.get("value")): problems.append(f"{where}: bad value")
+            if not (p.get("term") == "One-Time" or (isinstance(p.get("term"), int) and p["term"] > 0)): problems.append(f"{where}: term must be months or 'One-Time'")
+            if p.get("type") not in PROMO_TYPES: problems.append(f"{where}: type must be one of {PROMO_TYPES}")
+            if not isinstance(p.get("req_port", False), bool): problems.append(f"{where}: req_port must be a boolean")
+            problems += _check_span(where, p)
+    for i, c in enumerate(data.get("price_changes", [])):
+        where = f"price_changes[{i}]"
+        if not isinstance(c, dict): problems.append(f"{where}: must be an object"); continue
+        if c.get("table") not in PLAN_TABLES: problems.append(f"{where}: table must be one of {PLAN_TABLES}"); continue
+        if not isinstance(c.get("name"), str) or c["name"] not in data[c["table"]]: problems.append(f"{where}: {c.get('name')!r} not in {c['table']}")
+        if c["table"] == "smartphone_tiers":
+            if not (isinstance(c.get("prices"), list) and len(c["prices"]) == 5 and all(map(_is_price, c["prices"]))):
+                problems.append(f"{where}: prices must be 5 non-negative numbers")
+        elif not _is_price(c.get("price")): problems.append(f"{where}: bad price")
+        problems += _check_span(where, c)
+    if problems: raise CatalogError(problems)
+
+
+# --- COMPILED CATALOG ---
+class Catalog:
+    def __init__(self, data, digest="", history=None):
+        self.version = data["version"]
+        self.digest = digest
+        self.history = history
+        self.promos = data["promos"]
+        self.smartphone_tiers = data["smartphone_tiers"]
+        self.smartphone_static = data["smartphone_static"]
+        self.standard_internet = frozenset(data["standard_internet"])
+        self.internet = data["internet"]
+        self.tablets = data["tablets"]
+        self.watches = data["watches"]
+        self.other = data["other"]
+        self.addons = data["addons"]
+        self.smartphone_features = data["smartphone_features"]
+        self.single_prot = data["single_prot"]
+        self.vbis_prot = data["vbis_prot"]
+        self.multi_prot = data["multi_prot"]
+
+        self.plans_by_type = {
+            "Smartphone": list(self.smartphone_tiers) + list(self.smartphone_static),
+            "Internet": list(self.internet), "Tablet": list(self.tablets), "Watch": list(self.watches), "Other": list(self.other),
+        }
+        self.multi_prot_price = {}
+        for m in self.multi_prot: self.multi_prot_price.setdefault(m['name'], m['price'])
+
+        # Promo index: name -> promo record (first catalog occurrence wins) and
+        # (tier, byod, port_in) -> eligible promos in dropdown order, with the
+        # Base tier appended as the fallback for other tiers.
+        self.promo_by_name = {}
+        for promos in self.promos.values():
+            for p in promos: self.promo_by_name.setdefault(p['name'], p)
+        self.eligible = {}
+        for tier in set(self.promos) | {"Base"}:
+            tier_promos = self.promos.get(tier, [])
+            if tier != "Base": tier_promos = tier_promos + self.promos.get("Base", [])
+            for byod in (False, True):
+                for port_in in (False, True):
+                    self.eligible[(tier, byod, port_in)] = _eligible(tier_promos, byod, port_in)
+
+        # Dropdown option lists for the step 2/4 editors, built here so reruns
+        # reuse them instead of rebuilding them from the tables each time.
+        self.all_plans = list(dict.fromkeys(p for plans in self.plans_by_type.values() for p in plans))
+        self.protection_options = ["None", *self.single_prot, *(v for v in self.vbis_prot if v != "None")]
+        self.promo_options = ["None", *self.promo_by_name, "Custom"]
+        self.eligible_options = {k: ["None", *(p['name'] for p in v), "Custom"] for k, v in self.eligible.items()}
+
+    def as_of(self, on=None):
+        # The catalog in effect on `on` (a date or ISO string, default today).
+        return self.history.as_of(on) if self.history is not None else self
+
+    def _eligible_key(self, tier, byod, port_in):
+        key = (tier, bool(byod), bool(port_in))
+        return key if key in self.eligible else ("Base", key[1], key[2])
+
+    def eligible_promos(self, tier, byod, port_in):
+        return self.eligible[self._eligible_key(tier, byod, port_in)]
+
+    def promo_choices(self, tier, byod, port_in):
+        # The step 4 dropdown for a line: None, its eligible promos, Custom.
+        return self.eligible_options[self._eligible_key(tier, byod, port_in)]
+
+
+def _eligible(promos, byod, port_in):
+    valid = []
+    for p in promos:
+        if byod and p.get('type') == 'DPP': continue
+        if not byod and p.get('type') == 'BYOD': continue
+        if p.get('req_port') and not port_in: continue
+        valid.append(p)
+    return tuple(valid)
+
+
+# --- EFFECTIVE DATES ---
+def _span(rec):
+    # [start, end) as ISO strings, None for an open side.
+    end = rec.get("end")
+    return rec.get("start"), end and (datetime.date.fromisoformat(end) + datetime.timedelta(days=1)).isoformat()
+
+
+class IntervalIndex:
+    """Static centered interval tree over half-open [start, end) spans.
+
+    `stab(on)` returns the positions of every span containing `on`, in
+    O(log n + k) for k matches. Open sides are None.
+    """
+
+    def __init__(self, spans):
+        self._root = self._build([(s or "", e or "\uffff", i) for i, (s, e) in enumerate(spans)])
+
+    def _build(self, items):
+        if not items: return None
+        # Centered on the median start, so at least one span stays at each node.
+        center = sorted(s for s, _, _ in items)[len(items) // 2]
+        here = [it for it in items if it[0] <= center < it[1]]
+        return (center, sorted(here), sorted(here, key=lambda it: it[1], reverse=True),
+                self._build([it for it in items if it[1] <= center]), self._build([it for it in items if it[0] > center]))
+
+    def stab(self, on):
+        found, node = [], self._root
+        while node is not None:
+            center, by_start, by_end, left, right = node
+            if on < center:
+                for s, _, i in by_start:
+                    if s > on: break
+                    found.append(i)
+                node = left
+            else:
+                for _, e, i in by_end:
+                    if e <= on: break
+                    found.append(i)
+                node = right
+        return sorted(found)
+
+
+def _effective(data, records):
+    # `data` with only `records` in effect: (tier, promo) and (None, price
+    # change) pairs in file order. Price changes apply over the base tables,
+    # later entries winning.
+    promos = {t: [] for t in data["promos"]}
+    out = dict(data, promos=promos)
+    for tier, rec in records:
+        if tier is not None:
+            promos[tier].append(rec)
+            continue
+        table, name = rec["table"], rec["name"]
+        if out[table] is data[table]: out[table] = dict(data[table])
+        if table == "smartphone_tiers": out[table][name] = dict(out[table][name], prices=rec["prices"])
+        elif table == "smartphone_static": out[table][name] = dict(out[table][name], price=rec["price"])
+        else: out[table][name] = rec["price"]
+    return out
+
+
+class CatalogHistory:
+    """Every dated state of one catalog file, indexed by effective date.
+
+    The starts and day-after-ends of all dated records cut the timeline into
+    intervals in each of which the same records apply. `as_of()` finds a date's
+    interval by bisection and compiles its Catalog once, from the records an
+    IntervalIndex stabs at that date, so neither a lookup nor a compile scans
+    years of promo history.
+    """
+
+    def __init__(self, data, digest):
+        self.version = data["version"]
+        self.digest = digest
+        self._data = data
+        self._records = [(t, p) for t, promos in data["promos"].items() for p in promos] + [(None, c) for c in data.get("price_changes", ())]
+        spans = [_span(rec) for _, rec in self._records]
+        self.bounds = sorted({d for span in spans for d in span if d})
+        self._index = IntervalIndex(spans)
+        self._lock = threading.Lock()
+        self._views = collections.OrderedDict() # interval -> Catalog
+        self.as_of() # compile today's catalog up front
+
+    def interval(self, on=None):
+        # Index of the interval holding `on`: bounds[i - 1] <= on < bounds[i].
+        on = on or datetime.date.today()
+        return bisect.bisect_right(self.bounds, on if isinstance(on, str) else on.isoformat())
+
+    def records(self, on):
+        # The (tier, promo) and (None, price change) records in effect on an ISO date.
+        return [self._records[i] for i in self._index.stab(on)]
+
+    def as_of(self, on=None):
+        i = self.interval(on)
+        with self._lock:
+            cat = self._views.get(i)
+            if cat is not None:
+                self._views.move_to_end(i)
+                return cat
+        start = self.bounds[i - 1] if i else ""
+        cat = Catalog(_effective(self._data, self.records(start)), f"{self.digest}:{i}" if self.bounds else self.digest, self)
+        with self._lock:
+            cat = self._views.setdefault(i, cat)
+            while len(self._views) > VIEW_LIMIT: self._views.popitem(last=False)
+        return cat
+
+
+def compile_catalog(raw, digest=None):
+    data = json.loads(raw)
+    validate(data)
+    return CatalogHistory(data, digest or hashlib.sha256(raw).hexdigest())
+
+
+def load_catalog(path):
+    with open(path, "rb") as f: return compile_catalog(f.read())
+
+
+# --- PROCESS-WIDE CACHE ---
+_lock = threading.Lock()
+_current = None
+_stat = None
+_checked = 0.0
+last_error = None
+
+
+@metrics.timed("catalog")
+def get_catalog(on=None):
+    # The catalog in effect on `on` (default today). Cheap on the hot path: at
+    # most one stat() per CHECK_INTERVAL, and a changed mtime only recompiles if
+    # the content hash differs. A bad file keeps the last good catalog in
+    # service and is reported through `last_error`.
+    now = time.monotonic()
+    if _current is not None and now - _checked < CHECK_INTERVAL: return _current.as_of(on)
+    return _reload(now).as_of(on)
+
+
+def _reload(now):
+    global _current, _stat, _checked, last_error
+    path = CATALOG_PATH
+    with _lock:
+        if _current is not None and now - _checked < CHECK_INTERVAL: return _current
+        _checked = now
+        try:
+            st = os.stat(path)
+            stat = (st.st_mtime_ns, st.st_size)
+            if stat == _stat: return _current
+            with open(path, "rb") as f: raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            if _current is None or digest != _current.digest:
+                _current = compile_catalog(raw, digest)
+                last_error = None
+        except OSError as e:
+            # Missing or unreadable (mid-deploy, say): keep serving, look again next interval.
+            if _current is None: raise
+            last_error, stat = str(e), None
+        except Exception as e:
+            # Anything validate() missed must not take the catalog out of service either.
+            if _current is None: raise
+            last_error = str(e)
+        _stat = stat
+        return _current
@@ -0,0 +1,438 @@
+import datetime
+import functools
+
+from catalogs import TIER_NAMES, get_catalog
+import line_model
+from line_model import Line, LineDetail
+
+# A "quote" is any mapping holding `lines` plus the step 3 account options
+# (st.session_state qualifies, so does a plain dict loaded from JSON), and
+# optionally the `quote_date` (ISO) whose promos and prices it is priced with.
+ACCOUNT_DEFAULTS = {"autopay": False, "military": False, "joint_offer": False, "tmp_multi": "None", "whole_office": False}
+WHOLE_OFFICE_PRICE = 55.0
+MULTI_ELIGIBLE_TYPES = ("Smartphone", "Tablet", "Watch")
+DEVICE_TYPES = ["Smartphone", "Internet", "Tablet", "Watch", "Other"]
+CUSTOM_TERMS = ["36 Months", "24 Months", "12 Months", "One-Time"]
+
+
+def new_line():
+    return Line()
+
+
+def account_options(quote):
+    return {k: quote.get(k, v) for k, v in ACCOUNT_DEFAULTS.items()}
+
+
+def quote_date(quote):
+    d = quote.get('quote_date')
+    if not d: return datetime.date.today()
+    return d if isinstance(d, datetime.date) else datetime.date.fromisoformat(d)
+
+
+def quote_catalog(quote, cat=None):
+    # The catalog in effect on the quote's date; `cat` may be any dated view of
+    # the same catalog file.
+    return (cat or get_catalog()).as_of(quote_date(quote))
+
+
+def multi_eligible(l):
+    # Lines that count towards, and are covered by, Multi-Device Protection.
+    return l.get('type') in MULTI_ELIGIBLE_TYPES or "Jetpack" in str(l.get('plan'))
+
+
+# --- CALCULATION ENGINE ---
+# Callers pass the compiled catalog (catalogs.get_catalog()) so one quote is
+# priced against a single catalog version even if it hot-reloads mid-call;
+# get_totals() and TotalsCache move it to the quote's date themselves.
+def smartphone_tier_idx(lines, cat):
+    sm_count = sum(1 for l in lines if l.get('plan') in cat.smartphone_tiers)
+    return min(sm_count, 5) - 1 if sm_count > 0 else 0
+
+
+@functools.lru_cache(maxsize=1024)
+def _label(name, price):
+    # One shared "Name ($10)" string per catalog item across every line.
+    return f"{name} (${price:.0f})"
+
+
+def price_line(l, tier_idx, opts, cat):
+    (dtype, plan, features, sp_features, protection, vbis, dev_pay, l_intro,
+     p_sel, cust_term, byod, port_in, cust_val) = line_model.row(l)
+
+    # Base Price
+    if plan in cat.smartphone_tiers: base = cat.smartphone_tiers[plan]['prices'][tier_idx]
+    elif plan in cat.smartphone_static: base = cat.smartphone_static[plan]['price']
+    elif dtype == "Internet": base = cat.internet.get(plan, 0.0)
+    elif dtype == "Tablet": base = cat.tablets.get(plan, 0.0)
+    elif dtype == "Watch": base = cat.watches.get(plan, 0.0)
+    else: base = cat.other.get(plan, 0.0)
+
+    # Joint Offer
+    if opts['joint_offer'] and dtype == "Internet" and plan in cat.standard_internet:
+        base -= 30.0
+
+    # Discounts
+    ap_disc = 5.0 if (opts['autopay'] and plan in cat.smartphone_tiers) else 0.0
+    mil_disc = 5.0 if (opts['military'] and dtype == "Smartphone") else 0.0
+    intro_disc = (base * 0.15) if l_intro else 0.0
+
+    # Add-ons List
+    extras_cost = 0
+    feature_list = []
+    for f in features:
+        cost = cat.addons[f]
+        extras_cost += cost
+        feature_list.append(_label(f, cost))
+    for f in sp_features:
+        cost = cat.smartphone_features[f]['price']
+        extras_cost += cost
+        feature_list.append(_label(f, cost))
+
+    # Tier Logic
+    if plan == "My Biz":
+        if extras_cost >= 20: tier = "Pro"
+        elif extras_cost >= 15: tier = "Plus"
+        elif extras_cost >= 5: tier = "Start"
+        else: tier = "Base"
+    else:
+        tier = cat.smartphone_tiers.get(plan, cat.smartphone_static.get(plan, {"tier": "Base"})).get('tier', 'Base')
+
+    # Protection List
+    prot_list = []
+    if dtype == "Internet":
+        p_price = cat.vbis_prot.get(vbis, {"price": 0.0})['price']
+        if p_price > 0: prot_list.append(_label(vbis, p_price))
+    else:
+        p_price = cat.single_prot.get(protection, 0.0)
+        if p_price > 0: prot_list.append(_label(protection, p_price))
+
+    # Promos
+    promo_credit = 0
+    val = 0.0
+    term = 36
+    if p_sel != "None":
+        if p_sel == "Custom":
+            val = cust_val
+            term = "One-Time" if cust_term == "One-Time" else int(cust_term.split()[0])
+        elif p_sel in cat.promo_by_name:
+            p = cat.promo_by_name[p_sel]
+            val = p['value']
+            term = p['term']
+
+        if term != "One-Time": promo_credit = val / term
+
+    total = (base - ap_disc - mil_disc - intro_disc) + dev_pay + extras_cost + p_price - promo_credit
+
+    return LineDetail(
+        base=base, ap_disc=ap_disc, mil_disc=mil_disc, intro_disc=intro_disc,
+        dev_pay=dev_pay, extras_list=tuple(feature_list),
+        prot_list=tuple(prot_list),
+        promo_credit=promo_credit, promo_name=p_sel, promo_term=term, promo_val=val,
+        byod=byod, port_in=port_in,
+        total=total, tier=tier
+    )
+
+
+def account_extras(opts, cat):
+    acct_extras = 0
+    if opts['tmp_multi'] != "None":
+        acct_extras += cat.multi_prot_price.get(opts['tmp_multi'], 0)
+    if opts['whole_office']:
+        acct_extras += WHOLE_OFFICE_PRICE
+    return acct_extras
+
+
+def summarize(line_details, acct_extras):
+    account_mrc = 0
+    total_base_plan_cost = 0 # For tax calc
+    one_time_promo_total = 0
+    for d in line_details:
+        account_mrc += d['total']
+        total_base_plan_cost += d['base']
+        if d['promo_term'] == "One-Time": one_time_promo_total += d['promo_val']
+    return line_details, account_mrc + acct_extras, one_time_promo_total, total_base_plan_cost, acct_extras
+
+
+def get_totals(quote, cat=None):
+    cat = quote_catalog(quote, cat)
+    lines = quote.get('lines', [])
+    opts = account_options(quote)
+    tier_idx = smartphone_tier_idx(lines, cat)
+    return summarize([price_line(l, tier_idx, opts, cat) for l in lines], account_extras(opts, cat))
+
+
+# --- DUE TODAY / FIRST BILL ---
+# Unit prices for the step 5 counters, keyed by their widget keys.
+SETUP_PRICES = {"su_smart": 39.99, "su_std": 29.99}
+BUNDLE_PRICES = {"bund_craft": 150.0, "bund_ess": 215.0}
+ACCESSORY_PRICES = {"acc_screen": 66.99, "acc_case": 56.99, "acc_chg": 36.99}
+ACTIVATION_FEE = 40.0
+DEFAULT_TAX_RATE = 6.75
+STEP5_DEFAULTS = {
+    "biz_name": "Business Name", "rep_name": "Sales Rep Name", "zip": "", "tax_rate": DEFAULT_TAX_RATE, "dev_retail": 0.0,
+    **{k: 0 for k in (*SETUP_PRICES, *BUNDLE_PRICES, *ACCESSORY_PRICES)}, "act_cnt": 0, "bill_cred": 0.0,
+}
+
+
+def due_today(quote):
+    tax_rate = quote.get('tax_rate', DEFAULT_TAX_RATE)
+    setup_cost = sum(quote.get(k, 0) * p for k, p in SETUP_PRICES.items())
+    bundle_cost = sum(quote.get(k, 0) * p for k, p in BUNDLE_PRICES.items())
+    acc_cost = sum(quote.get(k, 0) * p for k, p in ACCESSORY_PRICES.items())
+
+    taxable = quote.get('dev_retail', 0.0) + setup_cost + bundle_cost + acc_cost
+    tax_amt = taxable * (tax_rate / 100)
+    total_today = tax_amt + setup_cost + bundle_cost + acc_cost
+    return {"tax_rate": tax_rate, "tax_amt": tax_amt, "setup_cost": setup_cost, "bundle_cost": bundle_cost, "acc_cost": acc_cost, "total": total_today}
+
+
+def first_bill(quote):
+    return {"act_fees": quote.get('act_cnt', 0) * ACTIVATION_FEE, "credits": quote.get('bill_cred', 0.0)}
+
+
+# --- TOTALS CACHE ---
+def line_fingerprint(l, tier_idx, opts, cat):
+    # Only the account state a line actually depends on goes into its key, so a
+    # tier_idx change dirties tiered smartphone lines, autopay/military dirty
+    # the lines they discount and joint_offer dirties standard Internet lines.
+    row = line_model.row(l)
+    dtype, plan = row[0], row[1]
+    tiered = plan in cat.smartphone_tiers
+    return (
+        row,
+        tier_idx if tiered else None,
+        opts['autopay'] and tiered,
+        opts['military'] and dtype == "Smartphone",
+        opts['joint_offer'] and dtype == "Internet" and plan in cat.standard_internet,
+    )
+
+
+class TotalsCache:
+    """Memoizes get_totals() across reruns, repricing only lines whose inputs changed."""
+
+    def __init__(self):
+        self._digest = None
+        self._keys = []
+        self._details = []
+        self._quote_key = None
+        self._result = None
+        self.hits = self.misses = 0
+        self.line_hits = self.line_misses = 0
+
+    def get_totals(self, quote, cat=None):
+        cat = quote_catalog(quote, cat)
+        if cat.digest != self._digest:
+            # A reloaded catalog (or a new quote date) can change any price, so start over.
+            self._digest, self._keys, self._details, self._quote_key = cat.digest, [], [], None
+        lines = quote.get('lines', [])
+        opts = account_options(quote)
+        tier_idx = smartphone_tier_idx(lines, cat)
+        keys = [line_fingerprint(l, tier_idx, opts, cat) for l in lines]
+        quote_key = (tuple(keys), opts['tmp_multi'], opts['whole_office'])
+        if quote_key == self._quote_key:
+            self.hits += 1
+            return self._result
+
+        self.misses += 1
+        details = []
+        for i, (l, key) in enumerate(zip(lines, keys)):
+            if i < len(self._keys) and self._keys[i] == key:
+                self.line_hits += 1
+                details.append(self._details[i])
+            else:
+                self.line_misses += 1
+                details.append(price_line(l, tier_idx, opts, cat))
+        self._keys, self._details = keys, details
+        self._quote_key = quote_key
+        self._result = summarize(details, account_extras(opts, cat))
+        return self._result
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "line_hits": self.line_hits, "line_misses": self.line_misses}
+
+
+# --- BATCH ENGINE ---
+# NumPy is imported by the batch code itself, so the wizard only loads it once
+# step 3 compares account options (or a batch is priced), not at startup.
+class _BatchTables:
+    # Lookup tables for the columnar path, built once per catalog version.
+    def __init__(self, cat):
+        import numpy as np
+        self.cat = cat
+        tiered = list(cat.smartphone_tiers)
+        self.tiered_code = {p: i for i, p in enumerate(tiered)}
+        self.tier_prices = np.array([cat.smartphone_tiers[p]['prices'] for p in tiered], dtype=np.float64).reshape(-1, 5)
+        self.tiered_tier = np.array([TIER_NAMES.index(cat.smartphone_tiers[p].get('tier', 'Base')) for p in tiered], dtype=np.int8)
+        self.my_biz = self.tiered_code.get("My Biz", -1)
+        self.static_by_type = {"Internet": cat.internet, "Tablet": cat.tablets, "Watch": cat.watches}
+        self.sp_price = {f: d['price'] for f, d in cat.smartphone_features.items()}
+
+    def static_plan(self, plan, dtype):
+        cat = self.cat
+        if plan in cat.smartphone_static: return cat.smartphone_static[plan]['price'], TIER_NAMES.index(cat.smartphone_static[plan].get('tier', 'Base'))
+        return self.static_by_type.get(dtype, cat.other).get(plan, 0.0), 0
+
+    def promo_terms(self, l):
+        p_sel = l.get('promo_selection', 'None')
+        if p_sel == "None": return 0.0, 36
+        if p_sel == "Custom":
+            cust_term = l.get('custom_promo_term', '36 Months')
+            return l.get('custom_promo_val', 0.0), "One-Time" if cust_term == "One-Time" else int(cust_term.split()[0])
+        p = self.cat.promo_by_name.get(p_sel)
+        return (p['value'], p['term']) if p else (0.0, 36)
+
+
+@functools.lru_cache(maxsize=4)
+def _batch_tables(cat):
+    return _BatchTables(cat)
+
+
+class QuoteBatch:
+    """Array-backed columns for many quotes' lines, priced in one vectorized pass.
+
+    Column building is the only per-line Python work; plan names are resolved to
+    codes, add-ons to a cost and promos to a monthly credit here so that
+    `price()` is pure NumPy arithmetic. Every quote is priced with `cat` (today's
+    catalog by default); callers group dated quotes by quote_catalog() first.
+    """
+
+    def __init__(self, quotes, cat=None):
+        import numpy as np
+        cat = cat or get_catalog()
+        tb = _batch_tables(cat)
+        self.tables = tb
+        n_q = len(quotes)
+        quote_ix, tiered, static_base, static_tier = [], [], [], []
+        is_sp, joint_ok, intro, extras, prot, dev_pay, credit, one_time = [], [], [], [], [], [], [], []
+        self.autopay = np.zeros(n_q, dtype=bool)
+        self.military = np.zeros(n_q, dtype=bool)
+        self.joint_offer = np.zeros(n_q, dtype=bool)
+        self.acct_extras = np.zeros(n_q)
+
+        for q, quote in enumerate(quotes):
+            opts = account_options(quote)
+            self.autopay[q] = opts['autopay']
+            self.military[q] = opts['military']
+            self.joint_offer[q] = opts['joint_offer']
+            self.acct_extras[q] = account_extras(opts, cat)
+            for l in quote.get('lines', []):
+                plan = l.get('plan', 'My Biz')
+                dtype = l.get('type', 'Smartphone')
+                quote_ix.append(q)
+                code = tb.tiered_code.get(plan, -1)
+                tiered.append(code)
+                if code < 0:
+                    price, t = tb.static_plan(plan, dtype)
+                    static_base.append(price)
+                    static_tier.append(t)
+                else:
+                    static_base.append(0.0)
+                    static_tier.append(0)
+                is_sp.append(dtype == "Smartphone")
+                joint_ok.append(dtype == "Internet" and plan in cat.standard_internet)
+                intro.append(bool(l.get('intro_disc')))
+                extras.append(sum(cat.addons[f] for f in l.get('features', ())) + sum(tb.sp_price[f] for f in l.get('sp_features', ())))
+                if dtype == "Internet": prot.append(cat.vbis_prot.get(l.get('vbis', 'None'), {"price": 0.0})['price'])
+                else: prot.append(cat.single_prot.get(l.get('protection', 'None'), 0.0))
+                dev_pay.append(l.get('dev_pay', 0.0))
+                val, term = tb.promo_terms(l)
+                if term == "One-Time":
+                    credit.append(0.0)
+                    one_time.append(val)
+                else:
+                    credit.append(val / term)
+                    one_time.append(0.0)
+
+        self.n_quotes = n_q
+        self.quote_ix = np.array(quote_ix, dtype=np.intp)
+        self.plan = np.array(tiered, dtype=np.int16)
+        self.static_base = np.array(static_base, dtype=np.float64)
+        self.static_tier = np.array(static_tier, dtype=np.int8)
+        self.is_smartphone = np.array(is_sp, dtype=bool)
+        self.joint_eligible = np.array(joint_ok, dtype=bool)
+        self.intro = np.array(intro, dtype=bool)
+        self.extras = np.array(extras, dtype=np.float64)
+        self.protection = np.array(prot, dtype=np.float64)
+        self.dev_pay = np.array(dev_pay, dtype=np.float64)
+        self.promo_credit = np.array(credit, dtype=np.float64)
+        self.one_time = np.array(one_time, dtype=np.float64)
+
+    def price(self):
+        import numpy as np
+        tb = self.tables
+        q = self.quote_ix
+        is_tiered = self.plan >= 0
+        sm_count = np.bincount(q[is_tiered], minlength=self.n_quotes)
+        tier_idx = np.where(sm_count > 0, np.minimum(sm_count, 5) - 1, 0)
+
+        base = np.where(is_tiered, tb.tier_prices[np.maximum(self.plan, 0), tier_idx[q]], self.static_base) if len(tb.tier_prices) else self.static_base
+        base = base - 30.0 * (self.joint_offer[q] & self.joint_eligible)
+        ap_disc = 5.0 * (self.autopay[q] & is_tiered)
+        mil_disc = 5.0 * (self.military[q] & self.is_smartphone)
+        intro_disc = np.where(self.intro, base * 0.15, 0.0)
+        extras = self.extras
+
+        my_biz_tier = np.select([extras >= 20, extras >= 15, extras >= 5], [3, 2, 1], 0)
+        tiered_tier = tb.tiered_tier[np.maximum(self.plan, 0)] if len(tb.tiered_tier) else self.static_tier
+        tier = np.where(self.plan == tb.my_biz, my_biz_tier, np.where(is_tiered, tiered_tier, self.static_tier))
+
+        total = (base - ap_disc - mil_disc - intro_disc) + self.dev_pay + extras + self.protection - self.promo_credit
+        return {
+            "line_total": total, "line_base": base, "line_tier": tier.astype(np.int8), "tier_idx": tier_idx,
+            "mrc": np.bincount(q, weights=total, minlength=self.n_quotes) + self.acct_extras,
+            "one_time": np.bincount(q, weights=self.one_time, minlength=self.n_quotes),
+            "taxable": np.bincount(q, weights=base, minlength=self.n_quotes),
+            "acct_extras": self.acct_extras,
+        }
+
+
+def price_batch(quotes, cat=None):
+    return QuoteBatch(quotes, cat).price()
+
+
+# --- WHAT-IF SCENARIOS ---
+def account_scenarios(lines, cat=None):
+    # Every step 3 combination the app would offer for these lines.
+    cat = cat or get_catalog()
+    has_joint = any(l.get('type') == "Smartphone" for l in lines) and any(l.get('type') == "Internet" and l.get('plan') in cat.standard_internet for l in lines)
+    eligible = sum(map(multi_eligible, lines))
+    multis = ["None"] + [m['name'] for m in cat.multi_prot if eligible >= m['min']]
+    return [{"autopay": a, "military": m, "joint_offer": j, "tmp_multi": t, "whole_office": w}
+            for a in (False, True) for m in (False, True) for j in ((False, True) if has_joint else (False,))
+            for t in multis for w in (False, True)]
+
+
+def swap_plans(lines, old, new):
+    # Moves every `old` line to `new`, dropping what the new plan can't carry.
+    return [dict(l, plan=new, features=l.get('features', []) if new == "My Biz" else [], intro_disc=l.get('intro_disc', False) and new == "My Biz")
+            if l.get('plan') == old else l for l in lines]
+
+
+def scenario_matrix(variants, scenarios, cat=None):
+    """Monthly totals for every (line variant, account scenario) pair, shape (V, S).
+
+    Each variant's lines are priced once, in one QuoteBatch, with every account
+    option off. An option's effect on the MRC is then fixed by a per-variant sum
+    (lines it discounts, intro-discount base it touches), so the matrix is a few
+    broadcasts over those sums rather than V * S full repricings. As in step 4,
+    the intro discount is dropped when the military discount is on.
+    """
+    import numpy as np
+    cat = cat or get_catalog()
+    batch = QuoteBatch([{"lines": v} for v in variants], cat)
+    r = batch.price()
+    q, n = batch.quote_ix, batch.n_quotes
+    intro_base = np.where(batch.intro, 0.15 * r['line_base'], 0.0)
+    plain = np.bincount(q, weights=r['line_total'] + intro_base, minlength=n)[:, None]
+    tiered = np.bincount(q, weights=batch.plan >= 0, minlength=n)[:, None]
+    smartphones = np.bincount(q, weights=batch.is_smartphone, minlength=n)[:, None]
+    joint = np.bincount(q, weights=batch.joint_eligible, minlength=n)[:, None]
+    intro = np.bincount(q, weights=intro_base, minlength=n)[:, None]
+    intro_joint = np.bincount(q, weights=batch.intro & batch.joint_eligible, minlength=n)[:, None]
+
+    ap = np.array([s['autopay'] for s in scenarios], dtype=float)
+    mil = np.array([s['military'] for s in scenarios], dtype=float)
+    jo = np.array([s['joint_offer'] for s in scenarios], dtype=float)
+    acct = np.array([account_extras(dict(ACCOUNT_DEFAULTS, **s), cat) for s in scenarios])
+    return (plain - 30.0 * jo * joint - 5.0 * ap * tiered - 5.0 * mil * smartphones
+            - (1 - mil) * (intro - 4.5 * jo * intro_joint) + acct)
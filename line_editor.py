@@ -0,0 +1,228 @@
+import streamlit as st
+
+import engine
+from engine import CUSTOM_TERMS, DEVICE_TYPES
+
+# Table editors for steps 2 and 4. Only the current page of (filtered) lines is
+# handed to st.data_editor, so a 150-line account renders one grid of PAGE_SIZE
+# rows instead of an expander full of widgets per line.
+PAGE_SIZE = 25
+
+
+def _catalog():
+    # The catalog in effect on the quote's date, so promos offered here are
+    # the ones the engine will price.
+    return engine.quote_catalog(st.session_state)
+
+
+def plan_options(dtype):
+    plans = _catalog().plans_by_type
+    return plans.get(dtype, plans["Other"])
+
+
+def all_plans():
+    return _catalog().all_plans
+
+
+def protection_options():
+    return _catalog().protection_options
+
+
+def promo_options(tier, byod, port_in):
+    return _catalog().promo_choices(tier, byod, port_in)
+
+
+def _plan_rule(l):
+    if l['plan'] not in plan_options(l['type']): l['plan'] = plan_options(l['type'])[0]
+
+
+def apply_line_rules(l, tier, military):
+    # Mirrors what the per-line widgets used to allow; returns True if anything
+    # had to be reset. Protection is kept when Multi-Device covers the account,
+    # as before, since the selectbox was only hidden.
+    cat = _catalog()
+    before = dict(l)
+    _plan_rule(l)
+    if l['plan'] != "My Biz": l['features'] = []
+    if l['plan'] != "My Biz" or military: l['intro_disc'] = False
+    if l['type'] != "Smartphone": l['sp_features'] = []
+    elif l['plan'] == "My Biz": l['sp_features'] = [f for f in l['sp_features'] if f != "VBMIS (Paid)"]
+    if l['type'] == "Internet":
+        if l['vbis'] not in cat.vbis_prot: l['vbis'] = "None"
+    elif l['protection'] not in cat.single_prot: l['protection'] = "None"
+    if l['promo_selection'] not in promo_options(tier, l['byod'], l['port_in']): l['promo_selection'] = "None"
+    return l != before
+
+
+# --- PAGING / SELECTION ---
+def _bump():
+    st.session_state.editor_rev = st.session_state.get('editor_rev', 0) + 1
+
+
+def page_controls(lines, step):
+    # Returns indices of the lines on the visible page after filtering.
+    if 'selected_lines' not in st.session_state: st.session_state.selected_lines = set()
+    c1, c2, c3 = st.columns([2, 2, 1])
+    f_type = c1.selectbox("Filter by category", ["All"] + DEVICE_TYPES, key=f"flt_type_{step}")
+    f_plan = c2.selectbox("Filter by plan", ["All"] + all_plans(), key=f"flt_plan_{step}")
+    shown = [i for i, l in enumerate(lines) if f_type in ("All", l['type']) and f_plan in ("All", l['plan'])]
+    pages = max(1, -(-len(shown) // PAGE_SIZE))
+    page = c3.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"page_{step}")
+
+    c1, c2, c3 = st.columns([1, 1, 3])
+    if c1.button("Select filtered", key=f"sel_all_{step}"):
+        st.session_state.selected_lines |= set(shown); _bump()
+    if c2.button("Clear selection", key=f"sel_none_{step}"):
+        st.session_state.selected_lines = set(); _bump()
+    c3.caption(f"{len(shown)} of {len(lines)} lines shown · {len(st.session_state.selected_lines)} selected")
+    return shown[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+
+
+def _selected(lines):
+    # Selected indices that still exist; a selection can outlive a shorter quote.
+    return sorted(i for i in st.session_state.selected_lines if i < len(lines))
+
+
+def _edit_table(rows, idxs, column_config, disabled, step):
+    import pandas as pd # first needed here, not when step 1 renders
+    df = pd.DataFrame(rows, index=[i + 1 for i in idxs])
+    df.insert(0, "Sel", [i in st.session_state.selected_lines for i in idxs])
+    key = f"editor_{step}_{st.session_state.get('editor_rev', 0)}_{idxs[0] if idxs else 0}_{len(idxs)}"
+    out = st.data_editor(df, column_config=column_config, disabled=disabled, num_rows="fixed", width="stretch", key=key)
+    for i, sel in zip(idxs, out["Sel"]):
+        if sel: st.session_state.selected_lines.add(i)
+        else: st.session_state.selected_lines.discard(i)
+    return out.drop(columns="Sel").to_dict("records")
+
+
+def _commit(lines, idxs, edited, to_line, rules):
+    # Writes edited rows back; if a rule overrides what was typed, the editor
+    # key is bumped so its stored edits don't keep re-applying the bad value.
+    changed = reset = False
+    for i, row in zip(idxs, edited):
+        fields = to_line(lines[i], row)
+        new = {**lines[i], **fields}
+        rules(new)
+        reset |= any(new[k] != v for k, v in fields.items())
+        if new != lines[i]:
+            lines[i].update(new)
+            changed = True
+    if reset: _bump()
+    if changed: st.rerun()
+
+
+# --- STEP 2 ---
+def plan_editor(lines):
+    idxs = page_controls(lines, 2)
+    rows = [{"Device Category": lines[i]['type'], "Plan": lines[i]['plan']} for i in idxs]
+    edited = _edit_table(rows, idxs, {
+        "Device Category": st.column_config.SelectboxColumn(options=DEVICE_TYPES, required=True),
+        "Plan": st.column_config.SelectboxColumn(options=all_plans(), required=True),
+    }, [], 2)
+    st.caption("A plan that does not belong to the chosen category falls back to the category's first plan.")
+
+    with st.expander("Bulk edit selected lines"):
+        c1, c2 = st.columns(2)
+        b_type = c1.selectbox("Device Category", DEVICE_TYPES, key="bulk_type")
+        b_plan = c2.selectbox("Select Plan", plan_options(b_type), key="bulk_plan")
+        if st.button("Apply to selected", key="bulk_apply_2", disabled=not st.session_state.selected_lines):
+            for i in _selected(lines):
+                lines[i]['type'], lines[i]['plan'] = b_type, b_plan
+            _bump(); st.rerun()
+
+    _commit(lines, idxs, edited, lambda l, r: {"type": r["Device Category"], "plan": r["Plan"]}, _plan_rule)
+
+
+# --- STEP 4 ---
+def _feature_row(l, d):
+    return {
+        "Plan": l['plan'], "Tier": d['tier'], "BYOD": l['byod'], "Port-In": l['port_in'],
+        "Protection": l['vbis'] if l['type'] == "Internet" else l['protection'],
+        "Add-ons": list(l['features']), "Smartphone Features": list(l['sp_features']), "Intro 15%": l['intro_disc'],
+        "Promo": l['promo_selection'], "Term": _promo_term(l),
+        "Custom $": l.get('custom_promo_val', 0.0), "Custom Term": l.get('custom_promo_term', '36 Months'),
+        "Device Pmt": l['dev_pay'], "Line Total": d['total'],
+    }
+
+
+def _promo_term(l):
+    if l['promo_selection'] == "Custom": return l.get('custom_promo_term', '36 Months')
+    p = _catalog().promo_by_name.get(l['promo_selection'])
+    if not p: return ""
+    return f"{p['term']} Months" if isinstance(p['term'], int) else "One-Time"
+
+
+def _feature_fields(l, r):
+    cat = _catalog()
+    prot = r["Protection"] or "None"
+    return {
+        "byod": bool(r["BYOD"]), "port_in": bool(r["Port-In"]),
+        "vbis" if l['type'] == "Internet" else "protection": prot,
+        "features": [f for f in cat.addons if f in (r["Add-ons"] or [])],
+        "sp_features": [f for f in cat.smartphone_features if f in (r["Smartphone Features"] or [])],
+        "intro_disc": bool(r["Intro 15%"]), "promo_selection": r["Promo"] or "None",
+        "custom_promo_val": float(r["Custom $"] or 0.0), "custom_promo_term": r["Custom Term"] or "36 Months",
+        "dev_pay": float(r["Device Pmt"] or 0.0),
+    }
+
+
+def _feature_rules(lines):
+    # Promo eligibility is judged on the tier the edited line itself produces,
+    # so adding My Biz add-ons in the same edit can unlock a higher-tier promo.
+    cat = _catalog()
+    tier_idx = engine.smartphone_tier_idx(lines, cat)
+    opts = engine.account_options(st.session_state)
+    return lambda l: apply_line_rules(l, engine.price_line(l, tier_idx, opts, cat)['tier'], opts['military'])
+
+
+def normalize_lines(lines, l_info):
+    # Lines edited in steps 2/3 (or off-page) get the same checks the per-line
+    # widgets used to apply on render, e.g. a promo no longer valid for the tier.
+    military = st.session_state.military
+    if sum(apply_line_rules(l, d['tier'], military) for l, d in zip(lines, l_info)):
+        _bump(); st.rerun()
+
+
+def feature_editor(lines, l_info):
+    normalize_lines(lines, l_info)
+    idxs = page_controls(lines, 4)
+    if st.session_state.tmp_multi != "None": st.caption("✅ Smartphone, tablet and watch protection is covered by Multi-Device Protection")
+    cat = _catalog()
+    rows = [_feature_row(lines[i], l_info[i]) for i in idxs]
+    promo_names = cat.promo_options
+    prot_opts = protection_options()
+    edited = _edit_table(rows, idxs, {
+        "Protection": st.column_config.SelectboxColumn(options=prot_opts, help="TMP/TEC/WPP for devices, VBIS for Internet"),
+        "Add-ons": st.column_config.MultiselectColumn(options=list(cat.addons), help="My Biz lines only"),
+        "Smartphone Features": st.column_config.MultiselectColumn(options=list(cat.smartphone_features), help="VBMIS (Paid) is not available on My Biz"),
+        "Intro 15%": st.column_config.CheckboxColumn(help="My Biz lines without the military discount"),
+        "Promo": st.column_config.SelectboxColumn(options=promo_names, help="Must be eligible for the line's tier, BYOD and port-in status"),
+        "Custom Term": st.column_config.SelectboxColumn(options=CUSTOM_TERMS),
+        "Custom $": st.column_config.NumberColumn(min_value=0.0, step=10.0, format="$%.2f"),
+        "Device Pmt": st.column_config.NumberColumn(min_value=0.0, format="$%.2f"),
+        "Line Total": st.column_config.NumberColumn(format="$%.2f"),
+    }, ["Plan", "Tier", "Term", "Line Total"], 4)
+
+    with st.expander("Bulk edit selected lines"):
+        field = st.selectbox("Field", ["Promo", "Protection", "Add-ons", "Device Payment", "BYOD", "Port-In"], key="bulk_field")
+        if field == "Promo": val = st.selectbox("Select Promo", promo_names, key="bulk_promo")
+        elif field == "Protection": val = st.selectbox("Protection", prot_opts, key="bulk_prot")
+        elif field == "Add-ons": val = st.multiselect("My Biz Add-ons", list(cat.addons), key="bulk_addons")
+        elif field == "Device Payment": val = st.number_input("Monthly Device Payment ($)", min_value=0.0, key="bulk_dp")
+        else: val = st.toggle(field, key="bulk_flag")
+        if st.button("Apply to selected", key="bulk_apply_4", disabled=not st.session_state.selected_lines):
+            rules, skipped, selected = _feature_rules(lines), 0, _selected(lines)
+            for i in selected:
+                l = lines[i]
+                if field == "Promo": l['promo_selection'] = val
+                elif field == "Protection": l["vbis" if l['type'] == "Internet" else "protection"] = val
+                elif field == "Add-ons": l['features'] = list(val)
+                elif field == "Device Payment": l['dev_pay'] = val
+                elif field == "BYOD": l['byod'] = val
+                else: l['port_in'] = val
+                skipped += rules(l)
+            st.session_state.bulk_note = f"Applied to {len(selected)} lines" + (f"; {skipped} not eligible were reset" if skipped else "")
+            _bump(); st.rerun()
+        if 'bulk_note' in st.session_state: st.caption(st.session_state.pop('bulk_note'))
+
+    _commit(lines, idxs, edited, _feature_fields, _feature_rules(lines))
@@ -0,0 +1,178 @@
+import codecs
+import csv
+import io
+import math
+import zipfile
+
+import engine
+from catalogs import get_catalog
+
+# Bulk line import for step 1. Rows are read one at a time from CSV or XLSX
+# (openpyxl in read-only mode), checked against the catalog and turned into
+# the same line dicts the wizard builds, so a 5,000-line fleet file never sits
+# in memory as a table. Every problem is collected, with its spreadsheet row
+# number, instead of stopping at the first bad row.
+#
+# Columns (header names are case-insensitive, blank cells take the wizard's
+# defaults, list cells are separated by ";"):
+#   type, plan, features, sp_features, protection, vbis, promo, byod, port_in,
+#   dev_pay, intro_disc, custom_promo_val, custom_promo_term
+COLUMNS = ("type", "plan", "features", "sp_features", "protection", "vbis", "promo_selection", "byod", "port_in",
+           "dev_pay", "intro_disc", "custom_promo_val", "custom_promo_term")
+ALIASES = {"promo": "promo_selection", "device_category": "type", "category": "type", "device_payment": "dev_pay",
+           "add-ons": "features", "addons": "features", "smartphone_features": "sp_features", "port-in": "port_in"}
+TRUE = {"1", "true", "yes", "y", "x"}
+FALSE = {"", "0", "false", "no", "n"}
+MAX_ERRORS = 500 # problems kept for display; the count keeps going
+
+
+class LineImportError(ValueError):
+    pass
+
+
+def _column(name):
+    key = str(name or "").strip().lower().replace(" ", "_")
+    return ALIASES.get(key, key)
+
+
+def _cell(v):
+    if v is None: return ""
+    if isinstance(v, bool): return "true" if v else "false"
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v).strip()
+
+
+def _csv_rows(f):
+    text = codecs.getreader("utf-8-sig")(f) if not isinstance(f, io.TextIOBase) else f
+    yield from csv.reader(text)
+
+
+def _xlsx_rows(f):
+    try: from openpyxl import load_workbook
+    except ImportError: raise LineImportError("XLSX import needs the openpyxl package; upload a CSV instead") from None
+    wb = load_workbook(f, read_only=True, data_only=True)
+    try: yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally: wb.close()
+
+
+def read_rows(f, filename):
+    # Yields (spreadsheet row number, {column: text}) for each non-blank row.
+    rows = _xlsx_rows(f) if filename.lower().endswith(".xlsx") else _csv_rows(f)
+    header = [_column(c) for c in next(rows, [])]
+    unknown = [c for c in header if c and c not in COLUMNS]
+    if unknown: raise LineImportError(f"unknown column(s): {', '.join(unknown)}; expected {', '.join(COLUMNS)}")
+    if "type" not in header and "plan" not in header: raise LineImportError("the header row needs at least a 'type' or 'plan' column")
+    for n, row in enumerate(rows, start=2):
+        vals = {c: _cell(v) for c, v in zip(header, row) if c}
+        if any(vals.values()): yield n, vals
+
+
+class _Checker:
+    # Catalog lookups for one import, so each row is a handful of set/dict hits.
+    def __init__(self, cat):
+        self.cat = cat
+        self.plans = {t: cat.plans_by_type[t] for t in engine.DEVICE_TYPES}
+        self.promos = {}
+
+    def eligible(self, tier, byod, port_in):
+        key = (tier, byod, port_in)
+        if key not in self.promos: self.promos[key] = {p['name'] for p in self.cat.eligible_promos(tier, byod, port_in)}
+        return self.promos[key]
+
+    def line(self, vals):
+        # Returns (line, [(column, problem), ...]).
+        cat, problems = self.cat, []
+        line = engine.new_line()
+
+        def flag(col):
+            v = vals.get(col, "").lower()
+            if v in TRUE: return True
+            if v not in FALSE: problems.append((col, f"expected yes/no, got {vals[col]!r}"))
+            return False
+
+        def number(col):
+            v = vals.get(col, "").replace("$", "").replace(",", "")
+            if not v: return 0.0
+            try: x = float(v)
+            except ValueError: x = -1.0
+            if not 0 <= x < math.inf: # also "nan" and "inf", which float() accepts
+                problems.append((col, f"expected a non-negative amount, got {vals[col]!r}"))
+                return 0.0
+            return x
+
+        def names(col, allowed):
+            got = [v.strip() for v in vals.get(col, "").split(";") if v.strip()]
+            bad = [v for v in got if v not in allowed]
+            if bad: problems.append((col, f"not in the catalog: {', '.join(bad)}"))
+            return [v for v in allowed if v in got]
+
+        dtype = vals.get("type") or "Smartphone"
+        if dtype not in self.plans:
+            problems.append(("type", f"must be one of {', '.join(engine.DEVICE_TYPES)}, got {dtype!r}"))
+            return line, problems
+        plan = vals.get("plan") or (line['plan'] if dtype == "Smartphone" else self.plans[dtype][0])
+        if plan not in self.plans[dtype]:
+            problems.append(("plan", f"{plan!r} is not a {dtype} plan"))
+            return line, problems
+        line.update(type=dtype, plan=plan, byod=flag("byod"), port_in=flag("port_in"), dev_pay=number("dev_pay"))
+
+        line['features'] = names("features", cat.addons)
+        if line['features'] and plan != "My Biz": problems.append(("features", "add-ons are only available on My Biz"))
+        line['sp_features'] = names("sp_features", cat.smartphone_features)
+        if line['sp_features'] and dtype != "Smartphone": problems.append(("sp_features", "smartphone features need a Smartphone line"))
+        if plan == "My Biz" and "VBMIS (Paid)" in line['sp_features']: problems.append(("sp_features", "VBMIS (Paid) is not available on My Biz"))
+        line['intro_disc'] = flag("intro_disc")
+        if line['intro_disc'] and plan != "My Biz": problems.append(("intro_disc", "the intro discount is only for My Biz"))
+
+        prot, vbis = vals.get("protection") or "None", vals.get("vbis") or "None"
+        if dtype == "Internet":
+            # The step 4 table has one Protection column, so VBIS may arrive there.
+            if vbis == "None" and prot in cat.vbis_prot: vbis, prot = prot, "None"
+            if vbis not in cat.vbis_prot: problems.append(("vbis", f"{vbis!r} is not a VBIS option"))
+            if prot != "None": problems.append(("protection", "Internet lines take VBIS, not device protection"))
+            line['vbis'] = vbis if vbis in cat.vbis_prot else "None"
+        else:
+            if prot != "None" and prot not in cat.single_prot: problems.append(("protection", f"{prot!r} is not a protection option"))
+            if vbis != "None": problems.append(("vbis", "VBIS is only for Internet lines"))
+            line['protection'] = prot if prot in cat.single_prot else "None"
+
+        promo = vals.get("promo_selection") or "None"
+        if promo == "Custom":
+            line['custom_promo_val'] = number("custom_promo_val")
+            term = vals.get("custom_promo_term") or "36 Months"
+            if term not in engine.CUSTOM_TERMS: problems.append(("custom_promo_term", f"must be one of {', '.join(engine.CUSTOM_TERMS)}"))
+            else: line['custom_promo_term'] = term
+        elif promo != "None":
+            tier = engine.price_line(line, 0, engine.ACCOUNT_DEFAULTS, cat)['tier']
+            if promo not in cat.promo_by_name: problems.append(("promo_selection", f"unknown promo {promo!r}"))
+            elif promo not in self.eligible(tier, line['byod'], line['port_in']):
+                problems.append(("promo_selection", f"{promo!r} is not available for a {tier}-tier line with BYOD={line['byod']}, port-in={line['port_in']}"))
+                promo = "None"
+        line['promo_selection'] = promo if promo in ("None", "Custom") or promo in cat.promo_by_name else "None"
+        return line, problems
+
+
+def import_lines(f, filename, cat=None):
+    """Parses an uploaded CSV/XLSX into wizard lines.
+
+    Returns {"lines", "rows", "bad_rows", "errors", "error_count"}; `lines` holds
+    only the valid rows and `errors` the first MAX_ERRORS (row, column, problem)
+    entries. A file-level problem (unreadable, bad header) raises LineImportError.
+    """
+    check = _Checker(cat or get_catalog())
+    lines, errors = [], []
+    rows = bad_rows = error_count = 0
+    try:
+        for n, vals in read_rows(f, filename):
+            rows += 1
+            line, problems = check.line(vals)
+            if problems:
+                bad_rows += 1
+                error_count += len(problems)
+                errors.extend((n, col, msg) for col, msg in problems[:max(0, MAX_ERRORS - len(errors))])
+            else:
+                lines.append(line)
+    except LineImportError: raise
+    except (UnicodeDecodeError, csv.Error, zipfile.BadZipFile, ValueError, KeyError, OSError) as e:
+        raise LineImportError(f"could not read {filename}: {e}") from e
+    return {"lines": lines, "rows": rows, "bad_rows": bad_rows, "errors": errors, "error_count": error_count}
@@ -0,0 +1,163 @@
+import sys
+import threading
+from collections.abc import Mapping, MutableMapping
+
+from catalogs import get_catalog
+
+# Compact records for quote lines and their priced details. Both are slotted
+# objects that still behave as mappings (l['plan'], l.get(...), dict(l),
+# l.update(...)), so the engine, editors, store and PDF code read them exactly
+# like the dicts they replace, at a fraction of the memory:
+#   - names (type, plan, protection, promo, ...) are interned, so every line
+#     on "My Biz" points at one string instead of holding its own
+#   - features / sp_features are bitsets over a process-wide name registry
+#     and come back as lists, in catalog order, when read
+#   - formatted add-on / protection labels on details are shared tuples
+FIELDS = ("type", "plan", "features", "sp_features", "protection", "vbis", "dev_pay", "intro_disc",
+          "promo_selection", "custom_promo_term", "byod", "port_in")
+DEFAULTS = {"type": "Smartphone", "plan": "My Biz", "features": [], "sp_features": [], "protection": "None", "vbis": "None",
+            "dev_pay": 0.0, "intro_disc": False, "promo_selection": "None", "custom_promo_term": "36 Months", "byod": False, "port_in": False}
+OPTIONAL = ("custom_promo_val",) # only present once set, as on the old dicts
+ROW = FIELDS + OPTIONAL
+_SETS = frozenset(("features", "sp_features"))
+_SCALARS = frozenset(FIELDS + OPTIONAL) - _SETS
+DECODED_LIMIT = 4096
+
+_lock = threading.Lock()
+_names = [] # bit i <-> _names[i]; append-only so stored bitsets never change meaning
+_bit = {}
+_decoded = {} # bitset -> tuple of names
+
+
+def _register(name):
+    with _lock:
+        # Seeded with the catalog's order so lists read back in that order.
+        seed = () if _names else (*get_catalog().addons, *get_catalog().smartphone_features)
+        for n in (*seed, name):
+            if n not in _bit:
+                _bit[n] = len(_names)
+                _names.append(sys.intern(n))
+        return _bit[name]
+
+
+def encode(names):
+    bits = 0
+    for n in names:
+        i = _bit.get(n)
+        bits |= 1 << (i if i is not None else _register(n))
+    return bits
+
+
+def decode(bits):
+    names = _decoded.get(bits)
+    if names is None:
+        if len(_decoded) >= DECODED_LIMIT: _decoded.clear()
+        names = _decoded[bits] = tuple(n for i, n in enumerate(_names) if bits >> i & 1)
+    return names
+
+
+class Line(MutableMapping):
+    __slots__ = ("type", "plan", "_features", "_sp_features", "protection", "vbis", "dev_pay", "intro_disc",
+                 "promo_selection", "custom_promo_term", "byod", "port_in", "custom_promo_val", "_extra")
+
+    def __init__(self, data=(), **kw):
+        self._extra = None
+        for k, v in DEFAULTS.items(): self[k] = v
+        self.update(data, **kw)
+
+    def __getitem__(self, key):
+        if key in _SETS: return list(decode(getattr(self, "_" + key)))
+        try:
+            if key in _SCALARS: return getattr(self, key)
+            return self._extra[key]
+        except (AttributeError, KeyError, TypeError): raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        if key in _SCALARS: return getattr(self, key, default)
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        if key in _SETS: setattr(self, "_" + key, encode(value))
+        elif key in _SCALARS: setattr(self, key, sys.intern(value) if type(value) is str else value)
+        else:
+            if self._extra is None: self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in OPTIONAL and hasattr(self, key): delattr(self, key)
+        elif self._extra and key in self._extra: del self._extra[key]
+        else: raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in _SETS or key in DEFAULTS: return True
+        if key in OPTIONAL: return hasattr(self, key)
+        return bool(self._extra) and key in self._extra
+
+    def __iter__(self):
+        yield from FIELDS
+        for k in OPTIONAL:
+            if hasattr(self, k): yield k
+        if self._extra: yield from self._extra
+
+    def __len__(self):
+        return len(FIELDS) + sum(hasattr(self, k) for k in OPTIONAL) + len(self._extra or ())
+
+    def __reduce__(self):
+        return Line, (dict(self),)
+
+    def __repr__(self):
+        return f"Line({dict(self)!r})"
+
+    def copy(self):
+        return Line(self)
+
+    def row(self):
+        # Every field in ROW order in one call, sets as shared decoded tuples.
+        return (self.type, self.plan, decode(self._features), decode(self._sp_features), self.protection, self.vbis,
+                self.dev_pay, self.intro_disc, self.promo_selection, self.custom_promo_term, self.byod, self.port_in,
+                getattr(self, "custom_promo_val", 0.0))
+
+
+def row(l):
+    # The pricing engine's view of a line, a Line or a plain dict: the ROW
+    # fields as a tuple, with the wizard's defaults for anything missing.
+    if type(l) is Line: return l.row()
+    g = l.get
+    return (g('type', "Smartphone"), g('plan', "My Biz"), tuple(g('features', ())), tuple(g('sp_features', ())),
+            g('protection', "None"), g('vbis', "None"), g('dev_pay', 0.0), g('intro_disc', False), g('promo_selection', "None"),
+            g('custom_promo_term', "36 Months"), g('byod', False), g('port_in', False), g('custom_promo_val', 0.0))
+
+
+def compact(lines):
+    # Lines loaded from JSON or the quote store become Line records.
+    return [l if isinstance(l, Line) else Line(l) for l in lines]
+
+
+DETAIL_FIELDS = ("base", "ap_disc", "mil_disc", "intro_disc", "dev_pay", "extras_list", "prot_list", "promo_credit",
+                 "promo_name", "promo_term", "promo_val", "byod", "port_in", "total", "tier")
+_DETAIL_SET = frozenset(DETAIL_FIELDS)
+
+
+class LineDetail(Mapping):
+    """One priced line, as returned by engine.price_line(); read-only."""
+    __slots__ = DETAIL_FIELDS
+
+    def __init__(self, base, ap_disc, mil_disc, intro_disc, dev_pay, extras_list, prot_list, promo_credit,
+                 promo_name, promo_term, promo_val, byod, port_in, total, tier):
+        self.base, self.ap_disc, self.mil_disc, self.intro_disc, self.dev_pay = base, ap_disc, mil_disc, intro_disc, dev_pay
+        self.extras_list, self.prot_list, self.promo_credit = extras_list, prot_list, promo_credit
+        self.promo_name, self.promo_term, self.promo_val = promo_name, promo_term, promo_val
+        self.byod, self.port_in, self.total, self.tier = byod, port_in, total, tier
+
+    def __getitem__(self, key):
+        if key in _DETAIL_SET: return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(DETAIL_FIELDS)
+
+    def __len__(self):
+        return len(DETAIL_FIELDS)
+
+    def __repr__(self):
+        return f"LineDetail({dict(self)!r})"
@@ -0,0 +1,311 @@
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+# Quotes and stage metrics from simulated sessions go to a scratch directory
+# unless the environment already says otherwise. This has to happen before app
+# modules (metrics, quote_store) are imported, here and in every session process.
+if "QUOTE_LOADTEST_DIR" not in os.environ: os.environ["QUOTE_LOADTEST_DIR"] = tempfile.mkdtemp(prefix="quote-loadtest-")
+os.environ.setdefault("QUOTE_DB", os.path.join(os.environ["QUOTE_LOADTEST_DIR"], "quotes.db"))
+os.environ.setdefault("QUOTE_METRICS", "1")
+os.environ.setdefault("QUOTE_METRICS_DIR", os.path.join(os.environ["QUOTE_LOADTEST_DIR"], "metrics"))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+import bench  # noqa: E402
+import metrics  # noqa: E402
+from catalogs import get_catalog  # noqa: E402
+
+# Concurrent-session load test for the wizard, fully offline.
+#
+#   python loadtest.py                          # 1, 2, 4 and 8 concurrent reps
+#   python loadtest.py -n 16 --lines 150        # one level, large fleets
+#   python loadtest.py -n 1,4,16 --cpus 1       # sessions sharing one core
+#   python loadtest.py -n 1,8,32 --think 2      # reps pausing ~2 s between clicks
+#
+# Every simulated rep drives its own AppTest session through steps 1-5: a
+# quote of LINES lines with a realistic plan mix (what a rep would type into
+# the step 2 table), bulk edits in steps 2 and 4, account options in step 3,
+# an optimizer run for some reps, the sale details in step 5 and the PDF.
+# Each click's rerun is timed and filed under the step it happened on ("pdf"
+# is the wait for the rendered quote). Per level the report has latency
+# percentiles per step, throughput, CPU and RSS per session and, from the
+# QUOTE_METRICS stage timings, where rerun time went. Across levels, the step
+# whose p50 first grows past SATURATION x its p50 at the first level is the
+# one that saturates first.
+#
+# AppTest keeps per-run state in process globals, so each session runs in its
+# own process; they share the CPUs, the quote database and the disk. A real
+# server runs every session in one process under one GIL, which --cpus 1
+# approximates. Latencies include AppTest's element-tree parsing, which a
+# browser session doesn't pay, so read them relative to each other and to the
+# first level.
+LEVELS = (1, 2, 4, 8)
+LINE_MIX = (3, 8, 15, 40, 100)
+STEPS = ("step 1", "step 2", "step 3", "step 4", "step 5", "pdf")
+SATURATION = 2.0
+TIMEOUT = 300 # seconds a single rerun may take before the session fails
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+# --- SIMULATED REP ---
+class Rep:
+    def __init__(self, rid, seed, lines, think, optimize):
+        self.rid = rid
+        self.rng = random.Random(f"{seed}-{rid}")
+        self.n_lines = self.rng.choice(lines)
+        self.think = think
+        self.optimize = optimize
+        self.samples = [] # (step, seconds)
+        self.error = None
+
+    def _act(self, step, fn):
+        t = time.perf_counter()
+        fn()
+        self.samples.append((step, time.perf_counter() - t))
+        if self.at.exception: raise RuntimeError(f"{step}: {self.at.exception[0].value}")
+        if self.think: time.sleep(self.rng.uniform(0.5, 1.5) * self.think)
+
+    def _click(self, label=None, key=None):
+        b = self.at.button(key) if key else next(b for b in self.at.button if b.label == label)
+        return b.click().run()
+
+    def run(self):
+        try: self.walk()
+        except Exception as e: self.error = f"{type(e).__name__}: {e}"
+
+    def walk(self):
+        rng, cat = self.rng, get_catalog()
+        self.at = at = AppTest.from_file(APP, default_timeout=TIMEOUT)
+        self._act("step 1", at.run)
+        at.number_input[0].set_value(self.n_lines)
+        self._act("step 1", lambda: self._click("Start Quote"))
+
+        # Step 2: the rep's per-line plan choices, then a bulk plan change for
+        # every smartphone line.
+        at.session_state.lines = [bench.synthetic_line(rng, cat, "bare", "none") for _ in range(self.n_lines)]
+        self._act("step 2", lambda: at.selectbox(key="flt_type_2").set_value("Smartphone").run())
+        self._act("step 2", lambda: self._click(key="sel_all_2"))
+        self._act("step 2", lambda: at.selectbox(key="bulk_plan").set_value(rng.choice(list(cat.smartphone_tiers))).run())
+        self._act("step 2", lambda: self._click(key="bulk_apply_2"))
+        self._act("step 2", lambda: self._click("Next"))
+
+        # Step 3: autopay, and the biggest Multi-Device bracket half the time.
+        self._act("step 3", lambda: at.toggle[0].set_value(True).run())
+        multi = next(s for s in at.selectbox if s.label.startswith("Multi-Device Protection"))
+        if len(multi.options) > 1 and rng.random() < 0.5: self._act("step 3", lambda: multi.set_value(multi.options[-1]).run())
+        self._act("step 3", lambda: self._click("Next"))
+
+        # Step 4: add-ons and a device payment on the selected smartphones.
+        self._act("step 4", lambda: at.selectbox(key="bulk_field").set_value("Add-ons").run())
+        self._act("step 4", lambda: at.multiselect(key="bulk_addons").set_value(rng.sample(list(cat.addons), rng.randint(1, 3))).run())
+        self._act("step 4", lambda: self._click(key="bulk_apply_4"))
+        self._act("step 4", lambda: at.selectbox(key="bulk_field").set_value("Device Payment").run())
+        self._act("step 4", lambda: at.number_input(key="bulk_dp").set_value(round(rng.uniform(15, 45), 2)).run())
+        self._act("step 4", lambda: self._click(key="bulk_apply_4"))
+        if rng.random() < self.optimize: self._act("step 4", lambda: self._click(key="opt_run"))
+        self._act("step 4", lambda: self._click("Review & Export"))
+
+        # Step 5: sale details, then wait for the PDF.
+        self._act("step 5", lambda: at.text_input(key="biz_name").set_value(f"Load Test {self.rid}").run())
+        self._act("step 5", lambda: at.text_input(key="rep_name").set_value(f"Rep {self.rid}").run())
+        self._act("step 5", lambda: at.number_input(key="act_cnt").set_value(self.n_lines).run())
+        if any(b.label == "📄 Generate PDF Quote" for b in at.button): self._act("pdf", lambda: self._click("📄 Generate PDF Quote"))
+        else: self._act("pdf", at.run)
+        if not at.get("download_button"): raise RuntimeError("pdf: no download button after rendering")
+
+
+# --- SESSION PROCESS ---
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError: # not Linux: peak RSS so far is the best available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _rss_bytes()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval): self.peak = max(self.peak, _rss_bytes())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return max(self.peak, _rss_bytes())
+
+
+def _cpu_seconds():
+    r = resource.getrusage(resource.RUSAGE_SELF)
+    return r.ru_utime + r.ru_stime
+
+
+def _quiet():
+    # Reps set widget values outside a script run, which Streamlit warns about
+    # on every walk; a filter survives Streamlit resetting its log levels.
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        lambda rec: "missing ScriptRunContext" not in rec.getMessage())
+
+
+def session(rid, seed, lines, think, optimize, delay, start, results):
+    # One rep in its own process. Imports, the catalog and Streamlit's first
+    # script runs happen in a warm-up walk before the start barrier.
+    _quiet()
+    warm = Rep("warm-up", seed, [min(lines)], 0.0, 0.0)
+    warm.run()
+    rep = Rep(rid, seed, lines, think, optimize)
+    stages, rss, cpu = metrics.totals(), _rss_bytes(), _cpu_seconds()
+    sampler = RssSampler()
+    sampler.start()
+    start.wait()
+    time.sleep(delay)
+    rep.run()
+    rss_peak = sampler.stop()
+    results.put({
+        "rid": rid, "lines": rep.n_lines, "samples": rep.samples, "error": rep.error or warm.error,
+        "cpu_s": _cpu_seconds() - cpu, "rss_mb": rss_peak / 2**20, "rss_growth_mb": (rss_peak - rss) / 2**20,
+        "stages": {k: (c - stages.get(k, (0, 0.0))[0], s - stages.get(k, (0, 0.0))[1]) for k, (c, s) in metrics.totals().items()},
+    })
+
+
+# --- ONE LEVEL ---
+def _percentile(sorted_vals, pct):
+    return sorted_vals[min(len(sorted_vals) - 1, int(round(pct / 100 * (len(sorted_vals) - 1))))]
+
+
+def run_level(n, seed, lines, think, optimize, ramp):
+    ctx = multiprocessing.get_context("spawn")
+    start, results = ctx.Barrier(n + 1), ctx.Queue()
+    procs = [ctx.Process(target=session, args=(i, seed, lines, think, optimize, ramp * i / n, start, results), name=f"rep-{i}")
+             for i in range(n)]
+    for p in procs: p.start()
+    start.wait()
+    wall = time.perf_counter()
+    reps = [results.get() for _ in procs]
+    wall = time.perf_counter() - wall
+    for p in procs: p.join()
+    reps.sort(key=lambda r: r["rid"])
+
+    by_step, stages = {}, {}
+    for r in reps:
+        for step, secs in r["samples"]: by_step.setdefault(step, []).append(secs * 1000)
+        for name, (calls, secs) in r["stages"].items():
+            if not calls: continue
+            s = stages.setdefault(name, {"calls": 0, "ms": 0.0})
+            s["calls"] += calls
+            s["ms"] += secs * 1000
+    steps = {}
+    for step in STEPS:
+        vals = sorted(by_step.get(step, ()))
+        if vals: steps[step] = {"reruns": len(vals), "p50_ms": _percentile(vals, 50), "p95_ms": _percentile(vals, 95),
+                                "p99_ms": _percentile(vals, 99), "max_ms": vals[-1]}
+    completed = sum(r["error"] is None for r in reps)
+    cpu = sum(r["cpu_s"] for r in reps)
+    return {
+        "sessions": n, "completed": completed, "errors": [f"rep {r['rid']}: {r['error']}" for r in reps if r["error"]],
+        "lines": [r["lines"] for r in reps], "wall_s": wall,
+        "reruns_per_s": sum(len(r["samples"]) for r in reps) / wall, "sessions_per_min": completed * 60 / wall,
+        "cpu_s": cpu, "cpu_s_per_session": cpu / n, "cpu_cores": cpu / wall,
+        "rss_mb_per_session": sum(r["rss_mb"] for r in reps) / n,
+        "rss_growth_mb_per_session": sum(r["rss_growth_mb"] for r in reps) / n,
+        "steps": steps, "stages": stages,
+    }
+
+
+# --- REPORT ---
+def saturation(levels, threshold):
+    # (step, ratio, sessions) for the first level at which each step's p50 is
+    # threshold x its p50 at the first level, earliest and worst first.
+    base = levels[0]["steps"]
+    hits = []
+    for step in STEPS:
+        if step not in base or base[step]["p50_ms"] <= 0: continue
+        for lv in levels[1:]:
+            ratio = lv["steps"].get(step, {}).get("p50_ms", 0.0) / base[step]["p50_ms"]
+            if ratio >= threshold:
+                hits.append((step, ratio, lv["sessions"]))
+                break
+    return sorted(hits, key=lambda h: (h[2], -h[1]))
+
+
+def print_level(lv, cpus):
+    print(f"\n{lv['sessions']} concurrent session(s), {lv['completed']} completed in {lv['wall_s']:.1f} s · "
+          f"{lv['reruns_per_s']:.1f} reruns/s · {lv['sessions_per_min']:.1f} sessions/min")
+    print(f"  CPU {lv['cpu_cores']:.2f} of {cpus} core(s), {lv['cpu_s_per_session']:.2f} s/session · "
+          f"RSS {lv['rss_mb_per_session']:.0f} MB per session process, +{lv['rss_growth_mb_per_session']:.1f} MB during the walk")
+    if lv["cpu_cores"] >= 0.9 * cpus: print("  every core is busy: added sessions queue for CPU")
+    for e in lv["errors"]: print(f"  ERROR {e}")
+    for step, s in lv["steps"].items():
+        print(f"  {step:8s} {s['reruns']:6d} reruns  p50 {s['p50_ms']:9.1f} ms  p95 {s['p95_ms']:9.1f} ms  p99 {s['p99_ms']:9.1f} ms  max {s['max_ms']:9.1f} ms")
+    total = sum(s["ms"] for s in lv["stages"].values())
+    if total:
+        top = sorted(lv["stages"].items(), key=lambda kv: -kv[1]["ms"])[:6]
+        print("  rerun time by stage: " + " · ".join(f"{k} {v['ms'] / total:.0%}" for k, v in top))
+
+
+def print_summary(levels, threshold):
+    if len(levels) < 2: return
+    print("\np50 ms by concurrent sessions")
+    print(f"  {'':8s}" + "".join(f"{lv['sessions']:>10d}" for lv in levels))
+    for step in STEPS:
+        print(f"  {step:8s}" + "".join(f"{lv['steps'].get(step, {}).get('p50_ms', float('nan')):10.1f}" for lv in levels))
+    hits = saturation(levels, threshold)
+    if not hits:
+        print(f"\nno step's p50 reached {threshold:g}x its {levels[0]['sessions']}-session value")
+        return
+    step, ratio, n = hits[0]
+    print(f"\nsaturates first: {step} (p50 {ratio:.1f}x at {n} sessions)")
+    for step, ratio, n in hits[1:]: print(f"  then {step} ({ratio:.1f}x at {n} sessions)")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Simulate concurrent reps walking the quote wizard.")
+    ap.add_argument("-n", "--sessions", default=",".join(map(str, LEVELS)), help="concurrent sessions; a comma list runs each level in turn")
+    ap.add_argument("--lines", default=",".join(map(str, LINE_MIX)), help="line counts each rep's quote is drawn from")
+    ap.add_argument("--think", type=float, default=0.0, help="mean seconds a rep pauses between clicks")
+    ap.add_argument("--ramp", type=float, default=0.0, help="seconds over which a level's sessions start")
+    ap.add_argument("--optimize", type=float, default=0.3, help="share of reps who run the step 4 optimizer")
+    ap.add_argument("--cpus", type=int, help="pin the sessions to this many cores (Linux)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--saturation", type=float, default=SATURATION, help="p50 growth vs the first level that counts as saturated")
+    ap.add_argument("-o", "--out", default="loadtest_results.json")
+    args = ap.parse_args(argv)
+
+    sessions = [int(n) for n in args.sessions.split(",")]
+    lines = [int(n) for n in args.lines.split(",")]
+    if args.cpus: os.sched_setaffinity(0, sorted(os.sched_getaffinity(0))[:args.cpus])
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    levels = []
+    for n in sessions:
+        levels.append(run_level(n, args.seed, lines, args.think, args.optimize, args.ramp))
+        print_level(levels[-1], cpus)
+    print_summary(levels, args.saturation)
+
+    doc = {
+        "meta": {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "machine": platform.machine(), "cpus": cpus, "catalog": get_catalog().version,
+                 "args": vars(args), "stage_metrics": metrics.ENABLED},
+        "levels": levels,
+        "saturation": [{"step": s, "ratio": r, "sessions": n} for s, r, n in saturation(levels, args.saturation)],
+    }
+    if args.out:
+        with open(args.out, "w") as f: json.dump(doc, f, indent=2)
+    return 1 if any(lv["errors"] for lv in levels) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
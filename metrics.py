@@ -0,0 +1,159 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Optional per-rerun instrumentation, enabled with QUOTE_METRICS=1 before the
+# server starts. When disabled, timed() hands back the undecorated function and
+# stage() a shared null context, so instrumented code pays nothing.
+#
+# Each rerun's stage timings are appended to $QUOTE_METRICS_DIR/reruns.jsonl and
+# process-wide totals are kept in quote_wizard.prom (Prometheus text format).
+ENABLED = os.environ.get("QUOTE_METRICS", "") not in ("", "0")
+METRICS_DIR = os.environ.get("QUOTE_METRICS_DIR", "metrics")
+
+_local = threading.local()
+_lock = threading.Lock()
+_totals = {} # stage -> [calls, seconds], process-wide
+_reruns = 0
+_null = contextlib.nullcontext()
+
+
+class Rerun:
+    def __init__(self, session, label):
+        self.session = session
+        self.label = label
+        self.start = self.last = time.perf_counter()
+        self.stages = {}
+        self.flushed = False
+
+    def add(self, name, elapsed):
+        # Work handed to another thread (see recording()) can finish after the
+        # rerun was written; its time then only goes into the totals.
+        with _lock:
+            if self.flushed:
+                _add_totals(name, 1, elapsed)
+                return
+            s = self.stages.setdefault(name, [0, 0.0])
+            s[0] += 1
+            s[1] += elapsed
+            self.last = time.perf_counter()
+
+    def as_dict(self, interrupted=False):
+        return {
+            "ts": time.time(), "session": self.session, "label": self.label,
+            "wall_ms": round((self.last - self.start) * 1000, 3), "interrupted": interrupted,
+            "stages": {k: {"calls": c, "ms": round(t * 1000, 3)} for k, (c, t) in self.stages.items()},
+        }
+
+
+def timed(name):
+    def deco(fn):
+        if not ENABLED: return fn
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rec = getattr(_local, "rerun", None)
+            if rec is None: return fn(*args, **kwargs)
+            t = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: rec.add(name, time.perf_counter() - t)
+        return wrapper
+    return deco
+
+
+@contextlib.contextmanager
+def _stage(rec, name):
+    t = time.perf_counter()
+    try: yield
+    finally: rec.add(name, time.perf_counter() - t)
+
+
+def stage(name):
+    if not ENABLED: return _null
+    rec = getattr(_local, "rerun", None)
+    return _null if rec is None else _stage(rec, name)
+
+
+def current():
+    # The rerun being recorded on this thread, for work it hands to another one.
+    return getattr(_local, "rerun", None) if ENABLED else None
+
+
+@contextlib.contextmanager
+def _recording(rec):
+    prev = getattr(_local, "rerun", None)
+    _local.rerun = rec
+    try: yield
+    finally: _local.rerun = prev
+
+
+def recording(rec):
+    # Records stages on this thread (a pool thread, say) into `rec` from current().
+    return _null if rec is None else _recording(rec)
+
+
+def begin_rerun(session, label, previous=None):
+    # Reruns cut short by st.rerun() never reach end_rerun(); the caller passes
+    # the last Rerun back in so it is flushed (as interrupted) here instead.
+    if not ENABLED: return None
+    if previous is not None and not previous.flushed: _flush(previous, interrupted=True)
+    _local.rerun = Rerun(session, label)
+    return _local.rerun
+
+
+def end_rerun():
+    if not ENABLED: return None
+    rec = getattr(_local, "rerun", None)
+    _local.rerun = None
+    if rec is not None: _flush(rec)
+    return rec
+
+
+def _flush(rec, interrupted=False):
+    global _reruns
+    with _lock:
+        rec.flushed = True
+        line = json.dumps(rec.as_dict(interrupted))
+        _reruns += 1
+        for name, (calls, secs) in rec.stages.items(): _add_totals(name, calls, secs)
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(os.path.join(METRICS_DIR, "reruns.jsonl"), "a") as f: f.write(line + "\n")
+        _write_prometheus()
+
+
+def _add_totals(name, calls, secs):
+    t = _totals.setdefault(name, [0, 0.0])
+    t[0] += calls
+    t[1] += secs
+
+
+def totals():
+    # Process-wide {stage: (calls, seconds)} so far.
+    with _lock: return {k: tuple(v) for k, v in _totals.items()}
+
+
+def prometheus_text():
+    out = [
+        "# HELP quote_wizard_reruns_total Script reruns recorded.",
+        "# TYPE quote_wizard_reruns_total counter",
+        f"quote_wizard_reruns_total {_reruns}",
+        "# HELP quote_wizard_stage_calls_total Calls per instrumented stage.",
+        "# TYPE quote_wizard_stage_calls_total counter",
+    ]
+    out += [f'quote_wizard_stage_calls_total{{stage="{k}"}} {c}' for k, (c, _) in sorted(_totals.items())]
+    out += [
+        "# HELP quote_wizard_stage_seconds_total Time spent per instrumented stage.",
+        "# TYPE quote_wizard_stage_seconds_total counter",
+    ]
+    out += [f'quote_wizard_stage_seconds_total{{stage="{k}"}} {s:.6f}' for k, (_, s) in sorted(_totals.items())]
+    return "\n".join(out) + "\n"
+
+
+def _write_prometheus():
+    # Per-process temp name: several server processes may share METRICS_DIR.
+    path = os.path.join(METRICS_DIR, "quote_wizard.prom")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f: f.write(prometheus_text())
+    os.replace(tmp, path)
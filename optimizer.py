@@ -0,0 +1,176 @@
+import functools
+
+import engine
+
+# Finds the cheapest way to configure an account's existing lines. What the rep
+# already picked is treated as a requirement: line types, add-ons and
+# smartphone features are kept, and so is protection (by the line itself or by
+# an account-level plan that covers it; a line the account's plan covers today
+# takes the cheapest per-line protection in modes that leave it uncovered). The
+# search is over:
+#   - the plan of each smartphone line currently on one of `plans`
+#   - extra My Biz add-ons bought only to reach a higher promo tier
+#   - smartphone promos (Custom promos and other line types are left alone, and
+#     a promo is only swapped for one that gives up no credit, see _best_promo)
+#   - per-line protection vs Multi-Device Protection vs Whole Office Protect
+#
+# tier_idx couples the lines through the number of tiered smartphone plans,
+# so for each protection mode and each tier_idx the lines are priced
+# independently and a DP over "tiered lines so far" (capped at 5) picks the
+# cheapest assignment that actually produces that tier_idx.
+OBJECTIVES = {"mrc": "Monthly recurring charge", "36mo": "Total 36-month cost"}
+HORIZON = 36
+MY_BIZ_THRESHOLDS = (5, 15, 20) # extras_cost that lifts My Biz to Start / Plus / Pro
+
+
+def promo_credit(val, term, objective):
+    # Credit a promo is worth under the objective: per month for "mrc" (a
+    # one-time credit doesn't lower the MRC), received within HORIZON for "36mo".
+    if objective == "mrc": return 0.0 if term == "One-Time" else val / term
+    return val if term == "One-Time" else val * min(term, HORIZON) / term
+
+
+def line_cost(d, objective):
+    if objective == "mrc": return d['total']
+    return HORIZON * (d['total'] + d['promo_credit']) - promo_credit(d['promo_val'], d['promo_term'], objective)
+
+
+def quote_cost(quote, objective="mrc", cat=None):
+    line_details, mrc, _, _, acct_extras = engine.get_totals(quote, cat)
+    if objective == "mrc": return mrc
+    return sum(line_cost(d, objective) for d in line_details) + HORIZON * acct_extras
+
+
+def _promo_value(p, objective):
+    # (credit under the objective, one-time credit the objective leaves out)
+    once = p['value'] if objective == "mrc" and p['term'] == "One-Time" else 0.0
+    return promo_credit(p['value'], p['term'], objective), once
+
+
+@functools.lru_cache(maxsize=256)
+def _best_promo(cat, tier, byod, port_in, objective, current="None"):
+    # The line keeps its current promo unless another is at least as good on
+    # both counts of _promo_value and better on one, so "mrc" doesn't trade a
+    # one-time credit away for a monthly one; among those, the best credit wins.
+    promos = {p['name']: _promo_value(p, objective) for p in cat.eligible_promos(tier, byod, port_in)}
+    floor = promos.get(current, (0.0, 0.0))
+    name, best = current if current in promos else "None", floor
+    for n, v in promos.items():
+        if v[0] >= floor[0] and v[1] >= floor[1] and v > best: name, best = n, v
+    return name, best[0]
+
+
+@functools.lru_cache(maxsize=256)
+def _extra_bundles(cat, req_features, req_sp):
+    # Cheapest optional add-on sets that lift a My Biz line over each tier
+    # threshold: a subset-sum over the items it doesn't already have, in cents.
+    req_cost = sum(cat.addons[f] for f in req_features) + sum(cat.smartphone_features[f]['price'] for f in req_sp)
+    items = [("features", f, round(p * 100)) for f, p in cat.addons.items() if f not in req_features and p > 0]
+    items += [("sp_features", f, round(v['price'] * 100)) for f, v in cat.smartphone_features.items()
+              if f not in req_sp and f != "VBMIS (Paid)" and v['price'] > 0]
+    need = [max(0, round((t - req_cost) * 100)) for t in MY_BIZ_THRESHOLDS]
+    cap = max(need) + max((c for _, _, c in items), default=0)
+    reach = {0: ()}
+    for item in items:
+        for s, chosen in list(reach.items()):
+            if s + item[2] <= cap and s + item[2] not in reach: reach[s + item[2]] = chosen + (item,)
+    bundles = {(): None}
+    for n in need:
+        if n == 0: continue
+        s = min((s for s in reach if s >= n), default=None)
+        if s is not None: bundles[reach[s]] = None
+    return list(bundles)
+
+
+def _line_options(l, tier_idx, covered, ctx):
+    # Best (cost, fields) for the line on a tiered and on a non-tiered plan,
+    # given tier_idx and whether account-level protection covers it.
+    cat, opts, objective = ctx['cat'], ctx['opts'], ctx['objective']
+    plans = ctx['plans'] if l['type'] == "Smartphone" and l['plan'] in ctx['plans'] else (l['plan'],)
+    best = {True: None, False: None}
+    for plan in plans:
+        if plan != l['plan'] and plan == "My Biz" and "VBMIS (Paid)" in l['sp_features']: continue
+        if plan != "My Biz" and l['features']: continue
+        base = dict(l, plan=plan, intro_disc=l['intro_disc'] and plan == "My Biz" and not opts['military'])
+        if covered: base['protection'] = "None"
+        bundles = _extra_bundles(cat, tuple(l['features']), tuple(l['sp_features'])) if plan == "My Biz" else [()]
+        for bundle in bundles:
+            cand = dict(base, features=list(l['features']), sp_features=list(l['sp_features']))
+            for kind, name, _ in bundle: cand[kind].append(name)
+            if l['type'] == "Smartphone" and l['promo_selection'] != "Custom":
+                d = engine.price_line(dict(cand, promo_selection="None"), tier_idx, opts, cat)
+                cand['promo_selection'], credit = _best_promo(cat, d['tier'], bool(l['byod']), bool(l['port_in']), objective, l['promo_selection'])
+                cost = line_cost(d, objective) - credit
+            else:
+                d = engine.price_line(cand, tier_idx, opts, cat)
+                cost = line_cost(d, objective)
+            tiered = plan in cat.smartphone_tiers
+            if best[tiered] is None or cost < best[tiered][0] - 1e-9: best[tiered] = (cost, cand)
+    return best
+
+
+def _assign(options, tier_idx):
+    # DP over lines; state = tiered smartphone lines so far, capped at 5.
+    INF = float("inf")
+    dp = [0.0] + [INF] * 5
+    back = []
+    for opt in options:
+        nxt, ptr = [INF] * 6, [None] * 6
+        for s, c in enumerate(dp):
+            if c == INF: continue
+            for tiered in (False, True):
+                if opt[tiered] is None: continue
+                t = min(s + tiered, 5)
+                if c + opt[tiered][0] < nxt[t]: nxt[t], ptr[t] = c + opt[tiered][0], (s, tiered)
+        dp = nxt
+        back.append(ptr)
+    # smartphone_tier_idx(): k tiered lines give min(k, 5) - 1, and 0 lines give 0.
+    ok = {0: (0, 1), 4: (5,)}.get(tier_idx, (tier_idx + 1,))
+    s = min(ok, key=lambda s: dp[s])
+    if dp[s] == INF: return INF, None
+    cost, picks = dp[s], []
+    for opt, ptr in zip(reversed(options), reversed(back)):
+        s, tiered = ptr[s]
+        picks.append(opt[tiered][1])
+    return cost, picks[::-1]
+
+
+def _covered(l, tmp_multi, whole_office):
+    # Whether account-level protection covers the line.
+    return l['type'] != "Internet" and (whole_office or (tmp_multi != "None" and engine.multi_eligible(l)))
+
+
+def _protection_modes(lines, cat):
+    modes = [("None", False)]
+    eligible = sum(map(engine.multi_eligible, lines))
+    bracket = [m['name'] for m in cat.multi_prot if eligible >= m['min']]
+    if bracket: modes.append((bracket[-1], False))
+    modes.append(("None", True))
+    return modes
+
+
+def optimize(quote, objective="mrc", plans=None, cat=None):
+    # Returns the cheapest configuration as a quote-shaped dict (lines plus
+    # tmp_multi / whole_office) with its cost, or None if there are no lines.
+    cat = engine.quote_catalog(quote, cat)
+    lines = [dict(engine.new_line(), **l) for l in quote.get('lines', [])]
+    if not lines: return None
+    opts = engine.account_options(quote)
+    single = [p for p, price in cat.single_prot.items() if price > 0]
+    if single:
+        cheapest = min(single, key=cat.single_prot.get)
+        lines = [dict(l, protection=cheapest) if l['protection'] == "None" and _covered(l, opts['tmp_multi'], opts['whole_office']) else l
+                 for l in lines]
+    ctx = {"cat": cat, "opts": opts, "objective": objective, "plans": tuple(plans or cat.smartphone_tiers)}
+    best = None
+    for tmp_multi, whole_office in _protection_modes(lines, cat):
+        acct = engine.account_extras(dict(opts, tmp_multi=tmp_multi, whole_office=whole_office), cat)
+        acct_cost = acct if objective == "mrc" else HORIZON * acct
+        covered = [_covered(l, tmp_multi, whole_office) for l in lines]
+        for tier_idx in range(5):
+            options = [_line_options(l, tier_idx, c, ctx) for l, c in zip(lines, covered)]
+            cost, picks = _assign(options, tier_idx)
+            if picks is not None and (best is None or cost + acct_cost < best['cost'] - 1e-9):
+                best = {"cost": cost + acct_cost, "lines": picks, "tmp_multi": tmp_multi, "whole_office": whole_office}
+    best.update(objective=objective, before=quote_cost(quote, objective, cat))
+    return best
@@ -0,0 +1,198 @@
+from fpdf import FPDF
+import datetime
+
+import metrics
+import quote_export
+from quote_export import money
+
+# --- PROFESSIONAL PDF CLASS ---
+class ProfessionalQuote(FPDF):
+    BODY_TOP = 40 # y where header() leaves the cursor
+
+    def header(self):
+        self.set_font('Helvetica', 'B', 20)
+        self.set_text_color(0, 0, 0)
+        self.cell(0, 10, 'Verizon Business', ln=True)
+        self.set_draw_color(205, 4, 11)
+        self.set_line_width(0.5)
+        self.line(10, 25, 200, 25)
+        self.ln(20)
+
+    DISCLAIMER = quote_export.DISCLAIMER
+    _disclaimer_lines = None
+
+    def footer(self):
+        self.set_y(-35)
+        self.set_font('Helvetica', 'I', 7)
+        self.set_text_color(100, 100, 100)
+        # Wrap the disclaimer once per document rather than once per page.
+        if self._disclaimer_lines is None:
+            self._disclaimer_lines = self.multi_cell(0, 3.5, self.DISCLAIMER, dry_run=True, output="LINES")
+        for text in self._disclaimer_lines:
+            self.cell(0, 3.5, text, new_x="LMARGIN", new_y="NEXT")
+        self.set_x(self.w - self.r_margin)
+        self.cell(0, 8, f'Page {self.page_no()}', 0, 0, 'C')
+
+# --- MRC TABLE LAYOUT ---
+# Rows are measured once up front, page breaks are planned from the measured
+# heights and each row is then drawn with plain rect/text operations instead of
+# multi_cell, which re-runs fpdf's line breaker for every cell. The table is
+# most of a long quote's content stream, so each row is one outline and the
+# column rules are drawn once per page.
+MRC_COLS = ((10, "#", 'C'), (45, "Plan Breakdown", 'L'), (45, "Device & Promotions", 'L'), (60, "Features, Add-ons & Protection", 'L'), (30, "Line Total", 'R'))
+MRC_HEADER_H = 8
+MRC_LINE_H = 4
+MRC_MIN_ROW_H = 8
+MRC_PAGE_BOTTOM = 250
+MRC_WIDTH = sum(w for w, _, _ in MRC_COLS)
+
+def _wrap(measure, text, width):
+    if measure(text) <= width: return [text]
+    out, cur = [], ""
+    for word in text.split(" "):
+        cand = f"{cur} {word}" if cur else word
+        if cur and measure(cand) > width:
+            out.append(cur)
+            cur = word
+        else: cur = cand
+    out.append(cur)
+    return out
+
+def layout_mrc_rows(pdf, lines):
+    # Returns (number, wrapped column lines, total text, row height) per model line.
+    pdf.set_font("Helvetica", "", 7)
+    widths = {}
+    def measure(t):
+        if t not in widths: widths[t] = pdf.get_string_width(t)
+        return widths[t]
+    avail = [w - 2 * pdf.c_margin for w, _, _ in MRC_COLS[1:4]]
+    rows = []
+    for r in lines:
+        cols = [[w for t in texts for w in _wrap(measure, t, a)] for texts, a in zip(r['text'], avail)]
+        height = max(MRC_MIN_ROW_H, MRC_LINE_H * max(len(c) for c in cols))
+        rows.append((str(r['line']), cols, f"${r['line_total']:.2f}", height))
+    return rows
+
+def plan_mrc_pages(heights, y_first, y_top):
+    # Splits rows into (start, end) runs per page; every page repeats the header.
+    # The first run is empty when not even one row fits under the page 1 header.
+    pages, start, y = [], 0, y_first + MRC_HEADER_H
+    for i, h in enumerate(heights):
+        if y + h > MRC_PAGE_BOTTOM and (i > start or not pages):
+            pages.append((start, i))
+            start, y = i, y_top + MRC_HEADER_H
+        y += h
+    pages.append((start, len(heights)))
+    return pages
+
+def _draw_mrc_header(pdf, x):
+    pdf.set_x(x)
+    pdf.set_font("Helvetica", "B", 8)
+    pdf.set_fill_color(220, 220, 220)
+    for w, title, align in MRC_COLS[:-1]: pdf.cell(w, MRC_HEADER_H, title, 1, 0, align, fill=True)
+    w, title, align = MRC_COLS[-1]
+    pdf.cell(w, MRC_HEADER_H, title, 1, 1, align, fill=True)
+    pdf.set_font("Helvetica", "", 7)
+    return pdf.get_y()
+
+def _draw_mrc_row(pdf, x, y, row):
+    num, cols, total, h = row
+    mid = 0.3 * pdf.font_size
+    pdf.rect(x, y, MRC_WIDTH, h)
+    pdf.text(x + (MRC_COLS[0][0] - pdf.get_string_width(num)) / 2, y + h / 2 + mid, num)
+    cx = x + MRC_COLS[0][0]
+    for (w, _, _), col in zip(MRC_COLS[1:4], cols):
+        for i, t in enumerate(col):
+            pdf.text(cx + pdf.c_margin, y + i * MRC_LINE_H + MRC_LINE_H / 2 + mid, t)
+        cx += w
+    pdf.text(cx + MRC_COLS[4][0] - pdf.c_margin - pdf.get_string_width(total), y + h / 2 + mid, total)
+    return y + h
+
+def _draw_mrc_rows(pdf, x, y, rows):
+    top = y
+    for row in rows: y = _draw_mrc_row(pdf, x, y, row)
+    cx = x
+    for w, _, _ in MRC_COLS[:-1]:
+        cx += w
+        pdf.line(cx, top, cx, y)
+    return y
+
+def _money_row(pdf, w, h, label, amount):
+    pdf.cell(w, h, label, 1)
+    pdf.cell(190 - w, h, amount, 1, 1, 'R')
+
+def build_pro_pdf(model):
+    pdf = ProfessionalQuote()
+    pdf.add_page()
+    
+    # --- HEADER ---
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_xy(10, 30)
+    pdf.cell(90, 5, "PREPARED FOR:", ln=True)
+    pdf.set_font("Helvetica", "", 10)
+    pdf.cell(90, 5, model['biz_name'], ln=True)
+    pdf.cell(90, 5, f"Date: {datetime.date.fromisoformat(model['date']).strftime('%B %d, %Y')}", ln=True)
+    pdf.set_xy(110, 30)
+    pdf.set_font("Helvetica", "B", 10)
+    pdf.cell(90, 5, "PREPARED BY:", ln=True)
+    pdf.set_font("Helvetica", "", 10)
+    pdf.set_xy(110, 35)
+    pdf.cell(90, 5, model['rep_name'], ln=True)
+    pdf.set_xy(110, 40)
+    pdf.cell(90, 5, "Verizon Business", ln=True)
+    pdf.ln(15)
+
+    # --- 1. DUE TODAY ---
+    pdf.set_fill_color(240, 240, 240)
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.cell(0, 8, "ESTIMATED DUE TODAY", 0, 1, 'L', fill=True)
+    pdf.set_font("Helvetica", "", 9)
+    for label, amount in model['due_today']: _money_row(pdf, 150, 7, label, money(amount))
+    pdf.set_font("Helvetica", "B", 10)
+    _money_row(pdf, 150, 8, "TOTAL DUE TODAY", money(model['due_today_total']))
+    pdf.ln(8)
+
+    # --- 2. MONTHLY RECURRING ---
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.cell(0, 8, "MONTHLY RECURRING CHARGES", 0, 1, 'L', fill=True)
+    
+    x_start = pdf.get_x()
+    rows = layout_mrc_rows(pdf, model['lines'])
+    for p, (start, end) in enumerate(plan_mrc_pages([r[3] for r in rows], pdf.get_y(), pdf.BODY_TOP)):
+        if p: pdf.add_page()
+        if start == end: continue
+        y = _draw_mrc_rows(pdf, x_start, _draw_mrc_header(pdf, x_start), rows[start:end])
+        pdf.set_xy(x_start, y)
+
+    for label, amount in model['monthly']: _money_row(pdf, 160, 8, label, money(amount))
+    low, high = model['taxes']
+    _money_row(pdf, 160, 8, f"Estimated Taxes, Surcharges and Fees ({quote_export.TAX_BAND_LABEL} of Base Plan)", f"{money(low)} - {money(high)}")
+
+    pdf.set_font("Helvetica", "B", 10)
+    low, high = model['monthly_total']
+    pdf.cell(160, 8, "TOTAL ESTIMATED MONTHLY", 1, 0, 'R')
+    pdf.cell(30, 8, f"{money(low)} - {money(high)}", 1, 1, 'R')
+    pdf.ln(8)
+
+    # --- 3. FIRST BILL ---
+    pdf.set_font("Helvetica", "B", 11)
+    pdf.set_fill_color(240, 240, 240)
+    pdf.cell(0, 8, "FIRST BILL ONE TIME CHARGES AND CREDITS", 0, 1, 'L', fill=True)
+    pdf.set_font("Helvetica", "", 9)
+    for label, amount in model['first_bill']: _money_row(pdf, 150, 7, label, money(amount))
+
+    return pdf
+
+def write_pro_pdf(sink, model):
+    # Writes the quote straight to `sink`, a path or a binary file object, and
+    # returns (pages, bytes written). Page streams are deflated (fpdf's default)
+    # and the serialized document is not handed back to the caller.
+    pdf = build_pro_pdf(model)
+    pdf.output(sink)
+    return pdf.pages_count, len(pdf.buffer)
+
+@metrics.timed("create_pro_pdf")
+def create_pro_pdf(model):
+    # The finished PDF: fpdf's own output bytearray, not a bytes copy of it.
+    return build_pro_pdf(model).output()
@@ -0,0 +1,112 @@
+import collections
+import hashlib
+import json
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import engine
+import metrics
+
+# Background PDF rendering for step 5. Renders run on a small process-wide
+# thread pool as soon as the step 5 inputs are known, and finished bytes are kept
+# in a size-capped LRU keyed on a fingerprint of everything that appears in the
+# PDF, so reruns and repeat clicks on an unchanged quote never re-render. A
+# render that fails keeps its exception as the result (see error()), so a quote
+# the PDF can't draw is tried once, not on every rerun.
+WORKERS = 2
+MAX_ENTRIES = 256
+MAX_BYTES = 64 * 1024 * 1024
+
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="pdf")
+_lock = threading.Lock()
+_cache = collections.OrderedDict() # key -> bytes, oldest first
+_cache_bytes = 0
+_inflight = {} # key -> Future
+_wanted = {} # key -> ids of the sessions waiting on its render
+_errors = collections.OrderedDict() # key -> exception from a failed render
+stats = {"hits": 0, "renders": 0, "failures": 0, "evictions": 0}
+
+
+def snapshot(quote):
+    # Plain copies of the lines, account options and quote date, for fingerprint().
+    return dict(engine.account_options(quote), quote_date=engine.quote_date(quote).isoformat(), lines=[dict(l) for l in quote.get('lines', [])])
+
+
+def fingerprint(biz_name, rep_name, due_today_data, first_bill_data, quote, cat=None):
+    cat = engine.quote_catalog(quote, cat)
+    payload = json.dumps([biz_name, rep_name, due_today_data, first_bill_data, quote, cat.digest], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _render(key, model, rerun=None):
+    # Returns the PDF bytes, or None if rendering raised; never raises itself.
+    # Stage timings go to `rerun`, the metrics rerun that requested the render.
+    global _cache_bytes
+    data = error = None
+    try:
+        from pdf_quote import create_pro_pdf # fpdf loads with the first render, not with the app
+        with metrics.recording(rerun): data = create_pro_pdf(model)
+    except Exception as e:
+        error = e
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+            _wanted.pop(key, None)
+            if data is not None:
+                stats["renders"] += 1
+                if len(data) <= MAX_BYTES:
+                    _cache[key] = data
+                    _cache_bytes += len(data)
+                    while len(_cache) > MAX_ENTRIES or _cache_bytes > MAX_BYTES:
+                        _, old = _cache.popitem(last=False)
+                        _cache_bytes -= len(old)
+                        stats["evictions"] += 1
+            elif error is not None:
+                stats["failures"] += 1
+                _errors[key] = error
+                while len(_errors) > MAX_ENTRIES: _errors.popitem(last=False)
+    return data
+
+
+def request(key, model, session):
+    # Schedules a render of a quote_export model for `session` unless the key is
+    # cached, already failed or already in flight.
+    with _lock:
+        if key in _cache or key in _errors: return
+        _wanted.setdefault(key, set()).add(session)
+        if key not in _inflight: _inflight[key] = _pool.submit(_render, key, model, metrics.current())
+
+
+def cancel(key, session):
+    # `session` no longer needs this render. A queued render nobody else is
+    # waiting on is dropped; a running one finishes and is cached in case the
+    # rep switches back.
+    with _lock:
+        waiting = _wanted.get(key)
+        if waiting is None: return
+        waiting.discard(session)
+        if waiting: return
+        fut = _inflight.get(key)
+        if fut is not None and fut.cancel():
+            _inflight.pop(key, None)
+            _wanted.pop(key, None)
+
+
+def result(key, timeout=0):
+    # Cached bytes, or None if the render failed or hasn't finished within
+    # `timeout` seconds (None waits for it).
+    with _lock:
+        data = _cache.get(key)
+        if data is not None:
+            _cache.move_to_end(key)
+            stats["hits"] += 1
+            return data
+        fut = _inflight.get(key)
+    if fut is None: return None
+    try: return fut.result(timeout)
+    except (TimeoutError, CancelledError): return None
+
+
+def error(key):
+    # The exception a failed render of `key` raised, or None.
+    with _lock: return _errors.get(key)
@@ -0,0 +1,218 @@
+import csv
+import datetime
+import html
+import io
+
+import engine
+
+# The quote as the customer sees it, built once from the pricing results and
+# drawn by every export: the PDF (pdf_quote) and the CSV, HTML and XLSX files
+# below. The model is plain data (dicts, lists, tuples, numbers, strings), so it
+# can be cached with the quote, pickled to a worker or dumped as JSON, and an
+# export never reprices anything.
+ECON_CHARGE = 2.98 # Economic Adjustment Charge, per line
+TAX_BAND = (0.18, 0.42) # estimated taxes, surcharges and fees, as a share of the base plan total
+TAX_BAND_LABEL = f"{TAX_BAND[0]:.0%}-{TAX_BAND[1]:.0%}"
+DUE_TODAY_ROWS = (("setup_cost", "Setup, Go & Service Charges"), ("bundle_cost", "Accessory Bundles"),
+                  ("acc_cost", "Individual Accessories (Screen / Case / Charger)"))
+LINE_COLUMNS = ("line", "type", "plan", "tier", "base", "autopay_disc", "military_disc", "intro_disc", "add_ons", "protection",
+                "device_payment", "byod", "port_in", "promo", "promo_term", "promo_value", "promo_monthly_credit", "line_total")
+CSV_COLUMNS = ("section", "item", "line", "type", "tier", "base", "autopay_disc", "military_disc", "intro_disc", "add_ons", "protection",
+               "device_payment", "byod", "port_in", "promo", "promo_term", "promo_value", "promo_monthly_credit", "amount")
+DISCLAIMER = (
+    "Quotes are valid for 30 days or until the quote promotions end. End dates for promotions are not able "
+    "to be disclosed to customers as they are subject to change or end at any point. "
+    "All prices included in this quote are subject to change due to local taxes, promotions, applicable fees, etc. "
+    "All prices are estimates only and only quotes provided through Verizon's Flex Quote system will be honored. "
+    "Pricing displayed assumes enrollment in Auto Pay (checking/debit) & Paper-Free billing. "
+    "Final pricing and device financing are subject to credit approval."
+)
+
+
+def money(v):
+    return f"-${-v:,.2f}" if v < 0 else f"${v:,.2f}"
+
+
+def line_texts(l, d):
+    # The three wrapped text columns of the monthly table: plan, device and
+    # promotions, features and protection.
+    plan_txt = [f"{l['plan']}: ${d['base']:.2f}" + (" (Port-In)" if d['port_in'] else "")]
+    if d['ap_disc'] > 0: plan_txt.append(f"Autopay: -${d['ap_disc']:.2f}")
+    if d['mil_disc'] > 0: plan_txt.append(f"Military: -${d['mil_disc']:.2f}")
+    if d['intro_disc'] > 0: plan_txt.append(f"Intro: -${d['intro_disc']:.2f}")
+
+    dev_txt = [f"Dev Pmt: ${d['dev_pay']:.2f}" + (" (BYOD)" if d['byod'] else "")]
+    if d['promo_val'] > 0 and d['promo_term'] != "One-Time":
+        dev_txt.append(f"Promo: -${d['promo_credit']:.2f}")
+        dev_txt.append(f"({d['promo_name'][:20]}..)")
+
+    feat_txt = [*d['extras_list'], *d['prot_list']] or ["-"]
+    return plan_txt, dev_txt, feat_txt
+
+
+def _line(n, l, d):
+    promo = d['promo_name'] if d['promo_name'] != "None" else ""
+    return {
+        "line": n, "type": l['type'], "plan": l['plan'], "tier": d['tier'], "base": d['base'],
+        "autopay_disc": d['ap_disc'], "military_disc": d['mil_disc'], "intro_disc": d['intro_disc'],
+        "add_ons": d['extras_list'], "protection": d['prot_list'], "device_payment": d['dev_pay'], "byod": d['byod'], "port_in": d['port_in'],
+        "promo": promo, "promo_term": d['promo_term'] if promo else "", "promo_value": d['promo_val'], "promo_monthly_credit": d['promo_credit'],
+        "line_total": d['total'], "text": line_texts(l, d),
+    }
+
+
+def quote_model(biz_name, rep_name, due_today_data, first_bill_data, lines, totals, date=None):
+    """Everything the quote shows, from engine.get_totals() and the step 5 inputs.
+
+    Sections are lists of (label, amount) rows in the order they are printed;
+    `lines` holds one record per line with its LINE_COLUMNS values and the
+    monthly table's cell texts under "text".
+    """
+    l_info, mrc, ot_promos, taxable, acct_extras = totals
+    due = due_today_data
+    due_rows = [(f"Estimated Sales Tax ({due['tax_rate']}%) on Devices & Accessories", due['tax_amt'])]
+    due_rows += [(label, due[k]) for k, label in DUE_TODAY_ROWS if due.get(k, 0) > 0]
+
+    monthly = []
+    if acct_extras > 0: monthly.append(("Account Level Protection (Multi-Device / Whole Office)", acct_extras))
+    monthly.append(("Economic Adjustment Charge", len(lines) * ECON_CHARGE))
+    taxes = (taxable * TAX_BAND[0], taxable * TAX_BAND[1])
+
+    first_bill = []
+    if first_bill_data['act_fees'] > 0: first_bill.append(("Activation / Upgrade Fees", first_bill_data['act_fees']))
+    credits = first_bill_data['credits'] + ot_promos
+    if credits > 0: first_bill.append(("Bill Credits / One-Time Promos", -credits))
+
+    return {
+        "biz_name": biz_name, "rep_name": rep_name, "date": (date or datetime.date.today()).isoformat(),
+        "due_today": due_rows, "due_today_total": due['total'],
+        "lines": [_line(i + 1, l, d) for i, (l, d) in enumerate(zip(lines, l_info))],
+        "monthly": monthly, "mrc": mrc, "taxes": taxes, "monthly_total": (mrc + taxes[0], mrc + taxes[1]),
+        "first_bill": first_bill,
+    }
+
+
+def from_quote(quote, cat=None):
+    # For a quote mapping that carries its own step 5 inputs (batch files, the service).
+    totals = engine.get_totals(quote, cat)
+    return quote_model(quote.get('biz_name', engine.STEP5_DEFAULTS['biz_name']), quote.get('rep_name', engine.STEP5_DEFAULTS['rep_name']),
+                       engine.due_today(quote), engine.first_bill(quote), quote.get('lines', []), totals, engine.quote_date(quote))
+
+
+def summary_rows(model):
+    # (section, label, amount) for everything below the line table.
+    low, high = model['taxes']
+    yield from (("due_today", label, v) for label, v in model['due_today'])
+    yield "due_today", "Total Due Today", model['due_today_total']
+    yield from (("monthly", label, v) for label, v in model['monthly'])
+    yield "monthly", f"Estimated Taxes, Surcharges and Fees, low ({TAX_BAND[0]:.0%} of Base Plan)", low
+    yield "monthly", f"Estimated Taxes, Surcharges and Fees, high ({TAX_BAND[1]:.0%} of Base Plan)", high
+    yield "monthly", "Monthly Recurring Charges", model['mrc']
+    yield "monthly", "Total Estimated Monthly, low", model['monthly_total'][0]
+    yield "monthly", "Total Estimated Monthly, high", model['monthly_total'][1]
+    yield from (("first_bill", label, v) for label, v in model['first_bill'])
+
+
+# --- CSV ---
+def to_csv(model):
+    # One row per line (section "line", item = plan, amount = line total), then
+    # one row per charge, credit and total. Lists are joined with ";" and
+    # amounts rounded to cents.
+    out = io.StringIO()
+    w = csv.writer(out, lineterminator="\n")
+    w.writerow(CSV_COLUMNS)
+    w.writerows(("line", r['plan'], r['line'], r['type'], r['tier'], round(r['base'], 2), round(r['autopay_disc'], 2), round(r['military_disc'], 2),
+                 round(r['intro_disc'], 2), ";".join(r['add_ons']), ";".join(r['protection']), round(r['device_payment'], 2), r['byod'], r['port_in'],
+                 r['promo'], r['promo_term'], round(r['promo_value'], 2), round(r['promo_monthly_credit'], 2), round(r['line_total'], 2))
+                for r in model['lines'])
+    pad = ("",) * (len(CSV_COLUMNS) - 3)
+    w.writerows((section, label, *pad, round(v, 2)) for section, label, v in summary_rows(model))
+    return out.getvalue().encode()
+
+
+# --- HTML ---
+_CSS = ("body{font:13px Helvetica,Arial,sans-serif;margin:2em;color:#000}h1{font-size:22px;border-bottom:2px solid #cd040b;padding-bottom:.4em}"
+        "h2{font-size:14px;background:#f0f0f0;padding:.4em}table{border-collapse:collapse;width:100%;margin-bottom:1.5em}"
+        "td,th{border:1px solid #999;padding:3px 6px;vertical-align:top;text-align:left}th{background:#dcdcdc}.n{text-align:right;white-space:nowrap}"
+        ".b td{font-weight:bold}.meta td{border:0;padding:0 2em 0 0}.fine{font-size:10px;color:#646464}")
+
+
+def _money_rows(rows, bold_last=False):
+    out = [f"<tr{' class=b' if bold_last and i == len(rows) - 1 else ''}><td>{html.escape(label)}</td><td class=n>{money(v)}</td></tr>"
+           for i, (label, v) in enumerate(rows)]
+    return "<table>" + "".join(out) + "</table>"
+
+
+def to_html(model):
+    e = html.escape
+    low, high = model['taxes']
+    lines = "".join(
+        f"<tr><td class=n>{r['line']}</td>" + "".join(f"<td>{'<br>'.join(map(e, col))}</td>" for col in r['text'])
+        + f"<td class=n>{money(r['line_total'])}</td></tr>" for r in model['lines'])
+    monthly = [*model['monthly'], (f"Estimated Taxes, Surcharges and Fees ({TAX_BAND_LABEL} of Base Plan)", None)]
+    monthly_html = "".join(f"<tr><td colspan=4>{e(label)}</td><td class=n>{money(v) if v is not None else f'{money(low)} - {money(high)}'}</td></tr>"
+                           for label, v in monthly)
+    total = f"{money(model['monthly_total'][0])} - {money(model['monthly_total'][1])}"
+    return (f"<!DOCTYPE html><html><head><meta charset=utf-8><title>Quote for {e(model['biz_name'])}</title><style>{_CSS}</style></head><body>"
+            "<h1>Verizon Business</h1><table class=meta><tr>"
+            f"<td><b>PREPARED FOR:</b><br>{e(model['biz_name'])}<br>Date: {e(model['date'])}</td>"
+            f"<td><b>PREPARED BY:</b><br>{e(model['rep_name'])}<br>Verizon Business</td></tr></table>"
+            "<h2>ESTIMATED DUE TODAY</h2>" + _money_rows([*model['due_today'], ("TOTAL DUE TODAY", model['due_today_total'])], bold_last=True)
+            + "<h2>MONTHLY RECURRING CHARGES</h2><table><tr><th>#</th><th>Plan Breakdown</th><th>Device &amp; Promotions</th>"
+            f"<th>Features, Add-ons &amp; Protection</th><th class=n>Line Total</th></tr>{lines}{monthly_html}"
+            f"<tr class=b><td colspan=4 class=n>TOTAL ESTIMATED MONTHLY</td><td class=n>{total}</td></tr></table>"
+            "<h2>FIRST BILL ONE TIME CHARGES AND CREDITS</h2>" + _money_rows(model['first_bill'])
+            + f"<p class=fine>{e(DISCLAIMER)}</p></body></html>").encode()
+
+
+# --- XLSX ---
+def _xlsx_row(ws, row):
+    # openpyxl stores a string starting with "=" as a formula; the rep and
+    # business names are typed in, so every string goes in as text.
+    from openpyxl.cell import WriteOnlyCell
+    out = []
+    for v in row:
+        if isinstance(v, str) and v.startswith("="):
+            v = WriteOnlyCell(ws, v)
+            v.data_type = "s"
+        out.append(v)
+    return out
+
+
+def to_xlsx(model):
+    # A "Lines" sheet with the CSV's line columns as typed cells and a "Summary"
+    # sheet with the header fields and every charge, credit and total.
+    try: from openpyxl import Workbook
+    except ImportError: raise ImportError("XLSX export needs the openpyxl package; export CSV instead") from None
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Lines")
+    ws.append(LINE_COLUMNS)
+    for r in model['lines']:
+        ws.append(_xlsx_row(ws, [", ".join(v) if isinstance(v, tuple) else v for v in (r[c] for c in LINE_COLUMNS)]))
+    ws = wb.create_sheet("Summary")
+    for row in (("Prepared for", model['biz_name']), ("Prepared by", model['rep_name']), ("Date", model['date']), ()):
+        ws.append(_xlsx_row(ws, row))
+    ws.append(("section", "item", "amount"))
+    for row in summary_rows(model): ws.append(_xlsx_row(ws, row))
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def to_pdf(model):
+    from pdf_quote import create_pro_pdf # fpdf loads with the first PDF
+    return create_pro_pdf(model)
+
+
+# format -> (exporter, MIME type); every exporter returns the file as bytes
+# (a bytearray for the PDF).
+FORMATS = {
+    "pdf": (to_pdf, "application/pdf"),
+    "csv": (to_csv, "text/csv; charset=utf-8"),
+    "html": (to_html, "text/html; charset=utf-8"),
+    "xlsx": (to_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def export(model, fmt):
+    return FORMATS[fmt][0](model)
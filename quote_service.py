@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+
+import engine
+import quote_export
+import tax_rates
+from catalogs import get_catalog
+
+# Local JSON pricing service for the CRM: the wizard's pricing and PDF quote
+# without a browser. Quotes use the same keys as batch_pdf.py / the wizard's
+# session state: `lines`, the step 3 account options and the step 5 inputs,
+# plus an optional `quote_date` (YYYY-MM-DD, default today) to price a quote
+# with the promos and prices in effect on that date. A quote with a `zip` and
+# no `tax_rate` takes the rate from the local tax table (tax_rates.py).
+#
+#   GET  /health       catalog version, in-flight requests and counters
+#   POST /v1/quote     one quote -> per-line details, MRC, due today, first bill
+#   POST /v1/quotes    {"quotes": [...], "lines": false} -> one result per quote,
+#                      priced with the columnar batch engine
+#   POST /v1/pdf       one quote (with biz_name / rep_name) -> application/pdf
+#   POST /v1/export/csv, /v1/export/html, /v1/export/xlsx
+#                      one quote -> the same quote as a CSV, HTML or XLSX file
+#
+#   python quote_service.py --port 8765 --price-workers 2 --pdf-workers 2
+#
+# Plain HTTP/1.1 on asyncio streams with keep-alive. Small quotes are priced on
+# the event loop; batches, quotes over INLINE_LINES lines and PDFs go to two
+# separate process pools, so pricing never queues behind a render. Each kind of
+# request has its own in-flight limit; a request that can't get a slot within
+# QUEUE_TIMEOUT is answered 503 with Retry-After. Every process loads the
+# catalog once, through get_catalog(), and shares it across requests. A pool
+# whose worker dies is replaced; the request it was serving gets a 503.
+INLINE_LINES = 200
+BATCH_CHUNK = 100 # quotes per pricing-pool task
+MAX_BATCH = 5000
+MAX_LINES = 5000
+MAX_BODY = 32 * 1024 * 1024
+MAX_CONNECTIONS = 256
+KEEPALIVE_TIMEOUT = 15.0
+QUEUE_TIMEOUT = 5.0
+EXPORT_FORMATS = ("csv", "html", "xlsx") # PDFs have their own endpoint and pool
+LINE_KEYS = frozenset(engine.new_line()) | {"custom_promo_val"}
+QUOTE_KEYS = frozenset(("lines", "quote_id", "quote_date", *engine.ACCOUNT_DEFAULTS, *engine.STEP5_DEFAULTS))
+
+
+class QuoteError(ValueError):
+    pass
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+# --- QUOTE HANDLING (event loop and pool workers) ---
+def _one_of(where, value, allowed):
+    if value not in allowed: raise QuoteError(f"{where}: {value!r} is not one of {', '.join(map(str, allowed))}")
+    return value
+
+
+def _number(where, value):
+    # json.loads accepts NaN, Infinity and integers too big for a float; none of
+    # them price into valid JSON.
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= sys.float_info.max:
+        raise QuoteError(f"{where}: expected a non-negative number, got {value!r}")
+    return value
+
+
+def _text(where, value):
+    if not isinstance(value, str): raise QuoteError(f"{where}: expected a string, got {value!r}")
+    # The PDF's core Helvetica font only covers Latin-1.
+    try: value.encode("latin-1")
+    except UnicodeEncodeError as e: raise QuoteError(f"{where}: {value[e.start]!r} can't be printed in the PDF quote") from None
+    return value
+
+
+def _flag(where, value):
+    if not isinstance(value, bool): raise QuoteError(f"{where}: expected true/false, got {value!r}")
+    return value
+
+
+def normalize(quote, cat):
+    """Checks a quote against the catalog in effect on its quote_date; returns it with every default filled in.
+
+    Raises QuoteError naming the first bad field. Promo eligibility is not
+    enforced, as in the pricing engine itself.
+    """
+    if not isinstance(quote, dict): raise QuoteError("a quote must be a JSON object")
+    unknown = set(quote) - QUOTE_KEYS
+    if unknown: raise QuoteError(f"unknown quote field(s): {', '.join(sorted(unknown))}")
+    lines = quote.get("lines", [])
+    if not isinstance(lines, list): raise QuoteError("lines: expected a list")
+    if len(lines) > MAX_LINES: raise QuoteError(f"lines: at most {MAX_LINES} per quote")
+    out = dict(engine.ACCOUNT_DEFAULTS, **engine.STEP5_DEFAULTS)
+    out.update((k, v) for k, v in quote.items() if k != "lines")
+    if out.get("quote_date") is not None:
+        try: out["quote_date"] = engine.quote_date(out).isoformat()
+        except (TypeError, ValueError): raise QuoteError(f"quote_date: expected a YYYY-MM-DD date, got {out['quote_date']!r}") from None
+    cat = engine.quote_catalog(out, cat)
+    for k in ("autopay", "military", "joint_offer", "whole_office"): _flag(k, out[k])
+    for k in ("biz_name", "rep_name"): _text(k, out[k])
+    if not isinstance(out["zip"], (str, int)) or isinstance(out["zip"], bool): raise QuoteError(f"zip: expected a ZIP code, got {out['zip']!r}")
+    if out["zip"] and "tax_rate" not in quote:
+        try: out["tax_rate"] = tax_rates.rate_for(out["zip"])
+        except LookupError as e: raise QuoteError(f"zip: {e}") from None
+    _one_of("tmp_multi", out["tmp_multi"], ["None"] + [m['name'] for m in cat.multi_prot])
+    for k in (*engine.SETUP_PRICES, *engine.BUNDLE_PRICES, *engine.ACCESSORY_PRICES, "act_cnt", "tax_rate", "dev_retail", "bill_cred"):
+        _number(k, out[k])
+    out["lines"] = [_line(f"lines[{i}]", l, cat) for i, l in enumerate(lines)]
+    return out
+
+
+def _line(where, l, cat):
+    if not isinstance(l, dict): raise QuoteError(f"{where}: expected an object")
+    unknown = set(l) - LINE_KEYS
+    if unknown: raise QuoteError(f"{where}: unknown field(s): {', '.join(sorted(unknown))}")
+    line = dict(engine.new_line(), **l)
+    dtype = _one_of(f"{where}.type", line['type'], engine.DEVICE_TYPES)
+    _one_of(f"{where}.plan", line['plan'], cat.plans_by_type[dtype])
+    for key, allowed in (("features", cat.addons), ("sp_features", cat.smartphone_features)):
+        if not isinstance(line[key], list): raise QuoteError(f"{where}.{key}: expected a list")
+        for f in line[key]: _one_of(f"{where}.{key}", f, list(allowed))
+    _one_of(f"{where}.protection", line['protection'], ["None", *cat.single_prot])
+    _one_of(f"{where}.vbis", line['vbis'], list(cat.vbis_prot))
+    _one_of(f"{where}.promo_selection", line['promo_selection'], ["None", *cat.promo_by_name, "Custom"])
+    _one_of(f"{where}.custom_promo_term", line['custom_promo_term'], engine.CUSTOM_TERMS)
+    for k in ("intro_disc", "byod", "port_in"): _flag(f"{where}.{k}", line[k])
+    _number(f"{where}.dev_pay", line['dev_pay'])
+    if "custom_promo_val" in line: _number(f"{where}.custom_promo_val", line['custom_promo_val'])
+    return line
+
+
+def price_quote(quote):
+    quote = normalize(quote, get_catalog())
+    cat = engine.quote_catalog(quote)
+    details, mrc, one_time, taxable, acct_extras = engine.get_totals(quote, cat)
+    return {
+        "lines": [dict(d) for d in details], "mrc": mrc, "one_time_credits": one_time, "taxable_base": taxable,
+        "acct_extras": acct_extras, "tier_idx": engine.smartphone_tier_idx(quote['lines'], cat),
+        "due_today": engine.due_today(quote), "first_bill": engine.first_bill(quote), "catalog": cat.version,
+        "quote_date": engine.quote_date(quote).isoformat(),
+    }
+
+
+def price_chunk(quotes, with_lines=False):
+    # Valid quotes of a chunk are priced in one QuoteBatch per quote date's
+    # catalog (usually just one); invalid ones get {"error": ...} in their place.
+    cat = get_catalog()
+    results, groups = [], {}
+    for i, q in enumerate(quotes):
+        try:
+            q = normalize(q, cat)
+            groups.setdefault(engine.quote_catalog(q, cat), []).append((i, q))
+            results.append(None)
+        except QuoteError as e:
+            results.append({"error": str(e)})
+    for group_cat, group in groups.items():
+        batch = engine.QuoteBatch([q for _, q in group], group_cat)
+        r = batch.price()
+        line_totals = [[] for _ in group]
+        if with_lines:
+            for q, total in zip(batch.quote_ix.tolist(), r['line_total'].tolist()): line_totals[q].append(total)
+        for j, (i, _) in enumerate(group):
+            results[i] = {"mrc": float(r['mrc'][j]), "one_time_credits": float(r['one_time'][j]), "taxable_base": float(r['taxable'][j]),
+                          "acct_extras": float(r['acct_extras'][j]), "tier_idx": int(r['tier_idx'][j])}
+            if with_lines: results[i]["line_totals"] = line_totals[j]
+    return results
+
+
+def _in_worker(render):
+    # Pool tasks raise only QuoteError: an exception the event loop can't
+    # unpickle (fpdf's are among them) would break the whole pool.
+    @functools.wraps(render)
+    def wrapper(quote, *args):
+        try: return render(quote, *args)
+        except QuoteError: raise
+        except Exception as e: raise QuoteError(f"could not render the quote: {type(e).__name__}: {e}") from None
+    return wrapper
+
+
+@_in_worker
+def render_pdf(quote):
+    from pdf_quote import create_pro_pdf
+    cat = get_catalog()
+    return create_pro_pdf(quote_export.from_quote(normalize(quote, cat), cat))
+
+
+@_in_worker
+def render_export(quote, fmt):
+    cat = get_catalog()
+    return quote_export.export(quote_export.from_quote(normalize(quote, cat), cat), fmt)
+
+
+def _warm_worker():
+    # Forked workers inherit the event loop's signal wakeup fd; without this a
+    # worker being terminated would stop the server as if it got the SIGTERM.
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl-C is the server's to handle
+    get_catalog()
+
+
+def _warm_pdf_worker():
+    # Only the PDF pool loads fpdf; the event loop and pricing workers never do.
+    _warm_worker()
+    import pdf_quote # noqa: F401
+
+
+# --- HTTP ---
+async def _read_request(reader):
+    # (method, path, version, headers, body), or None when the client is done.
+    request_line = await reader.readline()
+    if not request_line: return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3: raise HttpError(400, "malformed request line")
+    method, target, version = parts
+    headers = {}
+    while True:
+        raw = await reader.readline()
+        if raw in (b"\r\n", b"\n", b""): break
+        if len(headers) >= 100: raise HttpError(431, "too many headers")
+        name, _, value = raw.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(411, "chunked request bodies are not supported; send Content-Length")
+    try: length = int(headers.get("content-length") or 0)
+    except ValueError: raise HttpError(400, "bad Content-Length") from None
+    if length > MAX_BODY: raise HttpError(413, f"request bodies are limited to {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), target.split("?", 1)[0], version, headers, body
+
+
+def _response(status, body, content_type="application/json", keep_alive=True, retry_after=None):
+    if not isinstance(body, (bytes, bytearray)): body = json.dumps(body).encode()
+    head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if keep_alive: head.append(f"Keep-Alive: timeout={KEEPALIVE_TIMEOUT:g}")
+    if retry_after: head.append(f"Retry-After: {retry_after}")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+def _json_body(body):
+    try: return json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e: raise HttpError(400, f"invalid JSON: {e}") from None
+
+
+class QuoteService:
+    def __init__(self, price_workers=2, pdf_workers=2, price_limit=64):
+        get_catalog() # loaded before the first request
+        self.pool_args = {"price_pool": (price_workers, _warm_worker), "pdf_pool": (pdf_workers, _warm_pdf_worker)}
+        for name in self.pool_args: self._start_pool(name)
+        self.limits = {"quote": asyncio.Semaphore(price_limit), "quotes": asyncio.Semaphore(2 * price_workers),
+                       "pdf": asyncio.Semaphore(2 * pdf_workers)}
+        self.in_flight = dict.fromkeys(self.limits, 0)
+        self.connections = 0
+        self.stats = {"requests": 0, "errors": 0, "rejected": 0, "pool_restarts": 0, **{f"{k}_requests": 0 for k in self.limits}}
+        self.started = time.time()
+        self.routes = {("GET", "/health"): self.health, ("POST", "/v1/quote"): self.quote,
+                       ("POST", "/v1/quotes"): self.quotes, ("POST", "/v1/pdf"): self.pdf,
+                       **{("POST", f"/v1/export/{fmt}"): functools.partial(self.export, fmt) for fmt in EXPORT_FORMATS}}
+
+    def _start_pool(self, name):
+        workers, initializer = self.pool_args[name]
+        setattr(self, name, ProcessPoolExecutor(max_workers=workers, initializer=initializer))
+
+    def close(self):
+        self.price_pool.shutdown(cancel_futures=True)
+        self.pdf_pool.shutdown(cancel_futures=True)
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, kind):
+        sem = self.limits[kind]
+        try: await asyncio.wait_for(sem.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise HttpError(503, f"too many {kind} requests in flight, retry shortly", retry_after=1) from None
+        self.stats[f"{kind}_requests"] += 1
+        self.in_flight[kind] += 1
+        try: yield
+        finally:
+            self.in_flight[kind] -= 1
+            sem.release()
+
+    async def _in_pool(self, name, fn, *args):
+        pool = getattr(self, name)
+        try: return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except QuoteError as e: raise HttpError(422, str(e)) from None
+        except BrokenProcessPool:
+            if getattr(self, name) is pool: # the first request to see it replaces the pool
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._start_pool(name)
+                self.stats["pool_restarts"] += 1
+            raise HttpError(503, "a worker process died, retry shortly", retry_after=1) from None
+
+    # --- routes: each returns (status, body, content type) ---
+    async def health(self, body):
+        return 200, {"status": "ok", "catalog": get_catalog().version, "uptime_s": round(time.time() - self.started, 1),
+                     "connections": self.connections, "in_flight": self.in_flight, **self.stats}, "application/json"
+
+    async def quote(self, body):
+        quote = _json_body(body)
+        async with self._slot("quote"):
+            lines = quote.get("lines") if isinstance(quote, dict) else None
+            if isinstance(lines, list) and len(lines) > INLINE_LINES: return 200, await self._in_pool("price_pool", price_quote, quote), "application/json"
+            try: return 200, price_quote(quote), "application/json"
+            except QuoteError as e: raise HttpError(422, str(e)) from None
+
+    async def quotes(self, body):
+        req = _json_body(body)
+        if isinstance(req, list): req = {"quotes": req}
+        if not isinstance(req, dict) or not isinstance(req.get("quotes"), list): raise HttpError(400, 'expected {"quotes": [...]} or a list of quotes')
+        quotes = req["quotes"]
+        if len(quotes) > MAX_BATCH: raise HttpError(413, f"at most {MAX_BATCH} quotes per batch")
+        async with self._slot("quotes"):
+            chunks = [quotes[i:i + BATCH_CHUNK] for i in range(0, len(quotes), BATCH_CHUNK)]
+            done = await asyncio.gather(*(self._in_pool("price_pool", price_chunk, c, bool(req.get("lines"))) for c in chunks))
+        results = [r for chunk in done for r in chunk]
+        return 200, {"catalog": get_catalog().version, "count": len(results), "errors": sum("error" in r for r in results),
+                     "results": results}, "application/json"
+
+    async def pdf(self, body):
+        quote = _json_body(body)
+        async with self._slot("pdf"):
+            return 200, await self._in_pool("pdf_pool", render_pdf, quote), "application/pdf"
+
+    async def export(self, fmt, body):
+        # CSV and HTML of a small quote are written on the event loop, like
+        # /v1/quote; XLSX and large quotes go to the pricing pool.
+        quote = _json_body(body)
+        content_type = quote_export.FORMATS[fmt][1]
+        async with self._slot("quote"):
+            lines = quote.get("lines") if isinstance(quote, dict) else None
+            if fmt == "xlsx" or (isinstance(lines, list) and len(lines) > INLINE_LINES):
+                return 200, await self._in_pool("price_pool", render_export, quote, fmt), content_type
+            try: return 200, render_export(quote, fmt), content_type
+            except QuoteError as e: raise HttpError(422, str(e)) from None
+
+    # --- connections ---
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.connections > MAX_CONNECTIONS:
+                writer.write(_response(503, {"error": "too many connections"}, keep_alive=False, retry_after=1))
+                return
+            while True:
+                try: req = await asyncio.wait_for(_read_request(reader), KEEPALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError): return
+                except HttpError as e:
+                    writer.write(_response(e.status, {"error": str(e)}, keep_alive=False))
+                    return
+                if req is None: return
+                method, path, version, headers, body = req
+                conn = headers.get("connection", "").lower()
+                keep_alive = conn != "close" and (version == "HTTP/1.1" or conn == "keep-alive")
+                writer.write(await self.dispatch(method, path, body, keep_alive))
+                await writer.drain()
+                if not keep_alive: return
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            with contextlib.suppress(ConnectionError): writer.close()
+
+    async def dispatch(self, method, path, body, keep_alive):
+        self.stats["requests"] += 1
+        route = self.routes.get((method, path))
+        try:
+            if route is None:
+                allowed = [m for m, p in self.routes if p == path]
+                raise HttpError(405 if allowed else 404, f"{method} {path} is not supported" if allowed else f"no such endpoint: {path}")
+            status, payload, content_type = await route(body)
+            return _response(status, payload, content_type, keep_alive)
+        except HttpError as e:
+            self.stats["errors"] += 1
+            return _response(e.status, {"error": str(e)}, keep_alive=keep_alive, retry_after=e.retry_after)
+        except Exception as e: # a bug, not a bad request: report it and keep serving
+            self.stats["errors"] += 1
+            return _response(500, {"error": f"{type(e).__name__}: {e}"}, keep_alive=keep_alive)
+
+
+async def serve(host, port, price_workers, pdf_workers):
+    service = QuoteService(price_workers, pdf_workers)
+    server = await asyncio.start_server(service.handle, host, port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError): loop.add_signal_handler(sig, stop.set)
+    print(f"quote service on http://{host}:{port} (catalog {get_catalog().version}, "
+          f"{price_workers} pricing / {pdf_workers} PDF workers)", flush=True)
+    async with server:
+        await stop.wait()
+    service.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Serve quote pricing and PDFs over local HTTP/JSON.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--price-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    ap.add_argument("--pdf-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = ap.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, args.price_workers, args.pdf_workers))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import collections
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import engine
+
+# Saved quotes live in a local SQLite database ($QUOTE_DB, default quotes.db
+# next to this module) in WAL mode. A quote is one header row (names, dates,
+# step 3/5 inputs as JSON) plus one row per line, so an autosave only rewrites
+# the lines that changed since the last save.
+DB_PATH = os.environ.get("QUOTE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "quotes.db"))
+SAVED_KEYS = ("step", "quote_date", *engine.ACCOUNT_DEFAULTS, *engine.STEP5_DEFAULTS)
+SNAPSHOT_LIMIT = 256 # quotes whose last-saved rows are kept in memory
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    id INTEGER PRIMARY KEY,
+    biz_name TEXT NOT NULL COLLATE NOCASE,
+    rep_name TEXT NOT NULL COLLATE NOCASE,
+    created TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    n_lines INTEGER NOT NULL,
+    mrc REAL,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quotes_biz ON quotes (biz_name, updated);
+CREATE INDEX IF NOT EXISTS quotes_rep ON quotes (rep_name, updated);
+CREATE INDEX IF NOT EXISTS quotes_updated ON quotes (updated);
+CREATE TABLE IF NOT EXISTS lines (
+    quote_id INTEGER NOT NULL REFERENCES quotes (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (quote_id, idx)
+) WITHOUT ROWID;
+"""
+
+
+def _now():
+    return datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+
+
+def _digest(line_json):
+    # The save snapshot keeps 16-byte digests, not each line's JSON.
+    return hashlib.blake2b(line_json.encode(), digest_size=16).digest()
+
+
+def _like_prefix(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class QuoteStore:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._saved = collections.OrderedDict() # quote_id -> (state json, mrc, [line digest])
+        self._stats = {"saves": 0, "unchanged": 0, "lines_written": 0}
+
+    def close(self):
+        with self._lock: self._conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # The connection is in autocommit mode (isolation_level=None), where
+        # `with conn:` opens no transaction; a save must land all or nothing.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try: yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _snapshot(self, quote_id):
+        snap = self._saved.get(quote_id)
+        if snap is not None:
+            self._saved.move_to_end(quote_id)
+            return snap
+        row = self._conn.execute("SELECT state, mrc FROM quotes WHERE id = ?", (quote_id,)).fetchone()
+        if row is None: return None
+        lines = [_digest(d) for (d,) in self._conn.execute("SELECT data FROM lines WHERE quote_id = ? ORDER BY idx", (quote_id,))]
+        return self._remember(quote_id, (row[0], row[1], lines))
+
+    def _remember(self, quote_id, snap):
+        self._saved[quote_id] = snap
+        self._saved.move_to_end(quote_id)
+        while len(self._saved) > SNAPSHOT_LIMIT: self._saved.popitem(last=False)
+        return snap
+
+    def save(self, quote, quote_id=None, mrc=None):
+        # Returns the quote id (a new one if quote_id is None or was deleted).
+        # Only lines whose JSON differs from the last save are written; an
+        # unchanged quote costs the serialization and no database write.
+        state = json.dumps({k: quote[k] for k in SAVED_KEYS if k in quote}, sort_keys=True)
+        lines = [json.dumps(dict(l), sort_keys=True) for l in quote.get('lines', [])]
+        digests = [_digest(d) for d in lines]
+        names = (quote.get('biz_name', ""), quote.get('rep_name', ""))
+        with self._lock:
+            prev = self._snapshot(quote_id) if quote_id is not None else None
+            if prev == (state, mrc, digests):
+                self._stats["unchanged"] += 1
+                return quote_id
+            now = _now()
+            with self._transaction():
+                if prev is None:
+                    quote_id = self._conn.execute(
+                        "INSERT INTO quotes (biz_name, rep_name, created, updated, n_lines, mrc, state) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (*names, now, now, len(lines), mrc, state)).lastrowid
+                    prev_lines = []
+                else:
+                    self._conn.execute("UPDATE quotes SET biz_name = ?, rep_name = ?, updated = ?, n_lines = ?, mrc = ?, state = ? WHERE id = ?",
+                                       (*names, now, len(lines), mrc, state, quote_id))
+                    prev_lines = prev[2]
+                changed = [(quote_id, i, d) for i, (d, h) in enumerate(zip(lines, digests)) if i >= len(prev_lines) or prev_lines[i] != h]
+                self._conn.executemany("INSERT OR REPLACE INTO lines (quote_id, idx, data) VALUES (?, ?, ?)", changed)
+                if len(prev_lines) > len(lines):
+                    self._conn.execute("DELETE FROM lines WHERE quote_id = ? AND idx >= ?", (quote_id, len(lines)))
+            self._remember(quote_id, (state, mrc, digests))
+            self._stats["saves"] += 1
+            self._stats["lines_written"] += len(changed)
+            return quote_id
+
+    def load(self, quote_id):
+        # The saved quote as a plain mapping: `lines` plus the SAVED_KEYS.
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM quotes WHERE id = ?", (quote_id,)).fetchone()
+            if row is None: raise KeyError(quote_id)
+            lines = [json.loads(d) for (d,) in self._conn.execute("SELECT data FROM lines WHERE quote_id = ? ORDER BY idx", (quote_id,))]
+        return dict(json.loads(row[0]), lines=lines)
+
+    def delete(self, quote_id):
+        with self._lock, self._transaction():
+            self._conn.execute("DELETE FROM quotes WHERE id = ?", (quote_id,))
+            self._saved.pop(quote_id, None)
+
+    def search(self, biz="", rep="", since=None, until=None, limit=25):
+        # Case-insensitive prefix match on business and rep name, optionally
+        # limited to quotes last updated between two dates, newest first.
+        where, args = [], []
+        if biz: where.append("biz_name LIKE ? ESCAPE '\\'"); args.append(_like_prefix(biz))
+        if rep: where.append("rep_name LIKE ? ESCAPE '\\'"); args.append(_like_prefix(rep))
+        if since: where.append("updated >= ?"); args.append(str(since))
+        if until: where.append("updated < ?"); args.append(str(until + datetime.timedelta(days=1)))
+        sql = "SELECT id, biz_name, rep_name, updated, n_lines, mrc FROM quotes"
+        if where: sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY updated DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (*args, limit)).fetchall()
+        return [dict(zip(("id", "biz_name", "rep_name", "updated", "n_lines", "mrc"), r)) for r in rows]
+
+    def stats(self):
+        return dict(self._stats)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    # One connection per process, shared by every session.
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None: _store = QuoteStore()
+    return _store
@@ -0,0 +1,208 @@
+import array
+import bisect
+import csv
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+
+# Sales tax rates by ZIP code for the step 5 due-today calculator, from an
+# offline table ($QUOTE_TAX_TABLE, default tax_rates.bin next to this module)
+# built from a CSV of zip,rate[,jurisdiction] rows. No rates ship with the app;
+# without a table the ZIP field is hidden and tax_rate is typed by hand.
+#
+#   python tax_rates.py build rates.csv          # -> tax_rates.bin
+#   python tax_rates.py lookup 10001 94105-1420
+#
+# The table is memory-mapped and searched in place: ZIPs are a sorted uint32
+# column bisected where it lies, so every session and worker process shares the
+# same pages and a lookup allocates only its result. A ZIP may have several
+# rows (one per jurisdiction), kept in source order; the first is its default.
+TABLE_PATH = os.environ.get("QUOTE_TAX_TABLE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tax_rates.bin"))
+CHECK_INTERVAL = 2.0 # seconds between mtime checks
+MAGIC = b"ZTAX"
+FORMAT_VERSION = 1
+RATE_SCALE = 10000 # rates are stored in ten-thousandths of a percent
+MAX_RATE = 30.0
+# magic, version, reserved, rows, jurisdiction names, name bytes; then the
+# zip, rate and name columns (uint32 x rows), name offsets (uint32 x names + 1)
+# and the UTF-8 names, all little-endian.
+HEADER = struct.Struct("<4sHHIII")
+U32 = "I" if array.array("I").itemsize == 4 else "L"
+_ZIP = re.compile(r"(\d{5})(?:-\d{4})?")
+
+
+class TaxTableError(ValueError):
+    def __init__(self, problems):
+        super().__init__("invalid tax table: " + "; ".join(problems[:10]) + (f"; and {len(problems) - 10} more" if len(problems) > 10 else ""))
+        self.problems = problems
+
+
+def zip_key(zip_code):
+    # 5-digit ZIP (or ZIP+4, or an int that lost its leading zeros) -> int, else None.
+    if isinstance(zip_code, int) and not isinstance(zip_code, bool): return zip_code if 0 <= zip_code <= 99999 else None
+    m = _ZIP.fullmatch(str(zip_code or "").strip())
+    return int(m.group(1)) if m else None
+
+
+# --- BUILD ---
+def read_csv(f):
+    # (zip, rate, jurisdiction) rows from a CSV with zip and rate columns and an
+    # optional jurisdiction column; raises TaxTableError listing bad rows.
+    reader = csv.DictReader(f)
+    cols = {c.strip().lower(): c for c in reader.fieldnames or ()}
+    if "zip" not in cols or "rate" not in cols: raise TaxTableError(["header: needs zip and rate columns"])
+    zip_col, rate_col, name_col = cols["zip"], cols["rate"], cols.get("jurisdiction")
+    rows, problems = [], []
+    for n, r in enumerate(reader, 2):
+        z = zip_key(r[zip_col])
+        try: rate = float(r[rate_col])
+        except (TypeError, ValueError): rate = -1.0
+        if z is None: problems.append(f"row {n}: bad zip {r[zip_col]!r}")
+        elif not 0 <= rate <= MAX_RATE: problems.append(f"row {n}: rate must be a percentage between 0 and {MAX_RATE:g}")
+        else: rows.append((z, rate, (r[name_col] or "").strip() if name_col else ""))
+    if problems: raise TaxTableError(problems)
+    return rows
+
+
+def build(rows, path=TABLE_PATH):
+    # Writes the table for (zip, rate, jurisdiction) rows atomically; returns
+    # the number of rows. Rows of one ZIP keep their input order.
+    rows = sorted(rows, key=lambda r: r[0])
+    names = {}
+    for _, _, name in rows: names.setdefault(name, len(names))
+    blob = "".join(names).encode()
+    offsets = array.array(U32, [0])
+    for name in names: offsets.append(offsets[-1] + len(name.encode()))
+    cols = [array.array(U32, (r[0] for r in rows)), array.array(U32, (round(r[1] * RATE_SCALE) for r in rows)),
+            array.array(U32, (names[r[2]] for r in rows)), offsets]
+    if sys.byteorder == "big":
+        for c in cols: c.byteswap()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(rows), len(names), len(blob)))
+        for c in cols: c.tofile(f)
+        f.write(blob)
+    os.replace(tmp, path)
+    return len(rows)
+
+
+# --- LOOKUP ---
+class TaxTable:
+    def __init__(self, path=TABLE_PATH):
+        if sys.byteorder == "big": raise TaxTableError(["tables are little-endian; this host is not"])
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size: raise TaxTableError([f"{path}: too short"])
+        magic, version, _, rows, names, blob = HEADER.unpack_from(self._mm)
+        if magic != MAGIC or version != FORMAT_VERSION: raise TaxTableError([f"{path}: not a version {FORMAT_VERSION} tax table"])
+        if len(self._mm) != HEADER.size + 4 * (3 * rows + names + 1) + blob: raise TaxTableError([f"{path}: truncated"])
+        view, off = memoryview(self._mm), HEADER.size
+        self._zips, self._rates, self._name_ix = (view[off + 4 * rows * k:off + 4 * rows * (k + 1)].cast(U32) for k in range(3))
+        off += 12 * rows
+        self._name_offsets = view[off:off + 4 * (names + 1)].cast(U32)
+        self._names = view[off + 4 * (names + 1):]
+
+    def __len__(self):
+        return len(self._zips)
+
+    def _name(self, i):
+        return bytes(self._names[self._name_offsets[i]:self._name_offsets[i + 1]]).decode()
+
+    def lookup(self, zip_code):
+        # [(jurisdiction, rate %)] for a ZIP, default first; [] if it isn't listed.
+        z = zip_key(zip_code)
+        if z is None: return []
+        lo = bisect.bisect_left(self._zips, z)
+        hi = bisect.bisect_right(self._zips, z, lo)
+        return [(self._name(self._name_ix[i]), round(self._rates[i] / RATE_SCALE, 4)) for i in range(lo, hi)]
+
+    def rate(self, zip_code):
+        # The ZIP's default rate, or None; no jurisdiction names are decoded.
+        z = zip_key(zip_code)
+        if z is None: return None
+        i = bisect.bisect_left(self._zips, z)
+        return round(self._rates[i] / RATE_SCALE, 4) if i < len(self) and self._zips[i] == z else None
+
+
+# --- PROCESS-WIDE TABLE ---
+_lock = threading.Lock()
+_current = None
+_stat = None
+_checked = 0.0
+last_error = None
+
+
+def get_table():
+    # The installed table, or None if there isn't one. Like the catalog, it is
+    # opened once per process and reopened when the file on disk changes; a
+    # bad file keeps the last good table and is reported through `last_error`.
+    global _current, _stat, _checked, last_error
+    now = time.monotonic()
+    if now - _checked < CHECK_INTERVAL: return _current
+    with _lock:
+        if now - _checked < CHECK_INTERVAL: return _current
+        _checked = now
+        try: st = os.stat(TABLE_PATH)
+        except FileNotFoundError:
+            _current = _stat = last_error = None
+            return None
+        stat = (st.st_mtime_ns, st.st_size)
+        if stat != _stat:
+            try:
+                _current = TaxTable(TABLE_PATH)
+                last_error = None
+            except (TaxTableError, OSError, ValueError) as e: last_error = str(e)
+            _stat = stat
+        return _current
+
+
+def rate_for(zip_code):
+    # The default rate for a ZIP, for quotes that give a zip but no tax_rate.
+    table = get_table()
+    if table is None: raise LookupError("no tax-rate table is installed")
+    rate = table.rate(zip_code)
+    if rate is None: raise LookupError(f"no tax rate on file for ZIP {zip_code!r}")
+    return rate
+
+
+def fill_tax_rate(quote):
+    # Batch files and the service: a quote with a zip and no tax_rate takes the
+    # table's rate. Raises LookupError when the table can't supply one.
+    if quote.get("zip") and "tax_rate" not in quote: quote["tax_rate"] = rate_for(quote["zip"])
+    return quote
+
+
+def main(argv=None):
+    import argparse # the app imports this module; only the CLI needs argparse
+    ap = argparse.ArgumentParser(description="Build or query the ZIP code sales tax table.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="compile a zip,rate[,jurisdiction] CSV into the table")
+    b.add_argument("csv")
+    b.add_argument("-o", "--out", default=TABLE_PATH)
+    q = sub.add_parser("lookup", help="print the rates on file for ZIP codes")
+    q.add_argument("zips", nargs="+")
+    q.add_argument("-t", "--table", default=TABLE_PATH)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        try:
+            with open(args.csv, newline="", encoding="utf-8-sig") as f: n = build(read_csv(f), args.out)
+        except TaxTableError as e:
+            print(e, file=sys.stderr)
+            return 1
+        print(f"{n:,} rows -> {args.out} ({os.path.getsize(args.out):,} bytes)")
+        return 0
+    table = TaxTable(args.table)
+    for z in args.zips:
+        rows = table.lookup(z)
+        print(f"{z}: " + (", ".join(f"{r:g}%" + (f" ({name})" if name else "") for name, r in rows) if rows else "not on file"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
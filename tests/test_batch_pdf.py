@@ -0,0 +1,21 @@
+import batch_pdf
+
+
+def test_unparseable_csv_quote_is_reported_not_raised(tmp_path):
+    path = tmp_path / "quotes.csv"
+    path.write_text("quote_id,type,plan,dev_pay\nA1,Smartphone,My Biz,20\nX9,Smartphone,My Biz,abc\nX9,Tablet,,\nB2,Smartphone,Pro 5G,0\n")
+    quotes = list(batch_pdf.read_csv(str(path)))
+    assert len(quotes) == 3 and quotes[0]["quote_id"] == "A1" and quotes[2]["quote_id"] == "B2"
+    assert quotes[1] == batch_pdf.Unreadable("X9", "line 3: dev_pay: expected a number, got 'abc'")
+    entry = batch_pdf.render_quote((2, quotes[1], str(tmp_path), "csv"))
+    assert entry == {"quote_id": "X9", "error": quotes[1].error}
+
+
+def test_unparseable_jsonl_lines_are_reported_not_raised(tmp_path):
+    path = tmp_path / "quotes.jsonl"
+    path.write_text('{"quote_id": "A1", "lines": [{}]}\n{"lines": [oops\n[1]\n\n{"quote_id": "B2"}\n')
+    quotes = list(batch_pdf.read_jsonl(str(path)))
+    assert [q["quote_id"] if isinstance(q, dict) else q.error[:6] for q in quotes] == ["A1", "line 2", "line 3", "B2"]
+    entries = [batch_pdf.render_quote((i, q, str(tmp_path), "csv")) for i, q in enumerate(quotes, 1)]
+    assert [e["quote_id"] for e in entries] == ["A1", 2, 3, "B2"]
+    assert ["error" in e for e in entries] == [False, True, True, False]
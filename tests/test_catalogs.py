@@ -0,0 +1,77 @@
+import datetime
+import json
+import random
+
+import pytest
+
+import bench
+import catalogs
+
+
+@pytest.fixture(scope="module")
+def data():
+    with open(catalogs.CATALOG_PATH, "rb") as f: return json.load(f)
+
+
+@pytest.mark.parametrize("path, value", [
+    (("promos",), []),
+    (("promos", "Pro"), "x"),
+    (("promos", "Pro", 0), "a promo"),
+    (("smartphone_tiers", "My Biz"), 5),
+    (("smartphone_static",), []),
+    (("smartphone_features", "VBMIS (Paid)"), 2.0),
+    (("multi_prot", 0), None),
+    (("multi_prot",), {}),
+    (("standard_internet",), [[1]]),
+    (("price_changes",), [{"table": "smartphone_tiers", "name": ["My Biz"], "prices": [1, 2, 3, 4, 5]}]),
+])
+def test_malformed_catalog_raises_catalog_error(data, path, value):
+    data = json.loads(json.dumps(data))
+    target = data
+    for k in path[:-1]: target = target[k]
+    target[path[-1]] = value
+    with pytest.raises(catalogs.CatalogError):
+        catalogs.compile_catalog(json.dumps(data).encode())
+
+
+def test_bad_reload_keeps_last_good_catalog(data, tmp_path, monkeypatch):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(data))
+    monkeypatch.setattr(catalogs, "CATALOG_PATH", str(path))
+    for name in ("_current", "_stat", "last_error"): monkeypatch.setattr(catalogs, name, None)
+    monkeypatch.setattr(catalogs, "_checked", 0.0)
+    good = catalogs._reload(0.0)
+    path.write_text(json.dumps(dict(data, promos=[]))) # a different size, so the mtime check can't miss it
+    assert catalogs._reload(catalogs.CHECK_INTERVAL * 2) is good
+    assert catalogs.last_error and "promos" in catalogs.last_error
+    path.unlink()
+    assert catalogs._reload(catalogs.CHECK_INTERVAL * 4) is good
+    assert "No such file" in catalogs.last_error
+    path.write_text(json.dumps(dict(data, version="next")))
+    assert catalogs._reload(catalogs.CHECK_INTERVAL * 6).version == "next" and catalogs.last_error is None
+
+
+def _in_effect(span, on):
+    start, end = span
+    return (start is None or start <= on) and (end is None or on < end)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_interval_index_matches_brute_force(seed):
+    rng = random.Random(seed)
+    day = lambda n: (datetime.date(2024, 1, 1) + datetime.timedelta(days=n)).isoformat()
+    spans = []
+    for _ in range(rng.randint(0, 200)):
+        a, b = sorted(rng.randint(0, 400) for _ in range(2))
+        spans.append((rng.choice([None, day(a)]), rng.choice([None, day(b + 1)])))
+    index = catalogs.IntervalIndex(spans)
+    for n in range(-5, 410, 3):
+        assert index.stab(day(n)) == [i for i, span in enumerate(spans) if _in_effect(span, day(n))]
+
+
+def test_history_records_match_brute_force():
+    history = bench.synthetic_history(years=2, seed=1)
+    first = datetime.date.today() - datetime.timedelta(days=2 * 365 + 5)
+    for n in range(0, 2 * 365 + 10, 7):
+        on = (first + datetime.timedelta(days=n)).isoformat()
+        assert history.records(on) == [r for r in history._records if _in_effect(catalogs._span(r[1]), on)]
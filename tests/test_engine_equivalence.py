@@ -0,0 +1,97 @@
+import random
+
+import numpy as np
+import pytest
+
+import bench
+import engine
+from catalogs import get_catalog
+
+# The vectorized paths against the per-quote reference, engine.get_totals(),
+# on seeded random quotes.
+
+
+def random_quotes(seed, count=60):
+    rng, cat = random.Random(seed), get_catalog()
+    quotes = []
+    for i in range(count):
+        q = bench.synthetic_quote(rng.choice([1, 2, 5, 12, 40]), rng.choice(["bare", "loaded"]), rng.choice(["none", "catalog", "custom"]), seed=f"{seed}-{i}")
+        q.update(autopay=rng.random() < 0.5, military=rng.random() < 0.3, joint_offer=rng.random() < 0.3, whole_office=rng.random() < 0.3,
+                 tmp_multi=rng.choice(["None"] + [m['name'] for m in cat.multi_prot]))
+        for l in q['lines']:
+            if l['type'] == "Internet" and rng.random() < 0.5: l['plan'] = rng.choice(sorted(cat.standard_internet))
+            if l['plan'] == "My Biz" and rng.random() < 0.3: l['intro_disc'] = True
+        quotes.append(q)
+    return quotes
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_price_batch_matches_get_totals(seed):
+    quotes = random_quotes(seed)
+    r = engine.price_batch(quotes)
+    off = 0
+    for i, q in enumerate(quotes):
+        details, mrc, one_time, taxable, acct_extras = engine.get_totals(q)
+        n = len(details)
+        assert np.allclose(r['line_total'][off:off + n], [d['total'] for d in details])
+        assert [engine.TIER_NAMES[t] for t in r['line_tier'][off:off + n]] == [d['tier'] for d in details]
+        assert np.allclose([r['mrc'][i], r['one_time'][i], r['taxable'][i], r['acct_extras'][i]], [mrc, one_time, taxable, acct_extras])
+        off += n
+    assert off == len(r['line_total'])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_scenario_matrix_matches_get_totals(seed):
+    cat = get_catalog()
+    for q in random_quotes(seed, count=20):
+        scenarios = engine.account_scenarios(q['lines'], cat)
+        variants = [q['lines'], engine.swap_plans(q['lines'], "My Biz", "Pro 5G"), engine.swap_plans(q['lines'], "Pro 5G", "My Biz")]
+        m = engine.scenario_matrix(variants, scenarios, cat)
+        assert m.shape == (len(variants), len(scenarios))
+        for v, lines in enumerate(variants):
+            for s, scen in enumerate(scenarios):
+                # Step 4 drops the intro discount when the military discount is on.
+                priced = [dict(l, intro_disc=False) for l in lines] if scen['military'] else lines
+                assert m[v, s] == pytest.approx(engine.get_totals(dict(scen, lines=priced), cat)[1])
+
+
+def _edit(rng, q, cat):
+    # One edit as the wizard makes it: an account toggle, a plan change (which
+    # can move tier_idx), a single line field changed in place, or a line
+    # added or removed.
+    lines, kind = q['lines'], rng.randrange(6)
+    if kind == 0:
+        key = rng.choice(["autopay", "military", "joint_offer", "whole_office"])
+        q[key] = not q[key]
+    elif kind == 1: q['tmp_multi'] = rng.choice(["None"] + [m['name'] for m in cat.multi_prot])
+    elif kind == 2 and lines:
+        l = rng.choice(lines)
+        l['plan'] = rng.choice(cat.plans_by_type[l['type']])
+        if l['plan'] != "My Biz": l['features'] = []
+    elif kind == 3 and lines:
+        l = rng.choice(lines)
+        field = rng.choice(["dev_pay", "byod", "port_in", "intro_disc", "protection", "features", "promo_selection"])
+        if field == "dev_pay": l[field] = rng.choice([0.0, 19.99, 41.5])
+        elif field == "protection": l[field] = rng.choice(list(cat.single_prot))
+        elif field == "features": l[field] = rng.sample(list(cat.addons), rng.randint(0, 2)) if l['plan'] == "My Biz" else []
+        elif field == "promo_selection":
+            tier = engine.get_totals(dict(q, lines=[l]), cat)[0][0]['tier']
+            l[field] = rng.choice(["None"] + [p['name'] for p in cat.eligible_promos(tier, l['byod'], l['port_in'])])
+        else: l[field] = not l[field]
+    elif kind == 4: lines.insert(rng.randint(0, len(lines)), bench.synthetic_line(rng, cat, "loaded", "catalog"))
+    elif lines: lines.pop(rng.randrange(len(lines)))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_totals_cache_matches_get_totals_under_edits(seed):
+    rng, cat = random.Random(seed), get_catalog()
+    q = random_quotes(seed, count=1)[0]
+    cache = engine.TotalsCache()
+    for _ in range(150):
+        _edit(rng, q, cat)
+        details, *rest = cache.get_totals(q, cat)
+        ref_details, *ref_rest = engine.get_totals(q, cat)
+        assert [dict(d) for d in details] == [dict(d) for d in ref_details]
+        assert rest == pytest.approx(ref_rest)
+    stats = cache.stats()
+    assert stats["misses"] > 0 and stats["line_hits"] > 0
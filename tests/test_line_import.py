@@ -0,0 +1,13 @@
+import io
+
+import pytest
+
+import line_import
+
+
+@pytest.mark.parametrize("amount", ["nan", "inf", "-Infinity", "-5", "abc"])
+def test_bad_amounts_are_row_errors(amount):
+    f = io.BytesIO(f'type,plan,dev_pay\nSmartphone,My Biz,{amount}\nSmartphone,My Biz,"$1,200.50"\n'.encode())
+    r = line_import.import_lines(f, "lines.csv")
+    assert r["bad_rows"] == 1 and r["errors"][0][:2] == (2, "dev_pay")
+    assert [l["dev_pay"] for l in r["lines"]] == [1200.5]
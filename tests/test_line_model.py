@@ -0,0 +1,65 @@
+import pickle
+import random
+
+import pytest
+
+import line_model
+from catalogs import get_catalog
+from line_model import Line
+
+
+def old_line(rng, cat):
+    # A line as the wizard stored it before Line: a plain dict of FIELDS,
+    # custom_promo_val only once a custom promo was set.
+    d = dict(line_model.DEFAULTS, type=rng.choice(["Smartphone", "Tablet", "Internet"]), plan=rng.choice(["My Biz", "Pro 5G"]),
+             features=rng.sample(list(cat.addons), rng.randint(0, 3)), sp_features=rng.sample(list(cat.smartphone_features), rng.randint(0, 2)),
+             dev_pay=rng.choice([0.0, 29.99]), byod=rng.random() < 0.5, port_in=rng.random() < 0.5)
+    if rng.random() < 0.3: d.update(promo_selection="Custom", custom_promo_val=rng.choice([0.0, 250.0]))
+    # Lists read back in catalog order, so the old dicts are compared in it too.
+    for k, names in (("features", cat.addons), ("sp_features", cat.smartphone_features)): d[k] = [n for n in names if n in d[k]]
+    return d
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_line_matches_the_old_dicts(seed):
+    d = old_line(random.Random(seed), get_catalog())
+    l = Line(d)
+    assert dict(l) == d and l == d and len(l) == len(d) and set(l) == set(d)
+    assert l.row() == line_model.row(l) == line_model.row(d)
+    assert Line(dict(l)) == l and pickle.loads(pickle.dumps(l)) == l
+    assert ("custom_promo_val" in l) == ("custom_promo_val" in d)
+
+
+def test_row_defaults_a_missing_custom_value():
+    l = Line()
+    assert "custom_promo_val" not in l and l.get("custom_promo_val") is None
+    assert l.row()[line_model.ROW.index("custom_promo_val")] == 0.0
+    l["custom_promo_val"] = 120.0
+    assert l.row() == line_model.row(dict(l))
+    del l["custom_promo_val"]
+    assert l.row()[-1] == 0.0 and dict(l) == dict(line_model.DEFAULTS)
+
+
+def test_features_add_and_remove():
+    cat = get_catalog()
+    a, b = list(cat.addons)[:2]
+    l = Line()
+    l['features'] = [b, a]
+    assert l['features'] == [a, b] # catalog order
+    l['features'] = [f for f in l['features'] if f != a]
+    assert l['features'] == [b]
+    l['sp_features'] = l['sp_features'] + ["Not In The Catalog"]
+    assert l['sp_features'] == ["Not In The Catalog"] and l.row()[3] == ("Not In The Catalog",)
+    l['features'] = []
+    assert l['features'] == [] and l.row()[2] == ()
+
+
+def test_extra_keys_and_copies():
+    l = Line(plan="Pro 5G", note="keep")
+    c = l.copy()
+    c['plan'], c['note'] = "My Biz", "changed"
+    assert (l['plan'], l['note']) == ("Pro 5G", "keep") and "note" in dict(l)
+    del c['note']
+    assert "note" not in c
+    with pytest.raises(KeyError): del c['note']
+    with pytest.raises(KeyError): l['missing']
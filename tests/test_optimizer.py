@@ -0,0 +1,131 @@
+import functools
+import itertools
+import json
+import random
+
+import pytest
+
+import catalogs
+import engine
+import optimizer
+
+# optimize() against an exhaustive search over every plan, add-on set and
+# protection mode of small random quotes, on a trimmed catalog so the product
+# stays small. Promos and per-line protection don't move tier_idx, so for a
+# fixed plan assignment and protection mode each line takes its cheapest.
+PLANS = ("My Biz", "Plus 5G")
+
+
+@pytest.fixture(scope="module")
+def small():
+    with open(catalogs.CATALOG_PATH, "rb") as f: data = json.load(f)
+    data["addons"] = {k: data["addons"][k] for k in ("Premium Network Experience", "Enhanced Video Calling", "Google Workspace")}
+    data["smartphone_features"] = {k: data["smartphone_features"][k] for k in ("Verizon Roadside Assistance", "VBMIS (Paid)")}
+    return catalogs.compile_catalog(json.dumps(data).encode()).as_of()
+
+
+def random_quote(rng, cat):
+    lines = []
+    for _ in range(rng.randint(1, 3)):
+        l = dict(engine.new_line(), type=rng.choice(["Smartphone", "Smartphone", "Tablet", "Internet"]), byod=rng.random() < 0.3, port_in=rng.random() < 0.5)
+        l['plan'] = rng.choice(PLANS if l['type'] == "Smartphone" else cat.plans_by_type[l['type']])
+        if l['plan'] == "My Biz" and rng.random() < 0.4: l['features'] = ["Premium Network Experience"]
+        if l['type'] == "Smartphone" and rng.random() < 0.3: l['sp_features'] = [rng.choice(list(cat.smartphone_features))]
+        if l['type'] != "Internet" and rng.random() < 0.4: l['protection'] = rng.choice(list(cat.single_prot))
+        l['intro_disc'] = l['plan'] == "My Biz" and rng.random() < 0.3
+        l['dev_pay'] = 20.0
+        lines.append(l)
+    modes = [("None", False), ("None", True)] + [(m['name'], False) for m in cat.multi_prot if sum(map(engine.multi_eligible, lines)) >= m['min']]
+    tmp_multi, whole_office = rng.choice(modes)
+    return dict(engine.ACCOUNT_DEFAULTS, autopay=rng.random() < 0.5, military=rng.random() < 0.3,
+                tmp_multi=tmp_multi, whole_office=whole_office, lines=lines)
+
+
+def _covered(l, tmp_multi, whole_office):
+    return l['type'] != "Internet" and (whole_office or (tmp_multi != "None" and engine.multi_eligible(l)))
+
+
+def exhaustive(quote, objective, cat):
+    lines, opts = quote['lines'], engine.account_options(quote)
+    choices = [] # per line: every (plan, features, sp_features) it may take
+    for l in lines:
+        c = []
+        for plan in PLANS if l['type'] == "Smartphone" and l['plan'] in PLANS else (l['plan'],):
+            if plan != "My Biz" and l['features']: continue
+            if plan != l['plan'] and plan == "My Biz" and "VBMIS (Paid)" in l['sp_features']: continue
+            if plan != "My Biz":
+                c.append((plan, l['features'], l['sp_features']))
+                continue
+            extra = [f for f in cat.addons if f not in l['features']]
+            extra_sp = [f for f in cat.smartphone_features if f not in l['sp_features'] and f != "VBMIS (Paid)"]
+            for r in range(len(extra) + 1):
+                for fs in itertools.combinations(extra, r):
+                    for r2 in range(len(extra_sp) + 1):
+                        for sps in itertools.combinations(extra_sp, r2): c.append((plan, l['features'] + list(fs), l['sp_features'] + list(sps)))
+        choices.append(c)
+
+    @functools.lru_cache(maxsize=None)
+    def cheapest(i, j, tier_idx, covered, acct):
+        # Cheapest promo and protection for line i on choice j.
+        l, (plan, features, sp_features) = lines[i], choices[i][j]
+        protected = l['protection'] != "None" or _covered(l, quote['tmp_multi'], quote['whole_office'])
+        if covered: prots = ["None"]
+        elif protected: prots = [p for p in cat.single_prot if l['protection'] in ("None", p)]
+        else: prots = [l['protection']]
+        base = dict(l, plan=plan, features=features, sp_features=sp_features, intro_disc=l['intro_disc'] and plan == "My Biz" and not quote['military'])
+        best = float("inf")
+        for prot in prots:
+            cand = dict(base, protection=prot)
+            promos = [l['promo_selection']]
+            if l['type'] == "Smartphone" and l['promo_selection'] != "Custom":
+                tier = engine.price_line(cand, tier_idx, dict(acct), cat)['tier']
+                promos = ["None"] + [p['name'] for p in cat.eligible_promos(tier, l['byod'], l['port_in'])]
+            for promo in promos: best = min(best, optimizer.line_cost(engine.price_line(dict(cand, promo_selection=promo), tier_idx, dict(acct), cat), objective))
+        return best
+
+    eligible = sum(map(engine.multi_eligible, lines))
+    modes = [(t, w) for t in ["None"] + [m['name'] for m in cat.multi_prot if eligible >= m['min']] for w in (False, True)]
+    best = float("inf")
+    for tmp_multi, whole_office in modes:
+        acct = dict(opts, tmp_multi=tmp_multi, whole_office=whole_office)
+        extras = engine.account_extras(acct, cat) * (1 if objective == "mrc" else optimizer.HORIZON)
+        covered = [_covered(l, tmp_multi, whole_office) for l in lines]
+        for combo in itertools.product(*(range(len(c)) for c in choices)):
+            tier_idx = engine.smartphone_tier_idx([{"plan": choices[i][j][0]} for i, j in enumerate(combo)], cat)
+            best = min(best, extras + sum(cheapest(i, j, tier_idx, covered[i], tuple(acct.items())) for i, j in enumerate(combo)))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("objective", list(optimizer.OBJECTIVES))
+def test_matches_exhaustive_search(small, seed, objective):
+    quote = random_quote(random.Random(seed), small)
+    r = optimizer.optimize(quote, objective, PLANS, small)
+    priced = optimizer.quote_cost(dict(quote, lines=r['lines'], tmp_multi=r['tmp_multi'], whole_office=r['whole_office']), objective, small)
+    assert r['cost'] == pytest.approx(priced)
+    assert r['cost'] == pytest.approx(exhaustive(quote, objective, small))
+
+
+@pytest.mark.parametrize("acct", [{"tmp_multi": "TMP Multi 3-10 Lines"}, {"whole_office": True}])
+def test_keeps_covered_lines_protected(acct):
+    # Five smartphones protected only by the account's plan: the plan may
+    # change, but no line may end up unprotected.
+    cat = catalogs.load_catalog(catalogs.CATALOG_PATH).as_of()
+    quote = dict(engine.ACCOUNT_DEFAULTS, **acct, lines=[engine.new_line() for _ in range(5)])
+    r = optimizer.optimize(quote, "mrc", None, cat)
+    for l in r['lines']: assert l['protection'] != "None" or _covered(l, r['tmp_multi'], r['whole_office'])
+    unprotected = optimizer.optimize(dict(quote, tmp_multi="None", whole_office=False), "mrc", None, cat)
+    assert r['cost'] > unprotected['cost']
+
+
+def test_mrc_keeps_one_time_promos():
+    # A monthly promo lowers the MRC, but swapping "Pay Off Your Phone" for
+    # one would drop the $800 one-time credit each line already has.
+    cat = catalogs.load_catalog(catalogs.CATALOG_PATH).as_of()
+    line = dict(engine.new_line(), plan="Pro 5G", port_in=True, promo_selection="Pay Off Your Phone")
+    quote = dict(engine.ACCOUNT_DEFAULTS, lines=[line, dict(line, promo_selection="None")])
+    r = optimizer.optimize(quote, "mrc", None, cat)
+    assert r['lines'][0]['promo_selection'] == "Pay Off Your Phone"
+    assert r['lines'][1]['promo_selection'] != "None" and r['cost'] < r['before']
+    details = engine.get_totals(dict(quote, lines=r['lines']), cat)[0]
+    assert sum(d['promo_val'] for d in details if d['promo_term'] == "One-Time") == 800.0
@@ -0,0 +1,85 @@
+import collections
+import threading
+import uuid
+
+import pytest
+
+import metrics
+import pdf_quote
+import pdf_worker
+
+
+def test_render_time_lands_on_the_requesting_rerun(monkeypatch, tmp_path):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "_totals", {})
+    # timed() decorates at import; wrap the stub now that metrics are on.
+    monkeypatch.setattr(pdf_quote, "create_pro_pdf", metrics.timed("create_pro_pdf")(lambda model: b"%PDF"))
+    key = uuid.uuid4().hex
+    metrics.begin_rerun("s1", "step 5")
+    pdf_worker.request(key, {}, "s1")
+    assert pdf_worker.result(key, timeout=None) == b"%PDF"
+    rec = metrics.end_rerun()
+    assert rec.stages["create_pro_pdf"][0] == 1
+    # A render that outlives its rerun still counts in the process totals.
+    calls = metrics.totals()["create_pro_pdf"][0]
+    rec.add("create_pro_pdf", 0.5)
+    assert metrics.totals()["create_pro_pdf"][0] == calls + 1 and rec.stages["create_pro_pdf"][0] == 1
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    # Empty cache and counters, and a stub render that echoes the model.
+    for name, value in (("_cache", collections.OrderedDict()), ("_cache_bytes", 0), ("_inflight", {}), ("_wanted", {}),
+                        ("_errors", collections.OrderedDict()), ("stats", dict.fromkeys(pdf_worker.stats, 0))):
+        monkeypatch.setattr(pdf_worker, name, value)
+    def render(model):
+        if "gate" in model: model["gate"].wait(5)
+        if "fail" in model: raise ValueError(model["fail"])
+        return model["data"]
+    monkeypatch.setattr(pdf_quote, "create_pro_pdf", render)
+    return pdf_worker
+
+
+def test_lru_keeps_the_recently_used(worker, monkeypatch):
+    monkeypatch.setattr(worker, "MAX_ENTRIES", 2)
+    for key in "abc":
+        worker.request(key, {"data": key.encode() * 10}, "s1")
+        assert worker.result(key, timeout=None) == key.encode() * 10
+        if key == "b": assert worker.result("a") == b"a" * 10 # "a" is now the most recent
+    assert list(worker._cache) == ["a", "c"] and worker._cache_bytes == 20
+    assert worker.stats["evictions"] == 1 and worker.stats["renders"] == 3 and worker.stats["hits"] == 1
+    worker.request("a", {"data": b"x"}, "s2") # cached: no new render
+    assert worker.result("a") == b"a" * 10 and worker.stats["renders"] == 3
+    monkeypatch.setattr(worker, "MAX_BYTES", 25)
+    worker.request("d", {"data": b"d" * 10}, "s1")
+    worker.result("d", timeout=None)
+    assert list(worker._cache) == ["a", "d"] and worker._cache_bytes == 20 # the hit above made "a" recent again
+
+
+def test_failed_render_is_kept_and_not_retried(worker):
+    worker.request("k", {"fail": "no fonts"}, "s1")
+    assert worker.result("k", timeout=None) is None
+    assert isinstance(worker.error("k"), ValueError) and str(worker.error("k")) == "no fonts"
+    worker.request("k", {"data": b"ok"}, "s1")
+    assert "k" not in worker._inflight and worker.result("k") is None
+    assert worker.stats["failures"] == 1 and worker.stats["renders"] == 0 and worker.error("other") is None
+
+
+def test_cancel_drops_queued_renders_nobody_waits_for(worker):
+    gates = [threading.Event() for _ in range(worker.WORKERS)]
+    try:
+        for i, gate in enumerate(gates): worker.request(f"busy{i}", {"gate": gate, "data": b"."}, "s1")
+        worker.request("shared", {"data": b"s"}, "s1")
+        worker.request("shared", {"data": b"s"}, "s2")
+        worker.request("mine", {"data": b"m"}, "s1")
+        worker.cancel("mine", "s1")
+        worker.cancel("shared", "s1")
+        worker.cancel("busy0", "s1") # running: it finishes and is cached anyway
+        worker.cancel("nothing", "s1")
+        assert "mine" not in worker._inflight and "mine" not in worker._wanted
+        assert worker._wanted["shared"] == {"s2"}
+    finally:
+        for gate in gates: gate.set()
+    assert worker.result("shared", timeout=None) == b"s" and worker.result("busy0", timeout=None) == b"."
+    assert worker.result("mine", timeout=None) is None and "mine" not in worker._cache
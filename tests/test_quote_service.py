@@ -0,0 +1,60 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import pdf_quote
+import quote_service
+from catalogs import get_catalog
+
+
+@pytest.mark.parametrize("body", [
+    '{"biz_name": 5}',
+    '{"biz_name": "Caf\u00e9 \u2615"}',
+    '{"rep_name": null}',
+    '{"tax_rate": NaN}',
+    '{"dev_retail": Infinity}',
+    '{"bill_cred": 1' + '0' * 400 + '}',
+    '{"lines": [{"dev_pay": -Infinity}]}',
+    '{"lines": [{"promo_selection": "Custom", "custom_promo_val": NaN}]}',
+])
+def test_normalize_rejects_bad_values(body):
+    with pytest.raises(quote_service.QuoteError):
+        quote_service.normalize(json.loads(body), get_catalog())
+
+
+def test_normalize_fills_defaults():
+    quote = quote_service.normalize({"biz_name": "Acme", "lines": [{}]}, get_catalog())
+    assert quote["rep_name"] == "Sales Rep Name" and quote["lines"][0]["plan"] == "My Biz"
+
+
+class Unpicklable(Exception):
+    # Like fpdf's exceptions: pickles, but can't be rebuilt from its args.
+    def __init__(self, message, font):
+        super().__init__(message)
+
+
+def test_pdf_route_survives_render_errors_and_dead_workers(monkeypatch):
+    create = pdf_quote.create_pro_pdf
+    def flaky(model): # the workers fork from this process, so they see the patch
+        if model["biz_name"] == "boom": raise Unpicklable("can't draw", "helvetica")
+        return create(model)
+    monkeypatch.setattr(pdf_quote, "create_pro_pdf", flaky)
+
+    async def run():
+        service = quote_service.QuoteService(price_workers=1, pdf_workers=1)
+        try:
+            async def post(body):
+                raw = await service.dispatch("POST", "/v1/pdf", json.dumps(body).encode(), False)
+                return int(raw.split(b" ", 2)[1]), raw
+            assert (await post({"biz_name": "Caf\u00e9 \u2615", "lines": [{}]}))[0] == 422
+            status, raw = await post({"biz_name": "boom", "lines": [{}]})
+            assert status == 422 and b"Unpicklable" in raw
+            assert (await post({"biz_name": "Caf\u00e9", "lines": [{}]}))[0] == 200
+            with pytest.raises(quote_service.HttpError) as e: await service._in_pool("pdf_pool", os._exit, 1)
+            assert e.value.status == 503 and service.stats["pool_restarts"] == 1
+            assert (await post({"lines": [{}]}))[0] == 200
+        finally:
+            service.close()
+    asyncio.run(run())
@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+import quote_store
+from line_model import Line
+
+
+def quote(biz="Acme", rep="Dana", n=3, **fields):
+    return {"biz_name": biz, "rep_name": rep, "step": 4, "lines": [Line(plan="My Biz", dev_retail=100.0 * i, **fields) for i in range(n)]}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = quote_store.QuoteStore(str(tmp_path / "quotes.db"))
+    yield store
+    store.close()
+
+
+def test_save_load_round_trip(store):
+    q = dict(quote(), autopay=True)
+    qid = store.save(q, mrc=123.45)
+    saved = store.load(qid)
+    assert saved["step"] == 4 and saved["autopay"] is True
+    assert saved["lines"] == [dict(l) for l in q["lines"]]
+    assert store.save(q, qid, mrc=123.45) == qid and store.stats()["unchanged"] == 1
+    with pytest.raises(KeyError): store.load(qid + 1)
+
+
+def test_save_rewrites_only_changed_lines(store):
+    q = quote(n=4)
+    qid = store.save(q)
+    q["lines"][2]["dev_retail"] = 999.0
+    store.save(q, qid)
+    assert store.stats()["lines_written"] == 4 + 1
+    assert store.load(qid)["lines"][2]["dev_retail"] == 999.0
+    # A fresh store has no snapshot and rebuilds it from the database.
+    again = quote_store.QuoteStore(store.path)
+    q["lines"][0]["dev_retail"] = 5.0
+    again.save(q, qid)
+    assert again.stats()["lines_written"] == 1
+    again.close()
+
+
+def test_save_drops_lines_past_the_new_count(store):
+    q = quote(n=5)
+    qid = store.save(q)
+    del q["lines"][1:]
+    store.save(q, qid)
+    assert len(store.load(qid)["lines"]) == 1
+    assert store.search("acme")[0]["n_lines"] == 1
+
+
+def test_failed_save_keeps_the_previous_version(store):
+    q = quote(n=3)
+    qid = store.save(q, mrc=10.0)
+    store._conn.execute("CREATE TRIGGER no_delete BEFORE DELETE ON lines BEGIN SELECT RAISE(ABORT, 'no'); END")
+    q["lines"][0]["dev_retail"] = 1.0
+    del q["lines"][2]
+    with pytest.raises(sqlite3.IntegrityError): store.save(q, qid, mrc=20.0)
+    saved = store.load(qid)
+    assert len(saved["lines"]) == 3 and saved["lines"][0]["dev_retail"] == 0.0
+    assert store.search()[0]["mrc"] == 10.0
+
+
+def test_search_treats_wildcards_literally(store):
+    for biz in ("100% Fitness", "1000 Cuts", "A_B Labs", "AXB Labs", "C\\D", "Cx"):
+        store.save(quote(biz=biz, n=1))
+    assert [q["biz_name"] for q in store.search("100%")] == ["100% Fitness"]
+    assert [q["biz_name"] for q in store.search("a_b")] == ["A_B Labs"]
+    assert [q["biz_name"] for q in store.search("C\\")] == ["C\\D"]
+    assert len(store.search("", rep="dana")) == 6 and store.search("", rep="x") == []
+
+
+def test_delete(store):
+    kept, qid = store.save(quote(n=1)), store.save(quote())
+    store.delete(qid)
+    with pytest.raises(KeyError): store.load(qid)
+    assert store._conn.execute("SELECT COUNT(*) FROM lines").fetchone()[0] == 1
+    # Saving a deleted quote inserts it again rather than updating nothing.
+    new = store.save(quote(biz="Back"), qid)
+    assert new != kept and store.load(new)["biz_name"] == "Back" and len(store.load(new)["lines"]) == 3
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+
+import tax_rates
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    rows = [(94105, 8.625, "San Francisco"), (501, 8.875, ""), (10001, 8.875, "New York City"), (10001, 4.0, "New York State"),
+            (97201, 0.0, "Portland"), (99999, tax_rates.MAX_RATE, "Top")]
+    path = str(tmp_path / "rates.bin")
+    assert tax_rates.build(rows, path) == len(rows)
+    return path
+
+
+def test_build_then_lookup(table_path):
+    table = tax_rates.TaxTable(table_path)
+    assert len(table) == 6
+    assert table.lookup("10001") == [("New York City", 8.875), ("New York State", 4.0)] # source order, default first
+    assert table.lookup("94105-1420") == [("San Francisco", 8.625)]
+    assert table.lookup(501) == table.lookup("00501") == [("", 8.875)]
+    assert table.rate("10001") == 8.875 and table.rate(94105) == 8.625
+
+
+@pytest.mark.parametrize("zip_code", ["10002", "00000", "99998", "1234", "abcde", "", None, True, 100000])
+def test_missing_zip(table_path, zip_code):
+    table = tax_rates.TaxTable(table_path)
+    assert table.lookup(zip_code) == [] and table.rate(zip_code) is None
+
+
+def test_boundary_rates(table_path):
+    table = tax_rates.TaxTable(table_path)
+    assert table.rate("97201") == 0.0 and table.lookup("97201") == [("Portland", 0.0)]
+    assert table.rate("99999") == tax_rates.MAX_RATE
+    ok = tax_rates.read_csv(io.StringIO(f"zip,rate\n97201,0\n99999,{tax_rates.MAX_RATE}\n"))
+    assert [r[1] for r in ok] == [0.0, tax_rates.MAX_RATE]
+    with pytest.raises(tax_rates.TaxTableError) as e:
+        tax_rates.read_csv(io.StringIO(f"zip,rate\n97201,-0.01\n99999,{tax_rates.MAX_RATE + 0.01}\n1234,5\n10001,x\n"))
+    assert len(e.value.problems) == 4
+
+
+def test_rejects_a_damaged_file(table_path, tmp_path):
+    with open(table_path, "rb") as f: data = f.read()
+    for name, blob in (("short", data[:10]), ("truncated", data[:-1]), ("magic", b"XXXX" + data[4:])):
+        path = tmp_path / name
+        path.write_bytes(blob)
+        with pytest.raises(tax_rates.TaxTableError): tax_rates.TaxTable(str(path))
+
+
+def test_fill_tax_rate(table_path, monkeypatch):
+    monkeypatch.setattr(tax_rates, "TABLE_PATH", table_path)
+    for name, value in (("_current", None), ("_stat", None), ("_checked", -tax_rates.CHECK_INTERVAL), ("last_error", None)):
+        monkeypatch.setattr(tax_rates, name, value)
+    assert tax_rates.fill_tax_rate({"zip": "10001"})["tax_rate"] == 8.875
+    assert tax_rates.fill_tax_rate({"zip": "10001", "tax_rate": 0.0})["tax_rate"] == 0.0
+    with pytest.raises(LookupError): tax_rates.fill_tax_rate({"zip": "10002"})